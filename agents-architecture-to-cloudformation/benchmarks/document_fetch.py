@@ -0,0 +1,132 @@
+"""
+Benchmark of the knowledge base document downloads of retrieve_yaml: the
+previous sequential get_object loop against util/agent/document_fetch.py.
+
+Every retrieval asks for three example documents of the corpus, chosen at
+random (--seed), as the knowledge base does for every session. Each S3
+request sleeps --rtt milliseconds to model the network round trip, plus
+--transfer milliseconds per KB of body sent, so latency reflects sequential
+requests and downloaded bytes. The fetcher is run once with documents kept
+fresh for DocumentFreshSeconds and once revalidating every document with a
+conditional GET
+(fresh 0 s).
+
+Usage:
+
+python benchmarks/document_fetch.py
+python benchmarks/document_fetch.py --rtt 15 --retrievals 50
+"""
+
+from argparse import ArgumentParser
+
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+from document_fetch import DOCUMENT_FRESH_SECONDS, DocumentFetcher
+
+
+def legacy_fetch(s3, locations):
+    """
+    The previous download loop of retrieve_yaml.
+    """
+    documents = list()
+    for bucket, key in locations:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        documents.append(response["Body"].read().decode("utf-8"))
+    return documents
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=10.0, help="milliseconds")
+    parser.add_argument(
+        "--transfer", type=float, default=0.2, help="milliseconds per KB"
+    )
+    parser.add_argument("--retrievals", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from botocore.config import Config
+    from moto import mock_aws
+    import boto3
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        s3 = boto3.client(
+            "s3",
+            region_name=stand_ins.REGION,
+            config=Config(max_pool_connections=8),
+        )
+        counters = {"requests": 0, "bytes": 0}
+
+        def round_trip(**kwargs):
+            counters["requests"] += 1
+            time.sleep(args.rtt / 1000)
+
+        def transfer(http_response, parsed, **kwargs):
+            if http_response.status_code == 200:
+                size = int(http_response.headers.get("Content-Length", 0))
+                counters["bytes"] += size
+                time.sleep(size / 1024 * args.transfer / 1000)
+
+        s3.meta.events.register("before-call.s3.GetObject", round_trip)
+        s3.meta.events.register("after-call.s3.GetObject", transfer)
+
+        keys = sorted(stand_ins.ingest_templates())
+        rng = random.Random(args.seed)
+        retrievals = [
+            [(stand_ins.BUCKET_NAME, f"data/{key}") for key in rng.sample(keys, 3)]
+            for _ in range(args.retrievals)
+        ]
+
+        paths = (
+            ("sequential get_object", lambda locations: legacy_fetch(s3, locations)),
+            (
+                f"fetcher (fresh {DOCUMENT_FRESH_SECONDS:.0f}s)",
+                DocumentFetcher(get_client=lambda: s3).fetch_all,
+            ),
+            (
+                "fetcher (fresh 0s, conditional GET)",
+                DocumentFetcher(get_client=lambda: s3, fresh_seconds=0).fetch_all,
+            ),
+        )
+
+        print(
+            f"S3 document fetch (rtt {args.rtt:.1f} ms, {args.transfer:.1f} ms/KB, "
+            f"{args.retrievals} retrievals of 3 documents)"
+        )
+        print(
+            f"{'path':<38}{'first ms':>10}{'mean ms':>10}{'p90 ms':>9}"
+            f"{'GETs':>7}{'KB down':>10}"
+        )
+        expected = None
+        for name, fetch in paths:
+            counters.update(requests=0, bytes=0)
+            timings, results = list(), list()
+            for locations in retrievals:
+                start = time.perf_counter()
+                results.append(fetch(locations))
+                timings.append((time.perf_counter() - start) * 1000)
+
+            expected = expected or results
+            assert results == expected, f"{name} returned different documents"
+            ordered = sorted(timings)
+            print(
+                f"{name:<38}{timings[0]:>10.1f}{statistics.mean(timings):>10.1f}"
+                f"{ordered[int(len(ordered) * 0.9)]:>9.1f}"
+                f"{counters['requests']:>7}{counters['bytes'] / 1024:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
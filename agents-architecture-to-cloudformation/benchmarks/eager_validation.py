@@ -0,0 +1,139 @@
+"""
+Benchmark of eager validation: templates validated by stream_handler from the
+template table stream while the agent plans its next action, against the
+validate action validating in series.
+
+Agent turns (generate, reiterate, validate, resolve, validate) run through
+the stand-ins with --think seconds before each action, the time the agent's
+model takes to pick it. The serial path runs them with EagerValidation
+disabled. The eager path enables it, and StandInTableStream delivers every
+new "v0" head, --lag seconds after the write, to the stream_handler of a
+second copy of the Lambda module (the validation function).
+
+Validation runs the local validator and, unless --local, the
+ValidateTemplate call served by moto, which lints with cfn-lint, so the
+serial path pays a remote stage of realistic length.
+
+Usage:
+
+python benchmarks/eager_validation.py
+python benchmarks/eager_validation.py --turns 5 --think 2 --lag 0.5
+python benchmarks/eager_validation.py --local
+"""
+
+from argparse import ArgumentParser
+
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+
+class ThreadOutput(io.TextIOBase):
+    """
+    sys.stdout replacement keeping the output of the capturing thread only, so
+    the logs of the stream consumer thread are dropped.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        return self._local.buffer
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return buffer.write(text) if buffer is not None else len(text)
+
+
+def run(module, turns, think, prefix, output):
+    """
+    Runs agent turns and returns the validate action latencies, the number
+    served from the stream result and the mean turn time.
+    """
+    validate_seconds, precomputed, turn_seconds = list(), 0, list()
+    for turn in range(turns):
+        turn_start = time.perf_counter()
+        for event in stand_ins.agent_turn(
+            f"{prefix}-{turn}", "A Lambda function writing objects to Amazon S3"
+        ):
+            time.sleep(think)
+            captured = output.capture()
+            start = time.perf_counter()
+            response = module.lambda_handler(event, None)
+            seconds = time.perf_counter() - start
+            if response["response"]["httpStatusCode"] != 200:
+                raise RuntimeError(f"{event['apiPath']} failed: {response}")
+            if event["apiPath"] == "/validateCloudFormation":
+                validate_seconds.append(seconds)
+                precomputed += "(validated on write)" in captured.getvalue()
+        turn_seconds.append(time.perf_counter() - turn_start)
+    return validate_seconds, precomputed, statistics.mean(turn_seconds)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--think", type=float, default=1.0, help="seconds")
+    parser.add_argument("--lag", type=float, default=0.2, help="seconds")
+    parser.add_argument("--bedrock-latency", type=float, default=0.5, help="seconds")
+    parser.add_argument(
+        "--local", action="store_true", help="local validation only, no remote stage"
+    )
+    args = parser.parse_args()
+
+    os.environ["RemoteValidation"] = "false" if args.local else "true"
+    module = stand_ins.load_lambda()
+    resources = stand_ins.install_stand_ins(
+        module, bedrock_latency=args.bedrock_latency
+    )
+    validation_module = stand_ins.load_lambda("lambda_validation")
+    output = ThreadOutput()
+
+    try:
+        print(
+            f"Eager validation ({args.turns} turns, think {args.think:.1f} s, "
+            f"stream lag {args.lag:.1f} s, "
+            f"{'local validation' if args.local else 'local + remote validation'})"
+        )
+        print(
+            f"{'path':<8}{'validate mean ms':>18}{'validate max ms':>17}"
+            f"{'from stream':>13}{'turn s':>9}"
+        )
+        for path in ("serial", "eager"):
+            module.EagerValidation = path == "eager"
+            stream = None
+            if path == "eager":
+                stream = stand_ins.StandInTableStream(
+                    module.get_table().meta.client,
+                    validation_module.stream_handler,
+                    lag=args.lag,
+                )
+            sys.stdout = output
+            try:
+                validate_seconds, precomputed, turn_seconds = run(
+                    module, args.turns, args.think, path, output
+                )
+                if stream is not None:
+                    stream.close()
+            finally:
+                sys.stdout = sys.__stdout__
+            print(
+                f"{path:<8}{statistics.mean(validate_seconds) * 1000:>18.1f}"
+                f"{max(validate_seconds) * 1000:>17.1f}"
+                f"{f'{precomputed}/{len(validate_seconds)}':>13}{turn_seconds:>9.2f}"
+            )
+    finally:
+        resources["mock"].stop()
+
+
+if __name__ == "__main__":
+    main()
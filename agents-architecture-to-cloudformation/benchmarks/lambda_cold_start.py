@@ -0,0 +1,92 @@
+"""
+Cold-start benchmark for the action-group Lambda.
+
+Every run starts a fresh interpreter (a cold container), imports
+util/agent/lambda.py, then plays one generate agent turn through
+lambda_handler against the local stand-ins in benchmarks/stand_ins.py.
+
+Usage:
+
+python benchmarks/lambda_cold_start.py --runs 10
+"""
+
+from argparse import ArgumentParser
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def cold_start():
+    """
+    Runs one cold start in the current interpreter and returns its timings in ms.
+    """
+    sys.path.insert(0, BENCHMARK_DIR)
+    import stand_ins
+
+    start = time.perf_counter()
+    lambda_module = stand_ins.load_lambda()
+    init_ms = (time.perf_counter() - start) * 1000
+
+    stand_ins.install_stand_ins(lambda_module)
+    explanation = next(iter(stand_ins.ingest_templates().values()))[:1000]
+
+    timings = {"init": init_ms}
+    for event in stand_ins.agent_turn("cold-start-session", explanation):
+        start = time.perf_counter()
+        response = lambda_module.lambda_handler(event, None)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        status = response["response"]["httpStatusCode"]
+        if status != 200:
+            raise RuntimeError(f"{event['apiPath']} returned {status}: {response}")
+
+        name = event["apiPath"].strip("/")
+        if name in timings:
+            name = f"{name}#2"
+        timings[name] = elapsed
+
+    return timings
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--child",
+        action="store_true",
+        help="run a single cold start and print its timings as JSON",
+    )
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(cold_start()))
+        return
+
+    runs = list()
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, os.path.realpath(__file__), "--child"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"Lambda cold start over {args.runs} fresh interpreters (ms)")
+    print(f"{'phase':<32}{'median':>10}{'min':>10}{'max':>10}")
+    for phase in runs[0]:
+        values = [run[phase] for run in runs]
+        print(
+            f"{phase:<32}{statistics.median(values):>10.1f}"
+            f"{min(values):>10.1f}{max(values):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
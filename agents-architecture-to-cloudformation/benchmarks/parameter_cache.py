@@ -0,0 +1,114 @@
+"""
+Benchmark of the SSM parameter reads of BedrockAgent and KnowledgeBase on
+every Streamlit rerun: the previous GetParameter call per parameter, each on a
+new boto3 client, against the process-wide ParameterCache of
+util/invoke/parameter_cache.py.
+
+--reruns reruns read AGENT_ID, AGENT_ALIAS_ID, KNOWLEDGEBASEID and
+TEMPLATE_BUCKET from the moto SSM parameters of the stand-ins, --interval
+seconds apart. Each SSM request sleeps --rtt milliseconds. The cache is
+built with a --ttl seconds TTL, so the parameters are refreshed in the
+background while the reruns are served.
+
+Usage:
+
+python benchmarks/parameter_cache.py
+python benchmarks/parameter_cache.py --reruns 200 --ttl 0.5 --interval 0.01
+"""
+
+from argparse import ArgumentParser
+
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.APP_DIR)
+
+PARAMETERS = ("AGENT_ID", "AGENT_ALIAS_ID", "KNOWLEDGEBASEID", "TEMPLATE_BUCKET")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds")
+    parser.add_argument("--ttl", type=float, default=0.25, help="seconds")
+    parser.add_argument("--rtt", type=float, default=10.0, help="milliseconds")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", stand_ins.REGION)
+
+    from boto3.session import Session
+    from moto import mock_aws
+
+    from util.invoke.parameter_cache import ParameterCache
+
+    requests = {"count": 0}
+
+    def round_trip(**kwargs):
+        requests["count"] += 1
+        time.sleep(args.rtt / 1000)
+
+    def client():
+        ssm = Session().client("ssm")
+        ssm.meta.events.register("before-call.ssm.*", round_trip)
+        return ssm
+
+    with mock_aws():
+        ssm = client()
+        for name in PARAMETERS:
+            ssm.put_parameter(
+                Name=f"/streamlitapp/{stand_ins.ENVIRONMENT_NAME}/{name}",
+                Value=f"{name.lower()}-value",
+                Type="String",
+            )
+
+        def previous():
+            return {
+                name: client().get_parameter(
+                    Name=f"/streamlitapp/{stand_ins.ENVIRONMENT_NAME}/{name}",
+                    WithDecryption=False,
+                )["Parameter"]["Value"]
+                for name in PARAMETERS
+            }
+
+        shared = client()
+        parameters = ParameterCache(get_ssm=lambda: shared, ttl=args.ttl)
+
+        def cached():
+            return {
+                name: parameters.get(stand_ins.ENVIRONMENT_NAME, name)
+                for name in PARAMETERS
+            }
+
+        print(
+            f"SSM parameters per rerun ({args.reruns} reruns, {len(PARAMETERS)} "
+            f"parameters, rtt {args.rtt:.1f} ms, TTL {args.ttl:.2f} s)"
+        )
+        print(
+            f"{'path':<10}{'mean ms':>10}{'p95 ms':>9}{'max ms':>9}{'SSM requests':>14}"
+        )
+        for path, read in (("previous", previous), ("cached", cached)):
+            requests["count"] = 0
+            seconds = list()
+            for _ in range(args.reruns):
+                start = time.perf_counter()
+                assert read()["AGENT_ID"] == "agent_id-value"
+                seconds.append(time.perf_counter() - start)
+                time.sleep(args.interval)
+            seconds.sort()
+            print(
+                f"{path:<10}{statistics.mean(seconds) * 1000:>10.2f}"
+                f"{seconds[int(len(seconds) * 0.95)] * 1000:>9.2f}"
+                f"{seconds[-1] * 1000:>9.2f}{requests['count']:>14}"
+            )
+        print(f"\ncache {parameters.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Checks the prompt cache layout of the action-group Lambda.
+
+Plays two update turns of one session against the Bedrock stand-in, which
+rejects misplaced cachePoint blocks, once with a model that supports prompt
+caching and once with one that does not, and prints the cached token counts.
+
+Usage:
+
+python benchmarks/prompt_cache_layout.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import stand_ins
+
+MODELS = (
+    "us.anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-3-sonnet-20240229-v1:0",
+)
+
+
+def main():
+    lambda_module = stand_ins.load_lambda()
+    services = stand_ins.install_stand_ins(lambda_module)
+    explanation = next(iter(stand_ins.ingest_templates().values()))[:1000]
+
+    print(f"{'model':<48}{'action':<26}{'read':>8}{'write':>8}{'input':>8}")
+    for modelId in MODELS:
+        lambda_module.BedrockModelId = modelId
+        sessionId = f"layout-{modelId}"
+        events = [
+            stand_ins.make_event(
+                "/generateCloudFormation",
+                sessionId=sessionId,
+                architectureExplanation=explanation,
+            )
+        ] + [
+            stand_ins.make_event(
+                "/updateCloudFormation",
+                sessionId=sessionId,
+                updateInstruction=instruction,
+            )
+            for instruction in ("Enable bucket versioning.", "Add a DLQ.")
+        ]
+
+        for event in events:
+            calls = len(services["bedrock"].calls)
+            before = dict(lambda_module.cache_usage)
+            response = lambda_module.lambda_handler(event, None)
+            if response["response"]["httpStatusCode"] != 200:
+                raise RuntimeError(response)
+
+            for call in services["bedrock"].calls[calls:]:
+                has_cache_point = any("cachePoint" in block for block in call["system"])
+                if has_cache_point != lambda_module.supports_prompt_cache(modelId):
+                    raise RuntimeError(f"Unexpected cachePoint layout for {modelId}")
+
+            usage = {
+                key: value - before[key]
+                for key, value in lambda_module.cache_usage.items()
+            }
+            print(
+                f"{modelId:<48}{event['apiPath']:<26}"
+                f"{usage['cacheReadInputTokens']:>8}"
+                f"{usage['cacheWriteInputTokens']:>8}{usage['inputTokens']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
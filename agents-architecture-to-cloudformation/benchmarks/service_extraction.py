@@ -0,0 +1,192 @@
+"""
+Accuracy and latency of the local AWS service extractor of get_summary_document
+(util/agent/service_extractor.py) on the knowledge base explanations
+data/ingest/*/exampleN.txt.
+
+REFERENCE lists the AWS services each explanation names, labelled by hand.
+Services only implied (e.g. EC2 behind "web tier instances") are not listed.
+Precision, recall and F1 are computed per explanation and over the corpus.
+
+The previous path asked the model to list the services. With --model the
+same prompt is sent to Amazon Bedrock (credentials required) and the answer,
+normalized to the dictionary names with the extractor, is scored as well.
+
+Usage:
+
+python benchmarks/service_extraction.py
+python benchmarks/service_extraction.py --model anthropic.claude-3-haiku-20240307-v1:0
+"""
+
+from argparse import ArgumentParser
+
+import glob
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+from service_extractor import extract_services, get_automaton
+
+REFERENCE = {
+    "AWS Step Functions/example1.txt": [
+        "AWS Lambda",
+        "AWS Step Functions",
+        "Amazon S3",
+    ],
+    "AWS Step Functions/example2.txt": [
+        "AWS Step Functions",
+        "AWS Lambda",
+        "Amazon DynamoDB",
+    ],
+    "AWS Step Functions/example3.txt": [
+        "AWS Step Functions",
+        "AWS Lambda",
+        "Amazon Bedrock",
+        "Amazon S3",
+    ],
+    "Amazon Bedrock/example1.txt": ["AWS Lambda", "Amazon Bedrock"],
+    "Amazon Bedrock/example2.txt": [
+        "Agents for Amazon Bedrock",
+        "Amazon S3",
+        "AWS Lambda",
+        "Amazon DynamoDB",
+    ],
+    "Amazon VPC/example1.txt": ["Amazon VPC", "NAT Gateway", "Internet Gateway"],
+    "Amazon VPC/example2.txt": [
+        "Amazon VPC",
+        "NAT Gateway",
+        "Application Load Balancer",
+        "Internet Gateway",
+        "AWS Auto Scaling",
+    ],
+    "Amazon VPC/example3.txt": [
+        "Amazon CloudFront",
+        "Application Load Balancer",
+        "Amazon ECS",
+        "AWS Fargate",
+        "AWS Auto Scaling",
+    ],
+    "Event-Driven/example1.txt": ["Amazon S3", "AWS Lambda", "Amazon DynamoDB"],
+    "Event-Driven/example2.txt": [
+        "Amazon DynamoDB",
+        "Amazon DynamoDB Streams",
+        "AWS Lambda",
+        "Amazon CloudWatch Logs",
+    ],
+    "Event-Driven/example3.txt": ["Amazon S3", "AWS Lambda", "Amazon SNS"],
+}
+
+
+def model_services(modelId, explanation):
+    """
+    Asks the model for the services the way get_summary_document did, and
+    normalizes its answer to dictionary names.
+
+    Returns:
+        tuple: The services and the seconds the call took.
+    """
+    import boto3
+
+    start = time.perf_counter()
+    response = boto3.client("bedrock-runtime").converse(
+        modelId=modelId,
+        system=[
+            {
+                "text": "List all the AWS Services in the document. Do output anything else."
+            }
+        ],
+        messages=[
+            {
+                "role": "user",
+                "content": [{"text": f"<document>\n{explanation}\n</document>"}],
+            }
+        ],
+        inferenceConfig={"temperature": 0.2, "maxTokens": 4000},
+    )
+    seconds = time.perf_counter() - start
+    answer = response["output"]["message"]["content"][0]["text"]
+    return extract_services(answer), seconds
+
+
+def score(found, expected):
+    """
+    Returns the true positives, precision and recall of found against expected.
+    """
+    hits = len(set(found) & set(expected))
+    precision = hits / len(found) if found else 0.0
+    recall = hits / len(expected) if expected else 1.0
+    return hits, precision, recall
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--model", help="also score this Amazon Bedrock model")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    get_automaton()
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    paths = {"extractor": dict()}
+    if args.model:
+        paths[args.model] = dict()
+
+    print(
+        f"Service extraction on data/ingest (automaton compiled in {compile_ms:.1f} ms)"
+    )
+    print(f"{'explanation':<34}{'path':<12}{'P':>6}{'R':>6}{'ms':>10}  missed / extra")
+    for path in sorted(
+        glob.glob(os.path.join(stand_ins.INGEST_DIR, "*", "example*.txt"))
+    ):
+        name = os.path.relpath(path, stand_ins.INGEST_DIR).replace(os.sep, "/")
+        with open(path, "r") as f:
+            explanation = f.read()
+        expected = REFERENCE[name]
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            found = extract_services(explanation)
+        seconds = (time.perf_counter() - start) / args.repeat
+        results = [("extractor", found, seconds)]
+
+        if args.model:
+            found, seconds = model_services(args.model, explanation)
+            results.append((args.model, found, seconds))
+
+        for label, found, seconds in results:
+            hits, precision, recall = score(found, expected)
+            totals = paths[label]
+            totals["hits"] = totals.get("hits", 0) + hits
+            totals["found"] = totals.get("found", 0) + len(found)
+            totals["expected"] = totals.get("expected", 0) + len(expected)
+            totals.setdefault("seconds", []).append(seconds)
+            missed = [s for s in expected if s not in found]
+            extra = [s for s in found if s not in expected]
+            print(
+                f"{name:<34}{label[:11]:<12}{precision:>6.2f}{recall:>6.2f}{seconds * 1000:>10.3f}"
+                f"  {', '.join(missed) or '-'} / {', '.join(extra) or '-'}"
+            )
+
+    print()
+    for label, totals in paths.items():
+        precision = totals["hits"] / totals["found"] if totals["found"] else 0.0
+        recall = totals["hits"] / totals["expected"]
+        f1 = (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        )
+        print(
+            f"{label}: precision {precision:.3f} recall {recall:.3f} F1 {f1:.3f}, "
+            f"median latency {statistics.median(totals['seconds']) * 1000:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
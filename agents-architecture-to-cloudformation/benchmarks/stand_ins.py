@@ -0,0 +1,421 @@
+"""
+Local stand-ins for the AWS services used by the action-group Lambda.
+
+DynamoDB, Amazon S3 and AWS CloudFormation are served by moto, Amazon Bedrock
+and the knowledge base retrieve API are replaced by canned responders. This
+lets the benchmarks import and run util/agent/lambda.py without AWS access.
+
+StandInTableStream simulates the template table stream and its event source
+mapping: the items written through a client are read back after every
+successful write and delivered, filtered and batched, to a stream handler
+after a delay.
+
+Usage:
+
+lambda_module = load_lambda()
+stand_ins = install_stand_ins(lambda_module)
+lambda_module.lambda_handler(make_event("/generateCloudFormation", ...), None)
+
+stream = StandInTableStream(lambda_module.get_table().meta.client, handler)
+stream.close()
+"""
+
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+AGENT_DIR = os.path.join(APP_DIR, "util", "agent")
+PROMPT_DIR = os.path.join(APP_DIR, "util", "prompt_templates")
+INGEST_DIR = os.path.join(APP_DIR, "data", "ingest")
+
+ENVIRONMENT_NAME = "bench"
+BUCKET_NAME = "datasource-bench"
+REGION = "us-east-1"
+
+
+def ingest_templates():
+    """
+    Returns the example CloudFormation templates shipped with the knowledge base.
+
+    Returns:
+        dict: Mapping of "<domain>/<file>" to the template body.
+    """
+    templates = dict()
+    for domain in sorted(os.listdir(INGEST_DIR)):
+        domain_path = os.path.join(INGEST_DIR, domain)
+        if not os.path.isdir(domain_path):
+            continue
+        for domain_file in sorted(os.listdir(domain_path)):
+            if domain_file.endswith(".yaml"):
+                with open(os.path.join(domain_path, domain_file), "r") as f:
+                    templates[f"{domain}/{domain_file}"] = f.read()
+    return templates
+
+
+def load_lambda(module_name="lambda_function"):
+    """
+    Imports util/agent/lambda.py the way the Lambda runtime does, with the prompt
+    templates and sibling modules importable as top-level modules.
+
+    Returns:
+        module: The imported Lambda module.
+    """
+    os.environ.setdefault("KnowledgeBaseId", "BENCHKB")
+    os.environ.setdefault("EnvironmentName", ENVIRONMENT_NAME)
+    os.environ.setdefault("BedrockModelId", "anthropic.claude-3-sonnet-20240229-v1:0")
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    for path in (PROMPT_DIR, AGENT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(AGENT_DIR, "lambda.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class _Exceptions:
+    class ThrottlingException(Exception):
+        pass
+
+    class ValidationException(Exception):
+        pass
+
+
+class StandInBedrockRuntime:
+    """
+    Canned Amazon Bedrock runtime client.
+
+    Every converse call sleeps for `latency` seconds and answers with one of the
+    knowledge base templates, or a service list for the summary prompt. Like
+    Amazon Bedrock it rejects cachePoint blocks for models in `no_cache_models`
+    and reports cache reads and writes for prefixes ending in a cachePoint.
+    """
+
+    exceptions = _Exceptions
+
+    def __init__(
+        self,
+        templates,
+        latency=0.0,
+        output_tokens_per_second=None,
+        no_cache_models=("anthropic.claude-3-sonnet-20240229-v1:0",),
+    ):
+        self._templates = list(templates.values())
+        self._latency = latency
+        self._output_tokens_per_second = output_tokens_per_second
+        self._no_cache_models = no_cache_models
+        self._cached_prefixes = set()
+        self.calls = list()
+
+    def _cache_usage(self, modelId, system, messages):
+        blocks = list(system) + [
+            block for message in messages for block in message["content"]
+        ]
+        cache_points = [
+            idx for idx, block in enumerate(blocks) if "cachePoint" in block
+        ]
+        if not cache_points:
+            return 0, 0
+        if modelId in self._no_cache_models:
+            raise self.exceptions.ValidationException(
+                f"{modelId} does not support prompt caching"
+            )
+        if cache_points[0] == 0:
+            raise self.exceptions.ValidationException("cachePoint without prefix")
+
+        prefix = repr(blocks[: cache_points[-1]])
+        prefix_tokens = (
+            sum(len(block.get("text", "")) for block in blocks[: cache_points[-1]]) // 4
+        )
+        if prefix in self._cached_prefixes:
+            return prefix_tokens, 0
+        self._cached_prefixes.add(prefix)
+        return 0, prefix_tokens
+
+    def _answer(self, system, messages):
+        system_text = " ".join(block.get("text", "") for block in system)
+        if "List all the AWS Services" in system_text:
+            return "Amazon VPC, Amazon S3, AWS Lambda, Amazon DynamoDB"
+        prompt = messages[-1]["content"][-1].get("text", "")
+        if "Output only the edits" in prompt:
+            return '```json\n[{"op": "add", "path": "Outputs/PatchedBy", "content": "PatchedBy:\\n  Value: stand-in"}]\n```'
+        template = self._templates[len(self.calls) % len(self._templates)]
+        return f"```yaml\n{template}\n```"
+
+    def converse(self, modelId, messages, system, inferenceConfig, **kwargs):
+        cache_read, cache_write = self._cache_usage(modelId, system, messages)
+        text = self._answer(system, messages)
+        output_tokens = len(text) // 4
+        delay = self._latency
+        if self._output_tokens_per_second:
+            delay += output_tokens / self._output_tokens_per_second
+        time.sleep(delay)
+        self.calls.append(
+            {"modelId": modelId, "messages": messages, "system": system, **kwargs}
+        )
+        blocks = list(system) + [
+            block for message in messages for block in message["content"]
+        ]
+        input_tokens = (
+            sum(len(block.get("text", "")) for block in blocks) // 4
+            - cache_read
+            - cache_write
+        )
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+            "usage": {
+                "inputTokens": input_tokens,
+                "outputTokens": output_tokens,
+                "totalTokens": input_tokens + output_tokens + cache_read + cache_write,
+                "cacheReadInputTokens": cache_read,
+                "cacheWriteInputTokens": cache_write,
+            },
+            "stopReason": "end_turn",
+        }
+
+
+class StandInAgentRuntime:
+    """
+    Canned knowledge base retrieve API returning the first ingested examples.
+    """
+
+    def __init__(self, templates, latency=0.0):
+        self._keys = list(templates.keys())
+        self._latency = latency
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId, retrievalConfiguration):
+        time.sleep(self._latency)
+        number_of_results = retrievalConfiguration["vectorSearchConfiguration"][
+            "numberOfResults"
+        ]
+        return {
+            "retrievalResults": [
+                {
+                    "metadata": {
+                        "cfn_stack": f"s3://{BUCKET_NAME}/data/{key}",
+                        "architecture_image": f"s3://{BUCKET_NAME}/data/{key}.png",
+                    }
+                }
+                for key in self._keys[:number_of_results]
+            ]
+        }
+
+
+class StandInTableStream:
+    """
+    DynamoDB table stream (NEW_IMAGE) and event source mapping of the template table.
+
+    Writes through `client` are followed by a read of every written key; the
+    new images matching the filter of the validation event source mapping
+    ("v0" heads with is_valid NULL) are handed to `handler` in batches of up to
+    `batch_size` records, `lag` seconds after the write, by a consumer thread.
+    """
+
+    WRITES = ("PutItem", "UpdateItem", "TransactWriteItems")
+    _STOP = object()
+
+    def __init__(self, client, handler, lag=0.2, batch_size=10):
+        import boto3
+
+        self._handler = handler
+        self._lag = lag
+        self._batch_size = batch_size
+        self._reader = boto3.client("dynamodb", region_name=REGION)
+        self._records = queue.Queue()
+        self._pending = dict()
+        self.delivered = 0
+        self.batches = 0
+
+        for operation in self.WRITES:
+            client.meta.events.register(
+                f"before-call.dynamodb.{operation}", self._before_write
+            )
+            client.meta.events.register(
+                f"after-call.dynamodb.{operation}", self._after_write
+            )
+        self._consumer = threading.Thread(target=self._consume, daemon=True)
+        self._consumer.start()
+
+    def _before_write(self, params, context, **kwargs):
+        body = json.loads(params["body"])
+        if "TransactItems" in body:
+            writes = [next(iter(item.values())) for item in body["TransactItems"]]
+        else:
+            writes = [body]
+        context["stream_keys"] = [
+            (
+                write["TableName"],
+                write.get("Key")
+                or {name: write["Item"][name] for name in ("sessionId", "version")},
+            )
+            for write in writes
+        ]
+
+    def _after_write(self, http_response, context, **kwargs):
+        if http_response.status_code != 200:
+            return
+        for table_name, key in context.get("stream_keys", []):
+            image = self._reader.get_item(
+                TableName=table_name, Key=key, ConsistentRead=True
+            ).get("Item")
+            if image is None or key["version"] != {"S": "v0"}:
+                continue
+            if image.get("is_valid") != {"NULL": True}:
+                continue
+            self._records.put(
+                (
+                    time.monotonic() + self._lag,
+                    {
+                        "eventName": "MODIFY",
+                        "eventSource": "aws:dynamodb",
+                        "dynamodb": {
+                            "Keys": key,
+                            "NewImage": image,
+                            "StreamViewType": "NEW_IMAGE",
+                        },
+                    },
+                )
+            )
+
+    def _consume(self):
+        held = None
+        while True:
+            entry = held if held is not None else self._records.get()
+            held = None
+            if entry is self._STOP:
+                return
+            due, record = entry
+            time.sleep(max(0.0, due - time.monotonic()))
+            # Records due by now are delivered in the same batch
+            batch = [record]
+            while len(batch) < self._batch_size:
+                try:
+                    entry = self._records.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is self._STOP or entry[0] > time.monotonic():
+                    held = entry
+                    break
+                batch.append(entry[1])
+            self._handler({"Records": batch}, None)
+            self.delivered += len(batch)
+            self.batches += 1
+
+    def close(self):
+        """
+        Stops the consumer after the records already written are delivered.
+        """
+        self._records.put(self._STOP)
+        self._consumer.join()
+
+
+def create_aws_resources():
+    """
+    Creates the template table and knowledge base bucket inside the active moto mock.
+    """
+    import boto3
+
+    dynamodb = boto3.client("dynamodb", region_name=REGION)
+    dynamodb.create_table(
+        TableName=f"templatestorage-atc-{ENVIRONMENT_NAME}",
+        AttributeDefinitions=[
+            {"AttributeName": "sessionId", "AttributeType": "S"},
+            {"AttributeName": "version", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "sessionId", "KeyType": "HASH"},
+            {"AttributeName": "version", "KeyType": "RANGE"},
+        ],
+        ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
+    )
+
+    s3 = boto3.client("s3", region_name=REGION)
+    s3.create_bucket(Bucket=BUCKET_NAME)
+    for key, body in ingest_templates().items():
+        s3.put_object(Bucket=BUCKET_NAME, Key=f"data/{key}", Body=body.encode())
+
+
+def install_stand_ins(module, bedrock_latency=0.0, retrieve_latency=0.0):
+    """
+    Starts the moto mock and points the Lambda module's lazy clients at stand-ins.
+
+    Args:
+        module (module): The module returned by load_lambda().
+        bedrock_latency (float): Seconds each Bedrock call sleeps.
+        retrieve_latency (float): Seconds each knowledge base retrieve sleeps.
+
+    Returns:
+        dict: The started mock and the Bedrock stand-ins.
+    """
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    create_aws_resources()
+
+    templates = ingest_templates()
+    bedrock = StandInBedrockRuntime(templates, latency=bedrock_latency)
+    bedrock_agent = StandInAgentRuntime(templates, latency=retrieve_latency)
+
+    module.get_bedrock = lambda: bedrock
+    module.get_bedrock_agent = lambda: bedrock_agent
+
+    return {"mock": mock, "bedrock": bedrock, "bedrock_agent": bedrock_agent}
+
+
+def make_event(api_path, sessionId=None, validate_counter="0", **parameters):
+    """
+    Builds an action group event as sent by Amazon Bedrock Agents.
+
+    Returns:
+        dict: The Lambda event.
+    """
+    return {
+        "messageVersion": "1.0",
+        "actionGroup": "CloudFormationGenerationAPI",
+        "apiPath": api_path,
+        "httpMethod": "GET",
+        "sessionId": sessionId or str(uuid.uuid1()),
+        "parameters": [
+            {"name": name, "type": "string", "value": value}
+            for name, value in parameters.items()
+        ],
+        "sessionAttributes": {"validate_counter": validate_counter},
+    }
+
+
+def agent_turn(sessionId, architectureExplanation):
+    """
+    Returns the sequence of action events of one "generate" agent turn.
+    """
+    return [
+        make_event(
+            "/generateCloudFormation",
+            sessionId=sessionId,
+            architectureExplanation=architectureExplanation,
+        ),
+        make_event("/reiterateCloudFormation", sessionId=sessionId),
+        make_event("/validateCloudFormation", sessionId=sessionId),
+        make_event(
+            "/resolveCloudFormation",
+            sessionId=sessionId,
+            validate_counter="1",
+            cloudformationInstruction="Resolve the validation error.",
+        ),
+        make_event(
+            "/validateCloudFormation", sessionId=sessionId, validate_counter="1"
+        ),
+    ]
@@ -0,0 +1,227 @@
+"""
+Benchmark of content-addressed template versions: the previous layout, where
+the "v0" head and every version item hold a full copy of their body, against
+the "body#<hash>" items, "v0" pointer and version references of
+util/agent/template_store.py.
+
+--sessions sessions start from a knowledge base example template and save it
+--saves more times, as the reiterate, resolve and update actions do: with
+probability --unchanged the template comes back unchanged, else with one more
+resource. Both layouts write gzip bodies (TemplateCodec without a bucket)
+into the moto table of the stand-ins.
+
+Write capacity units follow the DynamoDB item size rules: one WCU per started
+KB of each written item (the larger of its sizes before and after an update),
+twice that inside the transaction every save of both layouts is. A save that
+references the head's body again still updates the expiry of its body item,
+billed on the item's size. Stored KB and items are those of the session items
+left in the table.
+
+Usage:
+
+python benchmarks/template_dedup.py
+python benchmarks/template_dedup.py --sessions 50 --saves 8 --unchanged 0.3
+"""
+
+from argparse import ArgumentParser
+
+from contextlib import redirect_stdout
+
+import copy
+import datetime
+import io
+import math
+import os
+import random
+import statistics
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+import yaml
+
+from cfn_validator import parse_template
+from template_store import (
+    BODY_PREFIX,
+    DEFAULT_CODEC,
+    template_hash,
+    write_template_version,
+)
+from template_writes import item_size
+
+
+def extend(document, name):
+    """
+    Returns a copy of the template with one more SNS topic.
+    """
+    document = copy.deepcopy(document)
+    document["Resources"][f"AlarmTopic{name}"] = {
+        "Type": "AWS::SNS::Topic",
+        "Properties": {"TopicName": f"alarms-{name}"},
+    }
+    return document
+
+
+def copy_write(table, sessionId, template, latest):
+    """
+    The previous layout: the "v0" head and a version item, both with the full body.
+    """
+    attributes = DEFAULT_CODEC.encode(template)
+    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
+    ttl = str(
+        int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
+    )
+    names = {f"#{name}": name for name in attributes}
+    values = {f":{name}": value for name, value in attributes.items()}
+    table.meta.client.transact_write_items(
+        TransactItems=[
+            {
+                "Put": {
+                    "TableName": table.name,
+                    "Item": {
+                        "sessionId": sessionId,
+                        "version": f"v{latest + 1}",
+                        "creationDate": creationDate,
+                        "ttl": ttl,
+                        **attributes,
+                    },
+                }
+            },
+            {
+                "Update": {
+                    "TableName": table.name,
+                    "Key": {"sessionId": sessionId, "version": "v0"},
+                    "UpdateExpression": "SET Latest = :latest, #creationDate = :creationDate, #ttl = :ttl, "
+                    + ", ".join(f"{name} = :{name[1:]}" for name in names),
+                    "ExpressionAttributeNames": {
+                        "#creationDate": "creationDate",
+                        "#ttl": "ttl",
+                        **names,
+                    },
+                    "ExpressionAttributeValues": {
+                        ":latest": latest + 1,
+                        ":creationDate": creationDate,
+                        ":ttl": ttl,
+                        **values,
+                    },
+                }
+            },
+        ]
+    )
+    return latest + 1
+
+
+def session_items(table, sessionId):
+    """
+    Returns the items of a session by version.
+    """
+    return {
+        item["version"]: item
+        for item in table.query(
+            KeyConditionExpression="sessionId = :sessionId",
+            ExpressionAttributeValues={":sessionId": sessionId},
+        )["Items"]
+    }
+
+
+def write_units(before, after, written=("v0",)):
+    """
+    Returns the WCU of a save from the session items before and after it: the
+    new items and the updated `written` ones, all inside the transaction.
+    """
+    units = 0
+    for version, item in after.items():
+        if version in before and version not in written:
+            continue
+        size = max(item_size(item), item_size(before.get(version, {})))
+        units += 2 * math.ceil(size / 1024)
+    return units
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--saves", type=int, default=6)
+    parser.add_argument("--unchanged", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    rng = random.Random(args.seed)
+    examples = [
+        parse_template(template) for template in stand_ins.ingest_templates().values()
+    ]
+    sessions = list()
+    for session in range(args.sessions):
+        document = rng.choice(examples)
+        templates = [yaml.safe_dump(document, sort_keys=False)]
+        for save in range(args.saves):
+            if rng.random() >= args.unchanged:
+                document = extend(document, f"{session}x{save}")
+                templates.append(yaml.safe_dump(document, sort_keys=False))
+            else:
+                templates.append(templates[-1])
+        sessions.append(templates)
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        table = boto3.resource("dynamodb", region_name=stand_ins.REGION).Table(
+            f"templatestorage-atc-{stand_ins.ENVIRONMENT_NAME}"
+        )
+
+        results = dict()
+        for layout in ("copies", "dedup"):
+            wcu, stored_kb, stored_items = list(), list(), list()
+            for index, templates in enumerate(sessions):
+                sessionId = f"{layout}-{index}"
+                latest, head_hash = 0, None
+                for template in templates:
+                    before = session_items(table, sessionId)
+                    if layout == "copies":
+                        latest = copy_write(table, sessionId, template, latest)
+                    else:
+                        # Without the "references it" log of each deduplicated save
+                        with redirect_stdout(io.StringIO()):
+                            latest = write_template_version(
+                                table,
+                                sessionId,
+                                template,
+                                expected_latest=latest,
+                                expected_hash=head_hash,
+                            )
+                        head_hash = template_hash(template)
+                    after = session_items(table, sessionId)
+                    # The saved body is written or, if it is the head's, refreshed
+                    written = ("v0", f"{BODY_PREFIX}{template_hash(template)}")
+                    wcu.append(write_units(before, after, written))
+                items = session_items(table, sessionId)
+                stored_kb.append(sum(item_size(item) for item in items.values()) / 1024)
+                stored_items.append(len(items))
+            results[layout] = {
+                "wcu": statistics.mean(wcu),
+                "kb": statistics.mean(stored_kb),
+                "items": statistics.mean(stored_items),
+            }
+
+    unique = statistics.mean(len(set(templates)) for templates in sessions)
+    print(
+        f"Template versions ({args.sessions} sessions, {args.saves + 1} saves, "
+        f"{args.unchanged:.0%} unchanged, {unique:.1f} distinct bodies per session)"
+    )
+    print(f"{'layout':<8}{'WCU per save':>14}{'stored KB':>11}{'items':>7}")
+    for layout, result in results.items():
+        print(
+            f"{layout:<8}{result['wcu']:>14.1f}{result['kb']:>11.1f}"
+            f"{result['items']:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
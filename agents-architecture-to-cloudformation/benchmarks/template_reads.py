@@ -0,0 +1,154 @@
+"""
+Benchmark of the Streamlit app's template reads after an agent invocation:
+the previous two get_item calls of the "v0" head (the template, then
+is_valid), each followed to the body item the head points to, against the
+projected read of read_template_state in util/agent/template_store.py, which
+only reads the body when the template the KnowledgeBase cached is not the
+head's.
+
+Each session replays the writes of an agent conversation (generate, validate,
+update, validate, validate again from the button) against the moto table and
+bucket of the stand-ins, and reads the head after every invocation, as app.py
+does. Templates are written with the gzip+S3 TemplateCodec, so large ones are
+read from Amazon S3. Each DynamoDB and S3 request sleeps --rtt milliseconds.
+
+Usage:
+
+python benchmarks/template_reads.py
+python benchmarks/template_reads.py --rtt 8 --spill-bytes 1024
+"""
+
+from argparse import ArgumentParser
+
+import copy
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+import yaml
+
+from cfn_validator import parse_template
+from template_store import (
+    TEMPLATE_SPILL_BYTES,
+    TemplateCodec,
+    read_template_body,
+    read_template_state,
+    write_template_validity,
+    write_template_version,
+)
+
+
+def conversation(template):
+    """
+    Returns the write of each invocation of an agent conversation.
+    """
+    document = copy.deepcopy(parse_template(template))
+    document["Resources"]["AlarmTopic"] = {"Type": "AWS::SNS::Topic"}
+    updated = yaml.safe_dump(document, sort_keys=False)
+    return [
+        ("template", template),
+        ("validity", True),
+        ("template", updated),
+        ("validity", True),
+        ("validity", True),
+    ]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=5.0, help="milliseconds")
+    parser.add_argument("--spill-bytes", type=int, default=TEMPLATE_SPILL_BYTES)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        table = boto3.resource("dynamodb", region_name=stand_ins.REGION).Table(
+            f"templatestorage-atc-{stand_ins.ENVIRONMENT_NAME}"
+        )
+        s3 = boto3.client("s3", region_name=stand_ins.REGION)
+        codec = TemplateCodec(
+            bucket=stand_ins.BUCKET_NAME,
+            get_s3=lambda: s3,
+            spill_bytes=args.spill_bytes,
+        )
+        requests = {"dynamodb": 0, "s3": 0, "counting": False}
+
+        def round_trip(service):
+            def count(**kwargs):
+                if requests["counting"]:
+                    requests[service] += 1
+                    time.sleep(args.rtt / 1000)
+
+            return count
+
+        table.meta.client.meta.events.register(
+            "before-call.dynamodb.*", round_trip("dynamodb")
+        )
+        s3.meta.events.register("before-call.s3.*", round_trip("s3"))
+
+        def previous(sessionId, cached):
+            item = table.get_item(Key={"sessionId": sessionId, "version": "v0"})["Item"]
+            template = read_template_body(table, sessionId, item, codec)
+            is_valid = table.get_item(Key={"sessionId": sessionId, "version": "v0"})[
+                "Item"
+            ]["is_valid"]
+            return {"template": template, "is_valid": is_valid}
+
+        def projected(sessionId, cached):
+            return read_template_state(
+                table, sessionId, consistent=True, codec=codec, cached=cached
+            )
+
+        print(
+            f"Template reads after each invocation (rtt {args.rtt:.1f} ms, "
+            f"spill above {args.spill_bytes / 1024:.0f} KB compressed)"
+        )
+        print(f"{'template':<30}{'path':<11}{'DynamoDB':>10}{'S3':>5}{'read ms':>10}")
+        totals = {"previous": [], "projected": []}
+        for name, template in stand_ins.ingest_templates().items():
+            for path, read in (("previous", previous), ("projected", projected)):
+                sessionId = f"{path}-{name}"
+                latest, state, seconds = 0, None, list()
+                requests.update(dynamodb=0, s3=0)
+                for kind, value in conversation(template):
+                    if kind == "template":
+                        latest = write_template_version(
+                            table, sessionId, value, expected_latest=latest, codec=codec
+                        )
+                    else:
+                        write_template_validity(table, sessionId, latest, value)
+
+                    requests["counting"] = True
+                    start = time.perf_counter()
+                    state = read(sessionId, state)
+                    seconds.append(time.perf_counter() - start)
+                    requests["counting"] = False
+                    assert (state["is_valid"] is True) == (kind == "validity")
+                totals[path].append(statistics.mean(seconds))
+                print(
+                    f"{name[:29]:<30}{path:<11}{requests['dynamodb']:>10}"
+                    f"{requests['s3']:>5}{statistics.mean(seconds) * 1000:>10.1f}"
+                )
+
+        print(
+            "\nmean read ms: "
+            + ", ".join(
+                f"{path} {statistics.mean(seconds) * 1000:.1f}"
+                for path, seconds in totals.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark of template storage encodings in the template table: the previous
+plain string bodies against the gzip TemplateCodec of
+util/agent/template_store.py, inline and with large bodies spilled to Amazon S3.
+
+Every template of data/ingest and of architecture-to-cloudformation/data/examples
+is saved through write_template_version and loaded through
+read_template_state, against the moto table and bucket of the stand-ins. "all-ingest" merges
+the resources of every ingest template into one large architecture.
+
+Capacity units follow the DynamoDB item size rules: a save of a new body
+writes the body item, the "v0" head and the version reference in one
+transaction (2 WCU per started KB of each item). A load is a strongly
+consistent read of "v0" and of the body item it points to (1 RCU per started
+4 KB of each item).
+S3 requests per save and load, and the save and load latency, are those of
+the gzip+S3 codec.
+
+Usage:
+
+python benchmarks/template_storage.py
+python benchmarks/template_storage.py --spill-bytes 4096
+"""
+
+from argparse import ArgumentParser
+
+import math
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+import yaml
+
+from cfn_validator import parse_template
+from template_store import (
+    BODY_PREFIX,
+    TEMPLATE_SPILL_BYTES,
+    TemplateCodec,
+    read_template_state,
+    write_template_version,
+)
+from template_validation import corpus
+from template_writes import item_size
+
+
+class PlainCodec(TemplateCodec):
+    """
+    The previous storage: the template as a plain string attribute.
+    """
+
+    def encode(self, template):
+        return {"template": template}
+
+
+def merged_template(templates):
+    """
+    Returns one template holding the resources of every template.
+    """
+    resources = dict()
+    for name, template in templates.items():
+        prefix = "".join(char for char in name if char.isalnum())
+        for resource, definition in (
+            parse_template(template).get("Resources") or {}
+        ).items():
+            resources[f"{prefix}{resource}"] = definition
+    return yaml.safe_dump(
+        {"AWSTemplateFormatVersion": "2010-09-09", "Resources": resources},
+        sort_keys=False,
+    )
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--spill-bytes", type=int, default=TEMPLATE_SPILL_BYTES)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    templates = corpus()
+    templates["all-ingest"] = merged_template(stand_ins.ingest_templates())
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        table = boto3.resource("dynamodb", region_name=stand_ins.REGION).Table(
+            f"templatestorage-atc-{stand_ins.ENVIRONMENT_NAME}"
+        )
+        s3 = boto3.client("s3", region_name=stand_ins.REGION)
+        s3_requests = {"count": 0}
+
+        def count_s3(**kwargs):
+            s3_requests["count"] += 1
+
+        s3.meta.events.register("before-call.s3.*", count_s3)
+
+        codecs = {
+            "plain": PlainCodec(),
+            "gzip": TemplateCodec(),
+            "gzip+S3": TemplateCodec(
+                bucket=stand_ins.BUCKET_NAME,
+                get_s3=lambda: s3,
+                spill_bytes=args.spill_bytes,
+            ),
+        }
+
+        print(
+            f"Template storage (spill above {args.spill_bytes / 1024:.0f} KB compressed)"
+        )
+        print(
+            f"{'template':<38}{'KB':>7}"
+            + "".join(f"{f'{name} WCU/RCU':>18}" for name in codecs)
+            + f"{'S3 req':>8}{'save ms':>9}{'load ms':>9}"
+        )
+        totals = {name: {"wcu": [], "rcu": []} for name in codecs}
+        for name, template in templates.items():
+            row = f"{name[:37]:<38}{len(template.encode()) / 1024:>7.1f}"
+            for label, codec in codecs.items():
+                s3_requests["count"] = 0
+                save_seconds, load_seconds = list(), list()
+                for repeat in range(args.repeat):
+                    # A session per save, so no save only references the previous body
+                    sessionId = f"{label}-{name}-{repeat}"
+                    start = time.perf_counter()
+                    latest = write_template_version(
+                        table, sessionId, template, codec=codec
+                    )
+                    save_seconds.append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    state = read_template_state(
+                        table, sessionId, consistent=True, codec=codec
+                    )
+                    assert state["template"] == template
+                    load_seconds.append(time.perf_counter() - start)
+
+                head, version = (
+                    table.get_item(Key={"sessionId": sessionId, "version": key})["Item"]
+                    for key in ("v0", f"v{latest}")
+                )
+                body = table.get_item(
+                    Key={
+                        "sessionId": sessionId,
+                        "version": f"{BODY_PREFIX}{version['template_hash']}",
+                    }
+                )["Item"]
+                wcu = 2 * sum(
+                    math.ceil(item_size(written) / 1024)
+                    for written in (body, head, version)
+                )
+                rcu = sum(math.ceil(item_size(read) / 4096) for read in (head, body))
+                totals[label]["wcu"].append(wcu)
+                totals[label]["rcu"].append(rcu)
+                row += f"{f'{wcu}/{rcu}':>18}"
+            row += (
+                f"{s3_requests['count'] / args.repeat:>8.0f}"
+                f"{statistics.mean(save_seconds) * 1000:>9.1f}"
+                f"{statistics.mean(load_seconds) * 1000:>9.1f}"
+            )
+            print(row)
+
+        means = [
+            f"{statistics.mean(total['wcu']):.1f}/{statistics.mean(total['rcu']):.1f}"
+            for total in totals.values()
+        ]
+        print(f"{'mean per save/load':<45}" + "".join(f"{mean:>18}" for mean in means))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark of template validation: the remote ValidateTemplate call of
+validate_cloudformtaion against the local validator of
+util/agent/cfn_validator.py, over the templates of data/ingest and
+architecture-to-cloudformation/data/examples.
+
+The remote path is served by moto, each call sleeping --rtt milliseconds to
+model the network round trip. With cfn-lint installed (pip install cfn-lint,
+also needed to build the resource specification) moto lints the template
+behind ValidateTemplate and rejects it on any finding, warnings included, so
+its timings and verdicts are those of a full lint: a stricter reference than
+the real API, which does not check properties. The detection table shows
+which faults each path reports: every parsable template is also validated
+with one injected fault of each kind (missing required property, unknown
+property, dangling Ref, unknown Fn::GetAtt attribute, malformed Fn::Join,
+dependency cycle). Local detections only count errors the unmodified template
+did not already have.
+
+Usage:
+
+python benchmarks/template_validation.py
+python benchmarks/template_validation.py --rtt 80
+"""
+
+from argparse import ArgumentParser
+
+import copy
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+from cfn_validator import get_resource_spec, parse_template, validate_template
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(stand_ins.APP_DIR),
+    "architecture-to-cloudformation",
+    "data",
+    "examples",
+)
+
+
+def corpus():
+    """
+    Returns the templates of data/ingest and the arch app examples by name.
+    """
+    templates = {
+        f"ingest/{name}": body for name, body in stand_ins.ingest_templates().items()
+    }
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.yaml"))):
+        with open(path, "r") as f:
+            templates[f"examples/{os.path.basename(path)}"] = f.read()
+    return templates
+
+
+def _typed_resources(document, spec):
+    return [
+        (name, resource)
+        for name, resource in document["Resources"].items()
+        if isinstance(resource, dict) and resource.get("Type") in spec
+    ]
+
+
+def mutate(document, fault, spec):
+    """
+    Returns a copy of the template with one fault injected, None if it does not apply.
+    """
+    document = copy.deepcopy(document)
+    resources = _typed_resources(document, spec)
+    if not resources:
+        return None
+
+    if fault == "missing required property":
+        for name, resource in resources:
+            for required in spec[resource["Type"]]["required"]:
+                if required in (resource.get("Properties") or {}):
+                    del resource["Properties"][required]
+                    return document
+        return None
+
+    name, resource = resources[0]
+    properties = resource.setdefault("Properties", {}) or {}
+    resource["Properties"] = properties
+
+    if fault == "unknown property":
+        properties["EnableTurboMode"] = True
+    elif fault == "dangling Ref":
+        properties["Tags"] = [{"Key": "Owner", "Value": {"Ref": "MissingParameter"}}]
+    elif fault == "unknown GetAtt attribute":
+        document.setdefault("Outputs", {})["Broken"] = {
+            "Value": {"Fn::GetAtt": [name, "NoSuchAttribute"]}
+        }
+    elif fault == "malformed Fn::Join":
+        document.setdefault("Outputs", {})["Broken"] = {
+            "Value": {"Fn::Join": ["-", "not-a-list", "extra"]}
+        }
+    elif fault == "dependency cycle":
+        if len(resources) < 2:
+            return None
+        other, other_resource = resources[1]
+        resource["DependsOn"] = other
+        other_resource["DependsOn"] = name
+    return document
+
+
+FAULTS = (
+    "missing required property",
+    "unknown property",
+    "dangling Ref",
+    "unknown GetAtt attribute",
+    "malformed Fn::Join",
+    "dependency cycle",
+)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=40.0, help="milliseconds")
+    args = parser.parse_args()
+
+    from botocore.exceptions import ClientError
+    from moto import mock_aws
+    import boto3
+
+    start = time.perf_counter()
+    spec = get_resource_spec()
+    spec_ms = (time.perf_counter() - start) * 1000
+
+    with mock_aws():
+        cfn = boto3.client("cloudformation", region_name=stand_ins.REGION)
+        cfn.meta.events.register(
+            "before-call.cloudformation.ValidateTemplate",
+            lambda **kwargs: time.sleep(args.rtt / 1000),
+        )
+
+        def remote(template):
+            start = time.perf_counter()
+            try:
+                cfn.validate_template(TemplateBody=template)
+                errors = 0
+            except ClientError:
+                errors = 1
+            return errors, (time.perf_counter() - start) * 1000
+
+        def local(template):
+            start = time.perf_counter()
+            errors = validate_template(template)
+            return len(errors), (time.perf_counter() - start) * 1000
+
+        print(
+            f"Template validation (rtt {args.rtt:.1f} ms, "
+            f"resource spec of {len(spec)} types loaded in {spec_ms:.1f} ms)"
+        )
+        print(
+            f"{'template':<38}{'KB':>6}{'remote ms':>11}{'local ms':>10}"
+            f"{'remote errors':>15}{'local errors':>14}"
+        )
+        timings = {"remote": [], "local": []}
+        detected = {fault: {"remote": 0, "local": 0, "cases": 0} for fault in FAULTS}
+        for name, template in corpus().items():
+            remote_errors, remote_ms = remote(template)
+            local_errors, local_ms = local(template)
+            timings["remote"].append(remote_ms)
+            timings["local"].append(local_ms)
+            print(
+                f"{name:<38}{len(template) / 1024:>6.1f}{remote_ms:>11.1f}{local_ms:>10.1f}"
+                f"{remote_errors:>15}{local_errors:>14}"
+            )
+
+            try:
+                document = parse_template(template)
+            except ValueError:
+                continue
+            if not isinstance(document, dict) or not isinstance(
+                document.get("Resources"), dict
+            ):
+                continue
+            baseline = {
+                (error.check, error.path, error.message)
+                for error in validate_template(json.dumps(document))
+            }
+            for fault in FAULTS:
+                mutated = mutate(document, fault, spec)
+                if mutated is None:
+                    continue
+                body = json.dumps(mutated)
+                detected[fault]["cases"] += 1
+                detected[fault]["remote"] += remote(body)[0]
+                # Only faults beyond the template's own errors count
+                errors = {
+                    (error.check, error.path, error.message)
+                    for error in validate_template(body)
+                }
+                detected[fault]["local"] += bool(errors - baseline)
+
+        print(
+            f"{'median':<44}{statistics.median(timings['remote']):>11.1f}"
+            f"{statistics.median(timings['local']):>10.1f}"
+        )
+
+        print(f"\n{'injected fault':<30}{'cases':>7}{'remote':>9}{'local':>8}")
+        for fault, counts in detected.items():
+            print(
+                f"{fault:<30}{counts['cases']:>7}{counts['remote']:>9}{counts['local']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Benchmark of template version writes: the previous update_item + put_item path
+against the single TransactWriteItems of util/agent/template_store.py, and of
+validation results: the previous full rewrite as a new version against the
+attribute update of write_template_validity.
+
+Every knowledge base example template is saved --saves times for a new
+session with both paths, against the moto DynamoDB table of the stand-ins.
+Each DynamoDB request sleeps --rtt milliseconds to model the network round
+trip, so latency reflects the number of sequential requests.
+
+Write capacity units are computed from the DynamoDB item size rules: one WCU
+per started KB of the written item (the larger of its sizes before and after
+an update), twice that inside a transaction. A save of the transaction path
+writes the body item, the "v0" head and the version reference.
+
+Usage:
+
+python benchmarks/template_writes.py
+python benchmarks/template_writes.py --rtt 8 --saves 5
+"""
+
+from argparse import ArgumentParser
+
+import datetime
+import decimal
+import math
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+from template_store import (
+    BODY_PREFIX,
+    write_template_validity,
+    write_template_version,
+)
+
+
+def legacy_write(table, sessionId, template, is_valid=None):
+    """
+    The previous write path: increment Latest on "v0" with the template, then put
+    the version. Validation results were stored the same way.
+    """
+    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
+    ttl = str(
+        int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
+    )
+    response = table.update_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valid = :is_valid",
+        ExpressionAttributeNames={
+            "#creationDate": "creationDate",
+            "#template": "template",
+            "#ttl": "ttl",
+            "#is_valid": "is_valid",
+        },
+        ExpressionAttributeValues={
+            ":creationDate": creationDate,
+            ":template": template,
+            ":ttl": ttl,
+            ":defaultval": 0,
+            ":incrval": 1,
+            ":is_valid": is_valid,
+        },
+        ReturnValues="UPDATED_NEW",
+    )
+    item = {
+        "sessionId": sessionId,
+        "version": "v" + str(response["Attributes"]["Latest"]),
+        "creationDate": creationDate,
+        "template": template,
+        "ttl": ttl,
+    }
+    if is_valid is not None:
+        item["is_valid"] = is_valid
+    table.put_item(Item=item)
+    return int(response["Attributes"]["Latest"])
+
+
+def attribute_size(value):
+    """
+    Returns the DynamoDB size in bytes of an attribute value.
+    """
+    # boto3 returns binary attributes as Binary
+    value = getattr(value, "value", value)
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (int, float, decimal.Decimal)) and not isinstance(value, bool):
+        return math.ceil(len(str(value).lstrip("-").replace(".", "")) / 2) + 1
+    return 1
+
+
+def item_size(item):
+    return sum(len(name.encode()) + attribute_size(v) for name, v in item.items())
+
+
+def write_units(table, sessionId, version, transactional):
+    """
+    Returns the WCU of writing "v0" and "v<version>" as they are stored now,
+    and for the transaction path the body item the version refers to.
+    """
+    units = 0
+    for key in ("v0", f"v{version}"):
+        item = table.get_item(Key={"sessionId": sessionId, "version": key})["Item"]
+        units += math.ceil(item_size(item) / 1024)
+    if not transactional:
+        return units
+    body = table.get_item(
+        Key={"sessionId": sessionId, "version": f"{BODY_PREFIX}{item['template_hash']}"}
+    )["Item"]
+    return 2 * (units + math.ceil(item_size(body) / 1024))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--rtt", type=float, default=5.0, help="milliseconds")
+    parser.add_argument("--saves", type=int, default=3)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        table = boto3.resource("dynamodb", region_name=stand_ins.REGION).Table(
+            f"templatestorage-atc-{stand_ins.ENVIRONMENT_NAME}"
+        )
+        requests = {"count": 0}
+
+        def round_trip(**kwargs):
+            requests["count"] += 1
+            time.sleep(args.rtt / 1000)
+
+        table.meta.client.meta.events.register("before-call.dynamodb.*", round_trip)
+
+        print(f"Template version writes (rtt {args.rtt:.1f} ms, {args.saves} saves)")
+        print(
+            f"{'template':<32}{'KB':>6}{'before ms':>11}{'after ms':>10}"
+            f"{'before req':>12}{'after req':>11}{'before WCU':>12}{'after WCU':>11}"
+        )
+        totals = {key: [] for key in ("before_ms", "after_ms")}
+        total_units = {"before": 0, "after": 0}
+        for name, template in stand_ins.ingest_templates().items():
+            result = dict()
+            for path, write in (
+                (
+                    "before",
+                    lambda sessionId, latest: legacy_write(table, sessionId, template),
+                ),
+                (
+                    "after",
+                    lambda sessionId, latest: write_template_version(
+                        table, sessionId, template, expected_latest=latest
+                    ),
+                ),
+            ):
+                sessionId = f"{path}-{name}"
+                latest = None
+                timings, units = list(), 0
+                requests["count"] = 0
+                for _ in range(args.saves):
+                    start = time.perf_counter()
+                    latest = write(sessionId, latest)
+                    timings.append((time.perf_counter() - start) * 1000)
+                result[f"{path}_req"] = requests["count"] / args.saves
+                for version in range(1, latest + 1):
+                    units += write_units(table, sessionId, version, path == "after")
+                result[f"{path}_ms"] = statistics.mean(timings)
+                result[f"{path}_wcu"] = units / args.saves
+                totals[f"{path}_ms"].append(result[f"{path}_ms"])
+                total_units[path] += result[f"{path}_wcu"]
+
+            print(
+                f"{name:<32}{len(template) / 1024:>6.1f}"
+                f"{result['before_ms']:>11.1f}{result['after_ms']:>10.1f}"
+                f"{result['before_req']:>12.0f}{result['after_req']:>11.0f}"
+                f"{result['before_wcu']:>12.0f}{result['after_wcu']:>11.0f}"
+            )
+
+        print(
+            f"{'mean per save':<38}"
+            f"{statistics.mean(totals['before_ms']):>11.1f}"
+            f"{statistics.mean(totals['after_ms']):>10.1f}"
+            f"{'':>23}"
+            f"{total_units['before'] / len(totals['before_ms']):>12.1f}"
+            f"{total_units['after'] / len(totals['after_ms']):>11.1f}"
+        )
+
+        print(f"\nValidation result writes (rtt {args.rtt:.1f} ms)")
+        print(
+            f"{'template':<32}{'KB':>6}{'before ms':>11}{'after ms':>10}"
+            f"{'before req':>12}{'after req':>11}{'before WCU':>12}{'after WCU':>11}"
+        )
+        totals = {
+            key: [] for key in ("before_ms", "after_ms", "before_wcu", "after_wcu")
+        }
+        for name, template in stand_ins.ingest_templates().items():
+            result = dict()
+            sessionId = f"validate-before-{name}"
+            legacy_write(table, sessionId, template)
+
+            requests["count"] = 0
+            start = time.perf_counter()
+            latest = legacy_write(table, sessionId, template, is_valid=False)
+            result["before_ms"] = (time.perf_counter() - start) * 1000
+            result["before_req"] = requests["count"]
+            result["before_wcu"] = write_units(table, sessionId, latest, False)
+
+            sessionId = f"validate-{name}"
+            latest = write_template_version(table, sessionId, template)
+            requests["count"] = 0
+            start = time.perf_counter()
+            write_template_validity(table, sessionId, latest, False, "invalid")
+            result["after_ms"] = (time.perf_counter() - start) * 1000
+            result["after_req"] = requests["count"]
+            head = table.get_item(Key={"sessionId": sessionId, "version": "v0"})["Item"]
+            result["after_wcu"] = math.ceil(item_size(head) / 1024)
+
+            for key in totals:
+                totals[key].append(result[key])
+            print(
+                f"{name:<32}{len(template) / 1024:>6.1f}"
+                f"{result['before_ms']:>11.1f}{result['after_ms']:>10.1f}"
+                f"{result['before_req']:>12}{result['after_req']:>11}"
+                f"{result['before_wcu']:>12}{result['after_wcu']:>11}"
+            )
+
+        print(
+            f"{'mean per validation':<38}"
+            f"{statistics.mean(totals['before_ms']):>11.1f}"
+            f"{statistics.mean(totals['after_ms']):>10.1f}"
+            f"{'':>23}"
+            f"{statistics.mean(totals['before_wcu']):>12.1f}"
+            f"{statistics.mean(totals['after_wcu']):>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark of the cross-session validation cache of util/agent/validation_cache.py.
+
+--sessions agent sessions are spread round-robin over --containers Lambda
+containers, each with its own ValidationCache over the shared moto DynamoDB
+table of the stand-ins. Every session starts from a knowledge base example
+template (as generated sessions do) and runs validate, resolve, validate:
+the resolve step returns the same template reformatted (keys reordered,
+comments and indentation changed) with probability --unchanged, else a
+template with one more resource.
+
+Validation without the cache runs the local validator and, with --remote,
+sleeps --remote-ms to model the ValidateTemplate call. Each DynamoDB request
+sleeps --rtt milliseconds. As in the Lambda, the shared table is only used
+with --remote.
+
+Usage:
+
+python benchmarks/validation_cache.py
+python benchmarks/validation_cache.py --remote --sessions 400 --containers 8
+"""
+
+from argparse import ArgumentParser
+
+import copy
+import random
+import os
+import statistics
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import stand_ins
+
+sys.path.insert(0, stand_ins.AGENT_DIR)
+
+import yaml
+
+from cfn_validator import get_resource_spec_source, parse_template, validate_template
+from validation_cache import ValidationCache, template_key
+
+
+def reformat(document, rng):
+    """
+    Returns the template as YAML with shuffled keys, another indentation and a comment.
+    """
+
+    def shuffle(value):
+        if isinstance(value, dict):
+            items = list(value.items())
+            rng.shuffle(items)
+            return {key: shuffle(item) for key, item in items}
+        if isinstance(value, list):
+            return [shuffle(item) for item in value]
+        return value
+
+    body = yaml.safe_dump(
+        shuffle(document), sort_keys=False, indent=rng.choice((2, 4)), width=4096
+    )
+    return f"# Resolved by the agent\n{body}"
+
+
+def extend(document, index):
+    """
+    Returns a copy of the template with one more SNS topic.
+    """
+    document = copy.deepcopy(document)
+    document["Resources"][f"AlarmTopic{index}"] = {
+        "Type": "AWS::SNS::Topic",
+        "Properties": {"TopicName": f"alarms-{index}"},
+    }
+    return document
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--containers", type=int, default=4)
+    parser.add_argument("--unchanged", type=float, default=0.5)
+    parser.add_argument("--remote", action="store_true")
+    parser.add_argument("--remote-ms", type=float, default=150.0)
+    parser.add_argument("--rtt", type=float, default=5.0, help="milliseconds")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from moto import mock_aws
+    import boto3
+
+    rng = random.Random(args.seed)
+    examples = [
+        parse_template(template) for template in stand_ins.ingest_templates().values()
+    ]
+    salt = f"{get_resource_spec_source()} remote={args.remote}"
+
+    def check(template, document):
+        validate_template(document if isinstance(document, dict) else template)
+        if args.remote:
+            time.sleep(args.remote_ms / 1000)
+
+    with mock_aws():
+        stand_ins.create_aws_resources()
+        table = boto3.resource("dynamodb", region_name=stand_ins.REGION).Table(
+            f"templatestorage-atc-{stand_ins.ENVIRONMENT_NAME}"
+        )
+        requests = {"count": 0}
+
+        def round_trip(**kwargs):
+            requests["count"] += 1
+            time.sleep(args.rtt / 1000)
+
+        table.meta.client.meta.events.register("before-call.dynamodb.*", round_trip)
+        caches = [
+            ValidationCache(get_table=lambda: table, shared=args.remote)
+            for _ in range(args.containers)
+        ]
+
+        timings = {"uncached": [], "cached": []}
+        for session in range(args.sessions):
+            cache = caches[session % args.containers]
+            first = rng.choice(examples)
+            if rng.random() < args.unchanged:
+                second = first
+            else:
+                second = extend(first, rng.randrange(args.sessions))
+            for document in (first, second):
+                template = reformat(document, rng)
+
+                start = time.perf_counter()
+                check(template, parse_template(template))
+                timings["uncached"].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                key, parsed = template_key(template, salt=salt)
+                if cache.get(key) is None:
+                    check(template, parsed)
+                    cache.put(key, True)
+                timings["cached"].append(time.perf_counter() - start)
+
+        lookups = {"local": 0, "shared": 0, "misses": 0}
+        for cache in caches:
+            for level in lookups:
+                lookups[level] += cache.stats()[level]
+        total = sum(lookups.values())
+
+        print(
+            f"Validation cache ({args.sessions} sessions, {args.containers} containers, "
+            f"{args.unchanged:.0%} unchanged resolves, remote "
+            f"{f'{args.remote_ms:.0f} ms' if args.remote else 'off'}, rtt {args.rtt:.1f} ms)"
+        )
+        print(f"{'path':<12}{'mean ms':>10}{'median ms':>11}{'p95 ms':>9}")
+        for path, seconds in timings.items():
+            seconds = sorted(seconds)
+            print(
+                f"{path:<12}{statistics.mean(seconds) * 1000:>10.2f}"
+                f"{statistics.median(seconds) * 1000:>11.2f}"
+                f"{seconds[int(len(seconds) * 0.95)] * 1000:>9.2f}"
+            )
+        print(
+            f"\nlookups {total}: container hits {lookups['local'] / total:.0%}, "
+            f"shared hits {lookups['shared'] / total:.0%}, misses {lookups['misses'] / total:.0%}; "
+            f"DynamoDB requests {requests['count']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,615 @@
+"""
+Local validation of CloudFormation templates against the resource specification.
+
+validate_cloudformtaion used to send every template to the ValidateTemplate
+API, which only checks the syntax. This validator runs in-process, in
+milliseconds, against resource_spec.json (built by
+util/resource_spec/build_resource_spec.py) and checks:
+
+- the template sections and the resource attributes,
+- resource types, required and unknown properties, and whether properties
+  have the expected shape (scalar, list or mapping),
+- Ref, Fn::GetAtt and Fn::Sub targets (parameters, resources, pseudo
+  parameters and attributes), DependsOn targets and condition names,
+- the shape of the intrinsic functions,
+- dependency cycles between resources.
+
+Errors are returned as TemplateErrors with the check, the template path and a
+message.
+The remote ValidateTemplate call can still run as a second stage.
+
+This module only depends on PyYAML, so it is packaged with the action group
+Lambda.
+
+Usage:
+
+errors = validate_template(template)  # [] if valid
+
+print(format_errors(errors))
+"""
+
+from collections import namedtuple
+
+import json
+import os
+import re
+
+import yaml
+
+from patching import extract_code
+
+RESOURCE_SPEC_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "resource_spec.json"
+)
+
+SECTIONS = (
+    "AWSTemplateFormatVersion",
+    "Description",
+    "Metadata",
+    "Parameters",
+    "Rules",
+    "Mappings",
+    "Conditions",
+    "Transform",
+    "Resources",
+    "Outputs",
+)
+RESOURCE_ATTRIBUTES = (
+    "Type",
+    "Properties",
+    "DependsOn",
+    "Condition",
+    "DeletionPolicy",
+    "UpdateReplacePolicy",
+    "Metadata",
+    "CreationPolicy",
+    "UpdatePolicy",
+)
+PSEUDO_PARAMETERS = (
+    "AWS::AccountId",
+    "AWS::NotificationARNs",
+    "AWS::NoValue",
+    "AWS::Partition",
+    "AWS::Region",
+    "AWS::StackId",
+    "AWS::StackName",
+    "AWS::URLSuffix",
+)
+
+# Intrinsic functions with the number of list arguments they take, None for any shape.
+INTRINSIC_ARGUMENTS = {
+    "Fn::And": (2, 10),
+    "Fn::Base64": None,
+    "Fn::Cidr": (3, 3),
+    "Fn::Equals": (2, 2),
+    "Fn::FindInMap": (3, 4),
+    "Fn::GetAtt": None,
+    "Fn::GetAZs": None,
+    "Fn::If": (3, 3),
+    "Fn::ImportValue": None,
+    "Fn::Join": (2, 2),
+    "Fn::Length": None,
+    "Fn::Not": (1, 1),
+    "Fn::Or": (2, 10),
+    "Fn::Select": (2, 2),
+    "Fn::Split": (2, 2),
+    "Fn::Sub": None,
+    "Fn::ToJsonString": None,
+    "Fn::Transform": None,
+    "Ref": None,
+}
+
+_SUB_VARIABLE = re.compile(r"\$\{([^!}][^}]*)\}")
+
+TemplateError = namedtuple("TemplateError", ["check", "path", "message"])
+
+
+##### Template parsing #####
+
+
+class _TemplateLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """
+    SafeLoader (LibYAML based if available) turning the short-form tags into
+    their long form (!Ref X -> {"Ref": "X"}).
+    """
+
+
+def _construct_tag(loader, suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+
+    if suffix in ("Ref", "Condition"):
+        return {suffix: value}
+    if suffix == "GetAtt" and isinstance(value, str):
+        value = value.split(".", 1)
+    return {f"Fn::{suffix}": value}
+
+
+_TemplateLoader.add_multi_constructor("!", _construct_tag)
+# Keep timestamps and dates as the strings CloudFormation sees
+_TemplateLoader.yaml_implicit_resolvers = {
+    key: [
+        (tag, regexp)
+        for tag, regexp in resolvers
+        if tag != "tag:yaml.org,2002:timestamp"
+    ]
+    for key, resolvers in _TemplateLoader.yaml_implicit_resolvers.items()
+}
+
+
+def parse_template(template):
+    """
+    Parses a JSON or YAML CloudFormation template, with short-form tags in long form.
+
+    Raises:
+        ValueError: The template is not valid JSON or YAML.
+    """
+    text = extract_code(template)
+    if text.lstrip().startswith("{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    try:
+        return yaml.load(text, Loader=_TemplateLoader)
+    except yaml.YAMLError as ex:
+        raise ValueError(f"Template is not valid YAML or JSON: {ex}")
+
+
+##### Resource specification #####
+
+_resource_spec = None
+_resource_spec_source = None
+
+
+def get_resource_spec():
+    """
+    Returns the resource types of resource_spec.json, loaded on first use.
+    """
+    global _resource_spec, _resource_spec_source
+    if _resource_spec is None:
+        with open(RESOURCE_SPEC_PATH, "r") as f:
+            index = json.load(f)
+        _resource_spec = index["resources"]
+        _resource_spec_source = f"{index['source']} {index['region']}"
+    return _resource_spec
+
+
+def get_resource_spec_source():
+    """
+    Returns the origin of resource_spec.json, e.g. "cfn-lint 1.57.2 us-east-1".
+    """
+    get_resource_spec()
+    return _resource_spec_source
+
+
+def _is_unchecked_type(resource_type, transforms):
+    """
+    Returns True for types the specification does not describe: custom
+    resources, modules and types expanded by a transform.
+    """
+    return (
+        resource_type.startswith("Custom::")
+        or resource_type == "AWS::CloudFormation::CustomResource"
+        or resource_type.endswith("::MODULE")
+        or (bool(transforms) and resource_type.startswith("AWS::Serverless::"))
+    )
+
+
+##### Validation #####
+
+
+class _Validator:
+    def __init__(self, template):
+        self.template = template
+        self.errors = list()
+        self.parameters = set(self._section("Parameters"))
+        self.resources = self._section("Resources")
+        self.conditions = set(self._section("Conditions"))
+        self.mappings = self._section("Mappings")
+        transforms = template.get("Transform") or []
+        self.transforms = [transforms] if isinstance(transforms, str) else transforms
+        # Resource -> resources it references, for the cycle check
+        self.dependencies = {name: set() for name in self.resources}
+
+    def _section(self, name):
+        section = self.template.get(name) or {}
+        return section if isinstance(section, dict) else {}
+
+    def error(self, check, path, message):
+        self.errors.append(TemplateError(check, "/".join(map(str, path)), message))
+
+    def validate(self):
+        for section in self.template:
+            if section not in SECTIONS:
+                self.error("section", [section], f"Unknown template section {section}")
+
+        if not isinstance(self.template.get("Resources"), dict) or not self.resources:
+            self.error(
+                "section", ["Resources"], "Resources must be a non-empty mapping"
+            )
+
+        for name, resource in self.resources.items():
+            self.validate_resource(name, resource)
+
+        for name, condition in self._section("Conditions").items():
+            self.walk(condition, ["Conditions", name], owner=None)
+            self.check_condition_references(condition, ["Conditions", name])
+
+        for name, output in self._section("Outputs").items():
+            path = ["Outputs", name]
+            if not isinstance(output, dict) or "Value" not in output:
+                self.error("output", path, "Output must have a Value")
+                continue
+            self.check_condition_name(output.get("Condition"), path + ["Condition"])
+            self.walk(output, path, owner=None)
+
+        self.check_cycles()
+        return self.errors
+
+    def validate_resource(self, name, resource):
+        path = ["Resources", name]
+        if not isinstance(resource, dict):
+            self.error("resource", path, "Resource must be a mapping")
+            return
+
+        for attribute in resource:
+            if attribute not in RESOURCE_ATTRIBUTES:
+                self.error(
+                    "resource",
+                    path + [attribute],
+                    f"Unknown resource attribute {attribute}",
+                )
+
+        resource_type = resource.get("Type")
+        properties = resource.get("Properties") or {}
+        if not isinstance(resource_type, str):
+            self.error("resource-type", path + ["Type"], "Resource must have a Type")
+        elif not _is_unchecked_type(resource_type, self.transforms):
+            spec = get_resource_spec().get(resource_type)
+            if spec is None:
+                self.error(
+                    "resource-type",
+                    path + ["Type"],
+                    f"Unknown resource type {resource_type}",
+                )
+            elif isinstance(properties, dict):
+                self.check_properties(spec, properties, path + ["Properties"])
+
+        if not isinstance(properties, dict):
+            self.error(
+                "property", path + ["Properties"], "Properties must be a mapping"
+            )
+
+        depends_on = resource.get("DependsOn", [])
+        for target in [depends_on] if isinstance(depends_on, str) else depends_on:
+            if target not in self.resources:
+                self.error(
+                    "depends-on",
+                    path + ["DependsOn"],
+                    f"DependsOn target {target} is not a resource",
+                )
+            else:
+                self.dependencies[name].add(target)
+
+        self.check_condition_name(resource.get("Condition"), path + ["Condition"])
+        self.walk(properties, path + ["Properties"], owner=name)
+        for attribute in ("Metadata", "CreationPolicy", "UpdatePolicy"):
+            if attribute in resource:
+                self.walk(resource[attribute], path + [attribute], owner=name)
+
+    def check_properties(self, spec, properties, path):
+        # Properties chosen by an intrinsic (e.g. Fn::If) are only known at deploy time
+        if _intrinsic_name(properties):
+            return
+
+        for required in spec["required"]:
+            if required not in properties:
+                self.error(
+                    "required-property",
+                    path,
+                    f"Missing required property {required}",
+                )
+
+        for name, value in properties.items():
+            if name not in spec["properties"]:
+                self.error(
+                    "unknown-property", path + [name], f"Unknown property {name}"
+                )
+                continue
+            shape = spec["properties"][name]
+            if shape and not _matches_shape(value, shape):
+                self.error(
+                    "property-shape",
+                    path + [name],
+                    f"Property {name} must be a {_SHAPE_NAMES[shape]}",
+                )
+
+    def check_condition_name(self, condition, path):
+        if condition is not None and condition not in self.conditions:
+            self.error("condition", path, f"Condition {condition} is not defined")
+
+    def check_condition_references(self, value, path):
+        """
+        Checks {"Condition": name} references between conditions. Elsewhere
+        "Condition" is an ordinary key, e.g. of IAM policy statements.
+        """
+        if isinstance(value, list):
+            for idx, item in enumerate(value):
+                self.check_condition_references(item, path + [idx])
+        elif isinstance(value, dict):
+            if list(value) == ["Condition"]:
+                self.check_condition_name(value["Condition"], path + ["Condition"])
+                return
+            for key, item in value.items():
+                self.check_condition_references(item, path + [key])
+
+    def walk(self, value, path, owner):
+        """
+        Checks the intrinsic functions in a value, recording references of owner.
+        """
+        if isinstance(value, list):
+            for idx, item in enumerate(value):
+                self.walk(item, path + [idx], owner)
+            return
+        if not isinstance(value, dict):
+            return
+
+        function = _intrinsic_name(value)
+        if function is None:
+            for key, item in value.items():
+                # Transforms (e.g. AWS::LanguageExtensions) add their own functions
+                if str(key).startswith("Fn::") and not self.transforms:
+                    self.error("intrinsic", path + [key], f"Unknown function {key}")
+                else:
+                    self.walk(item, path + [key], owner)
+            return
+
+        if len(value) != 1:
+            self.error(
+                "intrinsic",
+                path + [function],
+                f"{function} must be the only key of its mapping",
+            )
+        self.check_intrinsic(function, value[function], path + [function], owner)
+
+    def check_intrinsic(self, function, argument, path, owner):
+        arity = INTRINSIC_ARGUMENTS[function]
+        if arity is not None:
+            low, high = arity
+            if not isinstance(argument, list) or not low <= len(argument) <= high:
+                count = str(low) if low == high else f"{low} to {high}"
+                self.error(
+                    "intrinsic", path, f"{function} takes a list of {count} items"
+                )
+                return
+
+        if function == "Ref":
+            if not isinstance(argument, str):
+                self.error("intrinsic", path, "Ref takes a logical name")
+            else:
+                self.check_reference(argument, path, owner)
+            return
+
+        if function == "Fn::GetAtt":
+            self.check_get_att(argument, path, owner)
+            return
+
+        if function == "Fn::Sub":
+            self.check_sub(argument, path, owner)
+            return
+
+        if function == "Fn::If":
+            if not isinstance(argument[0], str):
+                self.error(
+                    "intrinsic", path + [0], "Fn::If takes a condition name first"
+                )
+            else:
+                self.check_condition_name(argument[0], path + [0])
+            for idx in (1, 2):
+                self.walk(argument[idx], path + [idx], owner)
+            return
+
+        if function == "Fn::FindInMap":
+            map_name = argument[0]
+            if isinstance(map_name, str) and map_name not in self.mappings:
+                self.error(
+                    "reference", path + [0], f"Mapping {map_name} is not defined"
+                )
+
+        if function == "Fn::Join" and not isinstance(argument[0], str):
+            self.error(
+                "intrinsic", path + [0], "Fn::Join takes a delimiter string first"
+            )
+
+        if function == "Fn::Split" and not isinstance(argument[0], str):
+            self.error(
+                "intrinsic", path + [0], "Fn::Split takes a delimiter string first"
+            )
+
+        if function in ("Fn::Join", "Fn::Select") and not isinstance(
+            argument[1], (list, dict)
+        ):
+            self.error("intrinsic", path + [1], f"{function} takes a list second")
+
+        self.walk(argument, path, owner)
+
+    def check_reference(self, name, path, owner):
+        if name in self.parameters or name in PSEUDO_PARAMETERS:
+            return
+        if name in self.resources:
+            if owner is not None:
+                self.dependencies[owner].add(name)
+            return
+        self.error(
+            "reference", path, f"Ref target {name} is not a parameter or resource"
+        )
+
+    def check_get_att(self, argument, path, owner):
+        if isinstance(argument, str):
+            argument = argument.split(".", 1)
+        if not isinstance(argument, list) or len(argument) != 2:
+            self.error("intrinsic", path, "Fn::GetAtt takes [resource, attribute]")
+            return
+
+        name, attribute = argument
+        if not isinstance(name, str):
+            self.error("intrinsic", path, "Fn::GetAtt takes a resource name first")
+            return
+        if name not in self.resources:
+            self.error("reference", path, f"Fn::GetAtt target {name} is not a resource")
+            return
+        if owner is not None:
+            self.dependencies[owner].add(name)
+
+        if isinstance(attribute, str):
+            self.check_attribute(name, attribute, path)
+        else:
+            self.walk(attribute, path + [1], owner)
+
+    def check_attribute(self, name, attribute, path):
+        resource = self.resources[name]
+        resource_type = resource.get("Type") if isinstance(resource, dict) else None
+        if not isinstance(resource_type, str) or _is_unchecked_type(
+            resource_type, self.transforms
+        ):
+            return
+        spec = get_resource_spec().get(resource_type)
+        if spec is None:
+            return
+        if attribute in spec["attributes"]:
+            return
+        if any(
+            re.fullmatch(pattern, attribute)
+            for pattern in spec.get("attribute_patterns", [])
+        ):
+            return
+        self.error(
+            "attribute",
+            path,
+            f"{resource_type} {name} has no attribute {attribute}",
+        )
+
+    def check_sub(self, argument, path, owner):
+        variables = dict()
+        if isinstance(argument, list):
+            if len(argument) != 2 or not isinstance(argument[1], dict):
+                self.error(
+                    "intrinsic", path, "Fn::Sub takes a string or [string, mapping]"
+                )
+                return
+            argument, variables = argument
+            self.walk(variables, path + [1], owner)
+        if isinstance(argument, dict):
+            self.walk(argument, path, owner)
+            return
+        if not isinstance(argument, str):
+            self.error("intrinsic", path, "Fn::Sub takes a string or [string, mapping]")
+            return
+
+        for variable in _SUB_VARIABLE.findall(argument):
+            variable = variable.strip()
+            if variable in variables:
+                continue
+            if "." in variable and variable not in PSEUDO_PARAMETERS:
+                name, attribute = variable.split(".", 1)
+                if name in self.resources:
+                    if owner is not None:
+                        self.dependencies[owner].add(name)
+                    self.check_attribute(name, attribute, path)
+                    continue
+            self.check_reference(variable, path, owner)
+
+    def check_cycles(self):
+        """
+        Reports each dependency cycle between resources once.
+        """
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = {name: WHITE for name in self.dependencies}
+        stack = list()
+
+        def visit(name):
+            color[name] = GREY
+            stack.append(name)
+            for target in sorted(self.dependencies[name]):
+                if color[target] == GREY:
+                    cycle = stack[stack.index(target) :] + [target]
+                    self.error(
+                        "cycle",
+                        ["Resources", target],
+                        f"Circular dependency {' -> '.join(cycle)}",
+                    )
+                elif color[target] == WHITE:
+                    visit(target)
+            stack.pop()
+            color[name] = BLACK
+
+        for name in self.dependencies:
+            if color[name] == WHITE:
+                visit(name)
+
+
+_SHAPE_NAMES = {"scalar": "single value", "array": "list", "object": "mapping"}
+
+
+def _intrinsic_name(value):
+    """
+    Returns the intrinsic function of a mapping, None if it is not one.
+    """
+    if not isinstance(value, dict):
+        return None
+    for key in value:
+        if key in INTRINSIC_ARGUMENTS:
+            return key
+    return None
+
+
+def _matches_shape(value, shape):
+    """
+    Returns True if a property value can have the shape (intrinsics can have any).
+    """
+    if _intrinsic_name(value):
+        return True
+    if shape == "array":
+        return isinstance(value, list)
+    if shape == "object":
+        return isinstance(value, dict)
+    return not isinstance(value, (list, dict))
+
+
+def validate_template(template):
+    """
+    Validates a CloudFormation template locally.
+
+    Args:
+        template (str|dict): The CloudFormation template, JSON or YAML,
+            optionally in a code block, or as returned by parse_template.
+
+    Returns:
+        list: The TemplateErrors found, empty if the template is valid.
+    """
+    if isinstance(template, dict):
+        document = template
+    else:
+        try:
+            document = parse_template(template)
+        except ValueError as ex:
+            return [TemplateError("syntax", "", str(ex))]
+    if not isinstance(document, dict):
+        return [TemplateError("syntax", "", "Template must be a mapping")]
+
+    return _Validator(document).validate()
+
+
+def format_errors(errors):
+    """
+    Formats validation errors one per line, for the agent and the app.
+    """
+    return "\n".join(
+        f"{error.path}: {error.message}" if error.path else error.message
+        for error in errors
+    )
@@ -0,0 +1,190 @@
+"""
+Concurrent, ETag-validated download of the knowledge base example documents.
+
+retrieve_yaml used to download the documents of the METADATA item one after
+another with get_object(...).read(), on every action, although the corpus
+under data/ingest rarely changes. DocumentFetcher downloads them on a thread
+pool and keeps the bodies in a process-wide LRU keyed by bucket and key:
+
+- Within DocumentFreshSeconds of its last download or check, a document is
+  served from memory without any request.
+- After that it is revalidated with a conditional GET (IfNoneMatch with the
+  cached ETag). An unchanged object answers 304 without a body, so each
+  document is only downloaded once per container.
+
+This module only depends on botocore, so it is packaged with the action group
+Lambda.
+
+Usage:
+
+fetcher = DocumentFetcher(get_client=get_s3)
+
+# Bodies in the order of the locations, missing objects are skipped.
+documents = fetcher.fetch_all([("bucket", "data/Amazon VPC/example1.yaml"), ...])
+
+# Requests, downloads, 304s and memory hits so far.
+fetcher.stats()
+"""
+
+from botocore.exceptions import ClientError
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+import threading
+import time
+
+# Concurrent downloads, also the connection pool size of the S3 client.
+DOCUMENT_FETCH_WORKERS = int(os.environ.get("DocumentFetchWorkers", "8"))
+# Bytes of document bodies kept per container.
+DOCUMENT_CACHE_MAX_BYTES = int(
+    os.environ.get("DocumentCacheMaxBytes", str(64 * 1024 * 1024))
+)
+# Seconds a document is served without revalidating its ETag.
+DOCUMENT_FRESH_SECONDS = float(os.environ.get("DocumentFreshSeconds", "60"))
+
+
+def is_not_modified(ex):
+    """
+    Returns True if a conditional GET answered 304 Not Modified.
+    """
+    if not isinstance(ex, ClientError):
+        return False
+    code = ex.response.get("Error", {}).get("Code")
+    status = ex.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in ("304", "NotModified") or status == 304
+
+
+class DocumentFetcher:
+    """
+    Downloads S3 objects concurrently into a size-bounded, ETag-validated LRU.
+    """
+
+    def __init__(
+        self,
+        get_client,
+        workers=DOCUMENT_FETCH_WORKERS,
+        max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+        fresh_seconds=DOCUMENT_FRESH_SECONDS,
+    ):
+        self._get_client = get_client
+        self._workers = workers
+        self._max_bytes = max_bytes
+        self._fresh_seconds = fresh_seconds
+        self._lock = threading.Lock()
+        self._executor = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {
+            "requests": 0,
+            "downloads": 0,
+            "not_modified": 0,
+            "memory_hits": 0,
+            "errors": 0,
+        }
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def _cached(self, location):
+        with self._lock:
+            entry = self._entries.get(location)
+            if entry is not None:
+                self._entries.move_to_end(location)
+            return entry
+
+    def _store(self, location, etag, body):
+        with self._lock:
+            previous = self._entries.pop(location, None)
+            if previous is not None:
+                self._bytes -= previous["size"]
+            self._entries[location] = {
+                "etag": etag,
+                "body": body,
+                "size": len(body.encode()),
+                "checked": time.monotonic(),
+            }
+            self._bytes += self._entries[location]["size"]
+            while len(self._entries) > 1 and self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+
+    def _forget(self, location):
+        with self._lock:
+            entry = self._entries.pop(location, None)
+            if entry is not None:
+                self._bytes -= entry["size"]
+
+    def fetch(self, bucket, key):
+        """
+        Returns the body of an object as text, None if it cannot be read.
+        """
+        location = (bucket, key)
+        entry = self._cached(location)
+        if (
+            entry is not None
+            and time.monotonic() - entry["checked"] < self._fresh_seconds
+        ):
+            self._count("memory_hits")
+            return entry["body"]
+
+        request = {"Bucket": bucket, "Key": key}
+        if entry is not None:
+            request["IfNoneMatch"] = entry["etag"]
+
+        self._count("requests")
+        try:
+            response = self._get_client().get_object(**request)
+        except ClientError as e:
+            if entry is not None and is_not_modified(e):
+                self._count("not_modified")
+                entry["checked"] = time.monotonic()
+                return entry["body"]
+
+            self._count("errors")
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                print("The specified object does not exist.")
+                self._forget(location)
+                return None
+            print(f"An error occurred: {e}")
+            # A document that was readable before is still a good example
+            return entry["body"] if entry is not None else None
+
+        body = response["Body"].read().decode("utf-8")
+        self._count("downloads")
+        self._store(location, response.get("ETag"), body)
+        return body
+
+    def fetch_all(self, locations):
+        """
+        Fetches several objects concurrently.
+
+        Args:
+            locations (list): (bucket, key) tuples.
+
+        Returns:
+            list: The bodies in the order of the locations, without the objects that could not be read.
+        """
+        if len(locations) <= 1:
+            bodies = [self.fetch(bucket, key) for bucket, key in locations]
+        else:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._workers)
+            bodies = list(
+                self._executor.map(lambda location: self.fetch(*location), locations)
+            )
+        return [body for body in bodies if body is not None]
+
+    def stats(self):
+        """
+        Returns the request counters and the cached documents and bytes.
+        """
+        with self._lock:
+            return {
+                **self._stats,
+                "documents": len(self._entries),
+                "bytes": self._bytes,
+            }
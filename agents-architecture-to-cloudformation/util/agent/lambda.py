@@ -1,809 +1,1163 @@
-import sys
-from pip._internal import main
-
-main(
-    [
-        "install",
-        "-I",
-        "-q",
-        "boto3",
-        "--target",
-        "/tmp/",
-        "--no-cache-dir",
-        "--disable-pip-version-check",
-    ]
-)
-sys.path.insert(0, "/tmp/")
-
-from botocore.exceptions import ClientError, ValidationError
-from boto3.session import Session
-from botocore.config import Config
-
-import generateCloudFormationPrompt, reiterateCloudFormationPrompt, resolveErrorPrompt, updateInstructionPrompt, sys_generateCloudFormationPrompt, sys_reiterateCloudFormationPrompt, sys_resolveErrorPrompt, sys_updateInstructionPrompt
-
-import random
-import time
-import os
-import datetime
-
-KnowledgeBaseId = os.environ["KnowledgeBaseId"]
-EnvironmentName = os.environ["EnvironmentName"]
-BedrockModelId = os.environ["BedrockModelId"]
-
-bedrock = Session().client(
-    "bedrock-runtime", config=Config(read_timeout=600, connect_timeout=600)
-)
-cfn = Session().client("cloudformation")
-bedrock_agent = Session().client("bedrock-agent-runtime")
-s3 = Session().client("s3")
-table = Session().resource("dynamodb").Table(f"templatestorage-atc-{EnvironmentName}")
-
-
-############################
-##### Invoke Bedrock ######
-##########################
-def invoke_model(modelId, system_prompt, messages):
-    """
-    Invokes Amazon Bedrock Foundational model.
-
-    Args:
-        modelId (str): The ID or name of the foundational model to be invoked.
-        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
-        messages (list): A list of messages or input data to be processed by the model.
-
-    Returns:
-        str: The response or output generated by the model.
-    """
-
-    response = bedrock.converse(
-        modelId=modelId,
-        messages=messages,
-        system=[{"text": system_prompt}],
-        inferenceConfig={"temperature": 0.2, "maxTokens": 4000},
-    )
-    return response["output"]["message"]["content"][0]["text"]
-
-
-def backoff_mechanism(func, modelId, system_prompt, messages):
-    """
-    Implements a backoff mechanism to handle throttling exceptions.
-
-    Args:
-        func (function): The function to be called with backoff.
-        modelId (str): The ID or name of the foundational model to be invoked.
-        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
-        messages (list): A list of messages or input data to be processed by the model.
-
-    Returns:
-        str: The response or output generated by the model.
-    """
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
-
-    delay = INITIAL_DELAY
-    retries = 0
-
-    while retries < MAX_RETRIES:
-        try:
-            return func(modelId=modelId, system_prompt=system_prompt, messages=messages)
-        except bedrock.exceptions.ThrottlingException as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
-
-    return False
-
-
-#########################
-##### Cache and KB #####
-#######################
-
-
-def put_validity_cloudformation(sessionId, template, is_valid):
-    """
-    Stores the validity of a CloudFormation template in DynamoDB.
-
-    Args:
-        sessionId (str): The ID of the session.
-        template (str): The CloudFormation template.
-        is_valid (bool): Whether the template is valid or not.
-
-    Returns:
-        bool: True if the validity is stored successfully, False otherwise.
-    """
-    try:
-        creationDate = str(
-            int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-        )
-        ttl = str(
-            int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-        )
-
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "v0"},
-            # Atomic counter is used to increment the latest version
-            UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valid = :is_valid",
-            ExpressionAttributeNames={
-                "#creationDate": "creationDate",
-                "#template": "template",
-                "#ttl": "ttl",
-                "#is_valid": "is_valid",
-            },
-            ExpressionAttributeValues={
-                ":creationDate": creationDate,
-                ":is_valid": is_valid,
-                ":template": template,
-                ":ttl": ttl,
-                ":defaultval": 0,
-                ":incrval": 1,
-            },
-            # return the affected attribute after the update
-            ReturnValues="UPDATED_NEW",
-        )
-
-        # Get the updated version
-        latest_version = response["Attributes"]["Latest"]
-
-        # Add the new item with the latest version
-        table.put_item(
-            Item={
-                "sessionId": sessionId,
-                "is_valid": is_valid,
-                "version": "v" + str(latest_version),
-                "creationDate": creationDate,
-                "template": template,
-                "ttl": ttl,
-            }
-        )
-    except Exception as ex:
-        print(f"Error at put_generated_cloudformation {ex}")
-        return False
-    else:
-        return True
-
-
-def put_generated_cloudformation(sessionId, template):
-    """
-    Stores the generated CloudFormation template in DynamoDB.
-
-    Args:
-        sessionId (str): The ID of the session.
-        template (str): The generated CloudFormation template.
-
-    Returns:
-        bool: True if the template is stored successfully, False otherwise.
-    """
-    try:
-        creationDate = str(
-            int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-        )
-        ttl = str(
-            int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-        )
-
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "v0"},
-            # Atomic counter is used to increment the latest version
-            UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valud = :is_valid",
-            ExpressionAttributeNames={
-                "#creationDate": "creationDate",
-                "#template": "template",
-                "#ttl": "ttl",
-                "#is_valud": "is_valid",
-            },
-            ExpressionAttributeValues={
-                ":creationDate": creationDate,
-                ":template": template,
-                ":ttl": ttl,
-                ":defaultval": 0,
-                ":incrval": 1,
-                ":is_valid": None,
-            },
-            # return the affected attribute after the update
-            ReturnValues="UPDATED_NEW",
-        )
-
-        # Get the updated version
-        latest_version = response["Attributes"]["Latest"]
-
-        # Add the new item with the latest version
-        table.put_item(
-            Item={
-                "sessionId": sessionId,
-                "version": "v" + str(latest_version),
-                "creationDate": creationDate,
-                "template": template,
-                "ttl": ttl,
-            }
-        )
-    except Exception as ex:
-        print(f"Error at put_generated_cloudformation {ex}")
-        return False
-    else:
-        return True
-
-
-def get_generated_cloudformation(sessionId, version="v0"):
-    """
-    Retrieves the generated CloudFormation template from DynamoDB.
-
-    Args:
-        sessionId (str): The ID of the session.
-        version (str): The version of the template to retrieve.
-
-    Returns:
-        str: The generated CloudFormation template.
-    """
-    return table.get_item(Key={"sessionId": sessionId, "version": version})["Item"][
-        "template"
-    ]
-
-
-def get_kb_yaml(sessionId, version="METADATA"):
-    """
-    Retrieves the YAML metadata from DynamoDB.
-
-    Args:
-        sessionId (str): The ID of the session.
-        version (str): The version of the metadata to retrieve.
-
-    Returns:
-        dict: The YAML metadata.
-    """
-    return table.get_item(Key={"sessionId": sessionId, "version": version})
-
-
-def retrieve_relevant_documents(sessionId, query):
-    """
-    Retrieves relevant documents from the knowledge base.
-
-    Args:
-        sessionId (str): The ID of the session.
-        query (str): The query to search for relevant documents.
-
-    Returns:
-        dict: The relevant documents.
-    """
-    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
-    ttl = str(
-        int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
-    )
-
-    relevant_documents = bedrock_agent.retrieve(
-        retrievalQuery={"text": get_summary_document(query)},
-        knowledgeBaseId=KnowledgeBaseId,
-        retrievalConfiguration={
-            "vectorSearchConfiguration": {
-                "numberOfResults": 3,
-                "overrideSearchType": "HYBRID",
-            }
-        },
-    )
-
-    for idx, metadata in enumerate(
-        [result["metadata"] for result in relevant_documents["retrievalResults"]]
-    ):
-
-        response = table.update_item(
-            Key={"sessionId": sessionId, "version": "METADATA"},
-            UpdateExpression=f"SET #document{idx} = :document{idx}, #creationDate = :creationDate, #ttl = :ttl",
-            ExpressionAttributeNames={
-                f"#document{idx}": f"document{idx}",
-                "#creationDate": "creationDate",
-                "#ttl": "ttl",
-            },
-            ExpressionAttributeValues={
-                f":document{idx}": metadata,
-                ":creationDate": creationDate,
-                ":ttl": ttl,
-            },
-            # return the affected attribute after the update
-            ReturnValues="ALL_NEW",
-        )
-    return response["Attributes"]
-
-
-def retrieve_yaml(sessionId, query=None):
-    """
-    Retrieves the yaml from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
-
-    Args:
-        sessionId (str): The ID of the session.
-        query (str): The query to search for relevant documents.
-
-    Returns:
-        dict: The YAML metadata.
-    """
-    response = get_kb_yaml(sessionId=sessionId, version="METADATA")
-
-    if "Item" in response:
-        relevant_documents = response["Item"]
-        print(f"Found item in dynamodb {sessionId}")
-    else:
-        print(f"Item with key {sessionId} not found.")
-        relevant_documents = retrieve_relevant_documents(
-            sessionId=sessionId, query=query
-        )
-
-    documents = list()
-
-    for docs in [v for k, v in relevant_documents.items() if "document" in k]:
-        bucket, key = docs["cfn_stack"].replace("s3://", "").split("/", 1)
-
-        try:
-            # Retrieve the object contents
-            response = s3.get_object(Bucket=bucket, Key=key)
-            contents = response["Body"].read().decode("utf-8")
-            documents.append(contents)
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "NoSuchKey":
-                print("The specified object does not exist.")
-            else:
-                print(f"An error occurred: {e}")
-
-    return documents
-
-
-###############################
-##### Utility Functions  #####
-#############################
-
-
-def get_summary_document(explain):
-    """
-    Generating an explanation with less than 1000 characters to accommodate the character limit for the knowledge base query.
-
-    Args:
-        explain (str): Current architecture explanation recieved from the streamlit app.
-
-    Returns:
-        str: New architecture explanation with less than 1000 characters.
-    """
-    _system_prompt = """
-        List all the AWS Services in the document. Do output anything else.
-    """
-    _prompt = f"""
-        <document>
-        {explain}
-        </document>
-
-    """
-    _messages = [{"role": "user", "content": [{"text": _prompt}]}]
-    # func, modelId, system_prompt, messages
-    return backoff_mechanism(
-        func=invoke_model,
-        modelId=BedrockModelId,
-        system_prompt=_system_prompt,
-        messages=_messages,
-    )
-
-
-#########################
-##### Generate CFN #####
-#######################
-
-
-def generate_cloudformation(architectureExplanation, sessionId):
-    """
-    Generates a CloudFormation template from an architecture explanation. Stores this generated template in DynamoDB.
-
-    Args:
-        event (dict): The event data.
-
-    Returns:
-        bool: Indicating if the template was generated successfully.
-    """
-    try:
-
-        documents = retrieve_yaml(sessionId=sessionId, query=architectureExplanation)
-
-        _system_prompt = sys_generateCloudFormationPrompt.SYS_GENERATE_CLOUDFORMATION_PROMPT
-
-        _prompt = generateCloudFormationPrompt.GENERATE_CLOUDFORMATION_PROMPT.replace("{{architectureExplanation}}", architectureExplanation)
-        
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
-        )
-        _messages = message_document
-    except Exception as ex:
-        return False, ex
-    else:
-        # func, modelId, system_prompt, messages
-        generated_cloudformation_stack = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
-
-        if not generated_cloudformation_stack:
-            return False, f"Bedrock call was unsuccessful"
-
-        if put_generated_cloudformation(
-            sessionId=sessionId, template=generated_cloudformation_stack
-        ):
-            return True, {"CloudformationTemplate": True}
-        else:
-            return False, f"Template storage unsuccessful"
-
-
-#########################
-##### Validate CFN #####
-#######################
-
-
-def validate_cloudformtaion(sessionId):
-    """
-    Validates the CloudFormation template stored in version vo (latest) in DynamoDB.
-
-    Args:
-        event (dict): The event data.
-
-    Returns:
-        dict: {"isValid": True/False, "error": Error Message}
-    """
-    try:
-        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
-    except Exception as ex:
-        return False, ex
-
-    validation_errors = str()
-    try:
-        response = cfn.validate_template(
-            TemplateBody=cloudformationTemplate,
-        )
-    except Exception as ex:
-        print(f"Cloudformation template invalid: {ex}")
-        validation_errors = f"Cloudformation template invalid: {ex}"
-        is_valid = False
-    else:
-        is_valid = True
-        print("Cloudformation valid")
-
-    if put_validity_cloudformation(
-        sessionId=sessionId, template=cloudformationTemplate, is_valid=is_valid
-    ):
-        return True, {"isValid": is_valid, "error": str(validation_errors)}
-    else:
-        return False, f"Template storage unsuccessful"
-
-
-##########################
-##### Reiterate CFN #####
-########################
-
-
-def reiterate_cloudformation(sessionId):
-    """
-    Reiterates the CloudFormation template stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
-
-    Args:
-        event (dict): The event data.
-
-    Returns:
-        bool: Indicating if the template was generated successfully.
-    """
-    try:
-
-        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
-
-        documents = retrieve_yaml(
-            sessionId=sessionId,
-        )
-        _system_prompt = sys_reiterateCloudFormationPrompt.SYS_REITERATE_CLOUDFORMATION_PROMPT
-        _prompt = reiterateCloudFormationPrompt.REITERATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate)
-
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
-        )
-        _messages = message_document
-    except Exception as ex:
-        return False, ex
-    else:
-        # func, modelId, system_prompt, messages
-
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
-        if not updated_cloudformation:
-            return False, f"Bedrock call was unsuccessful"
-
-        if put_generated_cloudformation(
-            sessionId=sessionId, template=updated_cloudformation
-        ):
-            return True, {"reiteratedCloudformationTemplate": True}
-        else:
-            return False, "Template storage unsuccessful"
-
-
-#######################
-##### Update CFN #####
-#####################
-
-
-def update_cloudformation(updateInstruction, sessionId):
-    """
-    Updates the CloudFormation template stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
-
-    Args:
-        event (dict): The event data.
-
-    Returns:
-        bool: Indicating if the template was generated successfully.
-    """
-    try:
-
-        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
-
-        documents = retrieve_yaml(sessionId=sessionId, query=None)
-
-        _system_prompt = sys_updateInstructionPrompt.SYS_UPDATE_CLOUDFORMATION_PROMPT
-        
-        _prompt = updateInstructionPrompt.UPDATE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{updateInstruction}}", updateInstruction)
-        
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
-        )
-        _messages = message_document
-    except Exception as ex:
-        return False, ex
-    else:
-
-        # func, modelId, system_prompt, messages
-
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
-        if not updated_cloudformation:
-            return False, "Bedrock call was unsuccessful"
-
-        if put_generated_cloudformation(
-            sessionId=sessionId, template=updated_cloudformation
-        ):
-            return True, {"updatedCloudformationTemplate": True}
-        else:
-            return False, "Template storage unsuccessful"
-
-
-##########################
-##### Resolve Error #####
-########################
-
-
-def resolve_cloudformation(cloudformationInstruction, sessionId):
-    """
-    Resolves the error message stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
-
-    Args:
-        event (dict): The event data.
-
-    Returns:
-        bool: Indicating if the template was generated successfully.
-    """
-    try:
-
-        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
-
-        documents = retrieve_yaml(sessionId=sessionId, query=None)
-        _system_prompt = sys_resolveErrorPrompt.SYS_RESOLVE_CLOUDFORMATION_PROMPT
-
-        _prompt = resolveErrorPrompt.RESOLVE_CLOUDFORMATION_PROMPT.replace("{{cloudformationTemplate}}", cloudformationTemplate).replace("{{cloudformationInstruction}}", cloudformationInstruction)
-
-        message_document = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
-                            <example{idx}>
-                                {document}
-                            </example{idx}>
-                            """,
-                    }
-                    for idx, document in enumerate(documents)
-                ],
-            }
-        ]
-
-        message_document[0]["content"].append(
-            {
-                "text": _prompt,
-            },
-        )
-        _messages = message_document
-    except Exception as ex:
-        return False, ex
-    else:
-        # func, modelId, system_prompt, messages
-
-        updated_cloudformation = backoff_mechanism(
-            func=invoke_model,
-            modelId=BedrockModelId,
-            system_prompt=_system_prompt,
-            messages=_messages,
-        )
-        if not updated_cloudformation:
-            return False, "Bedrock call was unsuccessful"
-        if put_generated_cloudformation(
-            sessionId=sessionId, template=updated_cloudformation
-        ):
-            return True, {"updatedCloudformationTemplate": True}
-        else:
-            return False, "Template storage unsuccessful"
-
-
-###########################
-##### Lambda Handler #####
-#########################
-
-
-def lambda_handler(event, context):
-    print(event)
-
-    response_code = 200
-    action_group = event["actionGroup"]
-    api_path = event["apiPath"]
-    http_method = event["httpMethod"]
-    parameters = event.get("parameters", [])
-    session_attributes = event.get("sessionAttributes", {})
-    validate_counter = int(session_attributes.get("validate_counter", ""))
-
-    architectureExplanation, updateInstruction, cloudformationInstruction = (
-        None,
-        None,
-        None,
-    )
-
-    if validate_counter == 0 or validate_counter == 1:
-
-        if api_path == "/generateCloudFormation":
-
-            for param in parameters:
-                if param["name"] == "architectureExplanation":
-                    architectureExplanation = param["value"]
-
-            if not architectureExplanation:
-                valid, result = (
-                    False,
-                    "Missing mandatory parameter: architectureExplanation",
-                )
-            else:
-                valid, result = generate_cloudformation(
-                    architectureExplanation=architectureExplanation,
-                    sessionId=event["sessionId"],
-                )
-
-        elif api_path == "/validateCloudFormation":
-            validate_counter += 1
-
-            valid, result = validate_cloudformtaion(sessionId=event["sessionId"])
-
-        elif api_path == "/reiterateCloudFormation":
-
-            valid, result = reiterate_cloudformation(
-                sessionId=event["sessionId"],
-            )
-
-        elif api_path == "/updateCloudFormation":
-
-            for param in parameters:
-                if param["name"] == "updateInstruction":
-                    updateInstruction = param["value"]
-
-            if not updateInstruction:
-                valid, result = False, "Missing mandatory parameter: updateInstruction"
-            else:
-                valid, result = update_cloudformation(
-                    updateInstruction=updateInstruction,
-                    sessionId=event["sessionId"],
-                )
-        elif api_path == "/resolveCloudFormation":
-            for param in parameters:
-                if param["name"] == "cloudformationInstruction":
-                    cloudformationInstruction = param["value"]
-
-            if not cloudformationInstruction:
-                valid, result = (
-                    False,
-                    "Missing mandatory parameter: cloudformationInstruction",
-                )
-            else:
-                valid, result = resolve_cloudformation(
-                    cloudformationInstruction=cloudformationInstruction,
-                    sessionId=event["sessionId"],
-                )
-        else:
-            valid, result = False, f"Unrecognized api path: {action_group}::{api_path}"
-    else:
-        response_code = 423
-        valid, result = (
-            True,
-            f"/validateCloudFormation has been called twice returning control",
-        )
-
-    if not valid:
-        response_code = 404
-        response_body = {
-            "application/json": {
-                "body": {
-                    "error_message": f"Api path {action_group}::{api_path} returned an error: {result}"
-                }
-            }
-        }
-    else:
-        response_body = {"application/json": {"body": result}}
-
-    response = {
-        "actionGroup": action_group,
-        "apiPath": api_path,
-        "httpMethod": http_method,
-        "httpStatusCode": response_code,
-        "responseBody": response_body,
-        "sessionState": {
-            "sessionAttributes": {"validate_counter": str(validate_counter)},
-        },
-    }
-
-    api_response = {"messageVersion": "1.0", "response": response}
-    return api_response
+from botocore.exceptions import ClientError, ValidationError
+from boto3.dynamodb.types import TypeDeserializer
+from boto3.session import Session
+from botocore.config import Config
+
+import functools
+import importlib
+import os
+import datetime
+
+from cfn_validator import format_errors, get_resource_spec_source, validate_template
+from document_fetch import DOCUMENT_FETCH_WORKERS, DocumentFetcher
+from patching import PatchError, apply_patch, extract_code
+from retries import backoff_mechanism, deadline_in
+from service_extractor import extract_services, service_query
+from session_cache import SessionCache
+from template_store import (
+    TemplateCodec,
+    read_latest_version,
+    read_template_body,
+    read_template_state,
+    read_template_validity,
+    read_template_version,
+    template_hash,
+    write_template_validity,
+    write_template_version,
+)
+from validation_cache import ValidationCache, template_key
+
+KnowledgeBaseId = os.environ["KnowledgeBaseId"]
+EnvironmentName = os.environ["EnvironmentName"]
+BedrockModelId = os.environ["BedrockModelId"]
+# Update and resolve actions ask for edits instead of a full template
+PatchMode = os.environ.get("PatchMode", "false").lower() == "true"
+# Templates passing the local validation are also sent to ValidateTemplate
+RemoteValidation = os.environ.get("RemoteValidation", "false").lower() == "true"
+# Bucket large compressed templates are spilled to, under templates/
+TemplateBucket = os.environ.get("TemplateBucket")
+# Template writes are validated by stream_handler, the validate action reads the result
+EagerValidation = os.environ.get("EagerValidation", "true").lower() == "true"
+# Seconds kept free before the function timeout, no retry starts after that
+DeadlineMargin = float(os.environ.get("DeadlineMargin", "5"))
+
+# Deadline of the invocation being handled, set by lambda_handler
+request_deadline = None
+
+
+###########################
+##### Lazy Resources #####
+#########################
+# boto3 is packaged with the function (see util/agent/requirements.txt), and
+# clients are only built when an action first needs them, so a cold start
+# does not pay for clients or prompts the invoked action never uses.
+
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """
+    Returns the boto3 session shared by all clients of this container.
+    """
+    return Session()
+
+
+@functools.lru_cache(maxsize=None)
+def get_bedrock():
+    """
+    Returns the Amazon Bedrock runtime client, created on first use.
+    """
+    # Calls are retried by backoff_mechanism, not by botocore as well
+    return get_session().client(
+        "bedrock-runtime",
+        config=Config(
+            read_timeout=600,
+            connect_timeout=600,
+            retries={"total_max_attempts": 1},
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_cfn():
+    """
+    Returns the AWS CloudFormation client, created on first use.
+    """
+    return get_session().client("cloudformation")
+
+
+@functools.lru_cache(maxsize=None)
+def get_bedrock_agent():
+    """
+    Returns the Amazon Bedrock agent runtime client, created on first use.
+    """
+    return get_session().client("bedrock-agent-runtime")
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3():
+    """
+    Returns the Amazon S3 client, created on first use.
+    """
+    # One pooled connection per concurrent document download
+    return get_session().client(
+        "s3",
+        config=Config(
+            max_pool_connections=DOCUMENT_FETCH_WORKERS,
+            connect_timeout=5,
+            read_timeout=30,
+            retries={"mode": "standard", "max_attempts": 3},
+        ),
+    )
+
+
+# Knowledge base documents shared by all sessions of this container
+document_fetcher = DocumentFetcher(get_client=lambda: get_s3())
+
+
+# Compresses the templates stored in the table, large ones go to TemplateBucket
+template_codec = TemplateCodec(bucket=TemplateBucket, get_s3=lambda: get_s3())
+
+
+@functools.lru_cache(maxsize=None)
+def get_table():
+    """
+    Returns the template storage DynamoDB table, created on first use.
+    """
+    return (
+        get_session()
+        .resource("dynamodb")
+        .Table(f"templatestorage-atc-{EnvironmentName}")
+    )
+
+
+def load_prompt(module_name, prompt_name):
+    """
+    Imports a prompt template module on demand and returns one of its prompts.
+
+    Args:
+        module_name (str): The prompt template module packaged next to this file.
+        prompt_name (str): The name of the prompt constant in the module.
+
+    Returns:
+        str: The prompt template.
+    """
+    return getattr(importlib.import_module(module_name), prompt_name)
+
+
+############################
+##### Invoke Bedrock ######
+##########################
+def invoke_model(modelId, system_prompt, messages):
+    """
+    Invokes Amazon Bedrock Foundational model.
+
+    Args:
+        modelId (str): The ID or name of the foundational model to be invoked.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of messages or input data to be processed by the model.
+
+    Returns:
+        str: The response or output generated by the model.
+    """
+
+    response = get_bedrock().converse(
+        modelId=modelId,
+        messages=prepare_messages(modelId=modelId, messages=messages),
+        system=get_system_blocks(modelId=modelId, system_prompt=system_prompt),
+        inferenceConfig={"temperature": 0.2, "maxTokens": 4000},
+    )
+    record_cache_usage(modelId=modelId, usage=response.get("usage", {}))
+    return response["output"]["message"]["content"][0]["text"]
+
+
+##########################
+##### Prompt Caching #####
+########################
+# The system prompt and the knowledge base example documents are identical for
+# every action of a session. They are sent first, followed by a cachePoint, so
+# Amazon Bedrock can reuse the processed prefix instead of re-reading it.
+
+# Model ids (without cross-region prefix) that accept converse cachePoint blocks.
+PROMPT_CACHE_MODELS = (
+    "anthropic.claude-3-5-haiku-20241022-v1:0",
+    "anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "amazon.nova-micro-v1:0",
+    "amazon.nova-lite-v1:0",
+    "amazon.nova-pro-v1:0",
+)
+
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+cache_usage = {
+    "requests": 0,
+    "inputTokens": 0,
+    "cacheReadInputTokens": 0,
+    "cacheWriteInputTokens": 0,
+}
+
+
+def supports_prompt_cache(modelId):
+    """
+    Returns True if the model accepts cachePoint blocks.
+
+    Args:
+        modelId (str): The model id or cross-region inference profile id.
+    """
+    base_model_id = modelId.split(".", 1)[1] if modelId.count(".") > 1 else modelId
+    return base_model_id.startswith(PROMPT_CACHE_MODELS)
+
+
+def get_system_blocks(modelId, system_prompt):
+    """
+    Returns the converse system blocks, with a cachePoint after the system prompt if supported.
+    """
+    system = [{"text": system_prompt}]
+    if supports_prompt_cache(modelId):
+        system.append(CACHE_POINT)
+    return system
+
+
+def prepare_messages(modelId, messages):
+    """
+    Removes cachePoint blocks from the messages if the model does not support them.
+    The given messages are not modified.
+    """
+    if supports_prompt_cache(modelId):
+        return messages
+
+    return [
+        {
+            **message,
+            "content": [
+                block for block in message["content"] if "cachePoint" not in block
+            ],
+        }
+        for message in messages
+    ]
+
+
+def get_document_messages(documents, prompt):
+    """
+    Builds the user message with the example documents as a cacheable prefix.
+
+    Args:
+        documents (list): Example CloudFormation templates from the knowledge base.
+        prompt (str): The action prompt, sent after the cachePoint.
+
+    Returns:
+        list: The messages for the converse API.
+    """
+    content = [
+        {
+            "text": f"""Take this example CloudFormation YAML code as a refernce <example{idx}></example{idx}>:
+                            <example{idx}>
+                                {document}
+                            </example{idx}>
+                            """,
+        }
+        for idx, document in enumerate(documents)
+    ]
+    if content:
+        content.append(CACHE_POINT)
+    content.append({"text": prompt})
+
+    return [{"role": "user", "content": content}]
+
+
+def record_cache_usage(modelId, usage):
+    """
+    Adds the token usage of a converse response to the container totals and logs it.
+    """
+    cache_usage["requests"] += 1
+    for key in ("inputTokens", "cacheReadInputTokens", "cacheWriteInputTokens"):
+        cache_usage[key] += usage.get(key, 0)
+
+    print(
+        f"Prompt cache {modelId}: read={usage.get('cacheReadInputTokens', 0)} "
+        f"write={usage.get('cacheWriteInputTokens', 0)} "
+        f"input={usage.get('inputTokens', 0)} totals={cache_usage}"
+    )
+
+
+#########################
+##### Cache and KB #####
+#######################
+
+
+# Latest version counter last read or written per session, so a save knows the
+# next version number without reading "v0" first
+session_latest = dict()
+SESSION_LATEST_MAX_ENTRIES = 1024
+# Hash of the template held by the "v0" head per session, so saving it
+# unchanged only writes a version reference
+session_template_hash = dict()
+
+
+# Templates and example documents of the sessions served by this container,
+# reused by the following actions while the template version is still Latest
+session_cache = SessionCache()
+
+# Validation results by canonical template, shared by all sessions, and with
+# the other containers when the slower remote validation is enabled
+validation_cache = ValidationCache(
+    get_table=lambda: get_table(), shared=RemoteValidation
+)
+
+
+def remember_latest(sessionId, latest, body_hash=None):
+    """
+    Records the Latest version counter of a session and the hash of its
+    template, evicting the oldest sessions.
+    """
+    session_latest.pop(sessionId, None)
+    session_latest[sessionId] = int(latest)
+    session_template_hash[sessionId] = body_hash
+    while len(session_latest) > SESSION_LATEST_MAX_ENTRIES:
+        evicted = next(iter(session_latest))
+        session_latest.pop(evicted)
+        session_template_hash.pop(evicted, None)
+
+
+def put_validity_cloudformation(sessionId, version, is_valid, error=""):
+    """
+    Stores the validity of a CloudFormation template version in DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+        version (int): The version of the validated template.
+        is_valid (bool): Whether the template is valid or not.
+        error (str): The validation error message.
+
+    Returns:
+        bool: True if the validity is stored successfully, False otherwise.
+    """
+    try:
+        # A small update of "v0": no template rewrite and no new version
+        return write_template_validity(
+            table=get_table(),
+            sessionId=sessionId,
+            version=version,
+            is_valid=is_valid,
+            error=error,
+        )
+    except Exception as ex:
+        print(f"Error at put_validity_cloudformation {ex}")
+        return False
+
+
+def put_generated_cloudformation(sessionId, template):
+    """
+    Stores the generated CloudFormation template in DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+        template (str): The generated CloudFormation template.
+
+    Returns:
+        bool: True if the template is stored successfully, False otherwise.
+    """
+    try:
+        # One transaction writes the body, the version and the "v0" head pointing
+        # to it. An unchanged template only adds a version reference
+        latest = write_template_version(
+            table=get_table(),
+            sessionId=sessionId,
+            template=template,
+            expected_latest=session_latest.get(sessionId),
+            codec=template_codec,
+            expected_hash=session_template_hash.get(sessionId),
+        )
+        remember_latest(sessionId, latest, template_hash(template))
+        session_cache.put_template(sessionId, latest, template)
+    except Exception as ex:
+        print(f"Error at put_generated_cloudformation {ex}")
+        return False
+    else:
+        return True
+
+
+def get_template_version(sessionId):
+    """
+    Retrieves the latest CloudFormation template and its version, from the
+    session cache if it still holds the Latest version, else from DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+
+    Returns:
+        tuple: The template and its version number.
+    """
+    latest = None
+    if session_cache.has_template(sessionId):
+        # Only the Latest counter is read to check the cached template
+        latest = read_latest_version(get_table(), sessionId)
+    template = session_cache.get_template(sessionId, latest)
+    if template is not None:
+        remember_latest(sessionId, latest, template_hash(template))
+        return template, latest
+
+    # The "v0" head points to the body of the Latest version
+    state = read_template_state(get_table(), sessionId, codec=template_codec)
+    if state["template"] is None:
+        raise KeyError(f"No template stored for {sessionId}")
+    remember_latest(sessionId, state["Latest"], state["template_hash"])
+    session_cache.put_template(sessionId, state["Latest"], state["template"])
+    return state["template"], state["Latest"]
+
+
+def get_generated_cloudformation(sessionId, version="v0"):
+    """
+    Retrieves the generated CloudFormation template from DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+        version (str): The version of the template to retrieve.
+
+    Returns:
+        str: The generated CloudFormation template.
+    """
+    if version == "v0":
+        return get_template_version(sessionId=sessionId)[0]
+    # Versions reference their body by hash
+    return read_template_version(get_table(), sessionId, version, codec=template_codec)
+
+
+def get_kb_yaml(sessionId, version="METADATA"):
+    """
+    Retrieves the YAML metadata from DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+        version (str): The version of the metadata to retrieve.
+
+    Returns:
+        dict: The YAML metadata.
+    """
+    return get_table().get_item(Key={"sessionId": sessionId, "version": version})
+
+
+def retrieve_relevant_documents(sessionId, query):
+    """
+    Retrieves relevant documents from the knowledge base.
+
+    Args:
+        sessionId (str): The ID of the session.
+        query (str): The query to search for relevant documents.
+
+    Returns:
+        dict: The relevant documents.
+    """
+    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
+    ttl = str(
+        int((datetime.datetime.now() + datetime.timedelta(seconds=900)).timestamp())
+    )
+
+    relevant_documents = get_bedrock_agent().retrieve(
+        retrievalQuery={"text": get_summary_document(query)},
+        knowledgeBaseId=KnowledgeBaseId,
+        retrievalConfiguration={
+            "vectorSearchConfiguration": {
+                "numberOfResults": 3,
+                "overrideSearchType": "HYBRID",
+            }
+        },
+    )
+
+    for idx, metadata in enumerate(
+        [result["metadata"] for result in relevant_documents["retrievalResults"]]
+    ):
+
+        response = get_table().update_item(
+            Key={"sessionId": sessionId, "version": "METADATA"},
+            UpdateExpression=f"SET #document{idx} = :document{idx}, #creationDate = :creationDate, #ttl = :ttl",
+            ExpressionAttributeNames={
+                f"#document{idx}": f"document{idx}",
+                "#creationDate": "creationDate",
+                "#ttl": "ttl",
+            },
+            ExpressionAttributeValues={
+                f":document{idx}": metadata,
+                ":creationDate": creationDate,
+                ":ttl": ttl,
+            },
+            # return the affected attribute after the update
+            ReturnValues="ALL_NEW",
+        )
+    return response["Attributes"]
+
+
+def retrieve_yaml(sessionId, query=None):
+    """
+    Retrieves the yaml from the session cache, from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
+
+    Args:
+        sessionId (str): The ID of the session.
+        query (str): The query to search for relevant documents.
+
+    Returns:
+        list: The example documents.
+    """
+    documents = session_cache.get_documents(sessionId)
+    if documents is not None:
+        return documents
+
+    response = get_kb_yaml(sessionId=sessionId, version="METADATA")
+
+    if "Item" in response:
+        relevant_documents = response["Item"]
+        print(f"Found item in dynamodb {sessionId}")
+    else:
+        print(f"Item with key {sessionId} not found.")
+        relevant_documents = retrieve_relevant_documents(
+            sessionId=sessionId, query=query
+        )
+
+    locations = [
+        tuple(docs["cfn_stack"].replace("s3://", "").split("/", 1))
+        for k, docs in relevant_documents.items()
+        if "document" in k
+    ]
+    # Downloaded concurrently, unchanged documents come from memory
+    documents = document_fetcher.fetch_all(locations)
+    print(f"Document fetch {document_fetcher.stats()}")
+
+    session_cache.put_documents(sessionId, documents)
+    return documents
+
+
+###############################
+##### Utility Functions  #####
+#############################
+
+
+def get_summary_document(explain):
+    """
+    Generating an explanation with less than 1000 characters to accommodate the character limit for the knowledge base query.
+    The AWS services named in the explanation are matched locally, the model is only asked if none is found.
+
+    Args:
+        explain (str): Current architecture explanation recieved from the streamlit app.
+
+    Returns:
+        str: New architecture explanation with less than 1000 characters.
+    """
+    services = extract_services(explain)
+    if services:
+        print(f"Knowledge base query services {services}")
+        return service_query(services)
+
+    _system_prompt = """
+        List all the AWS Services in the document. Do output anything else.
+    """
+    _prompt = f"""
+        <document>
+        {explain}
+        </document>
+
+    """
+    _messages = [{"role": "user", "content": [{"text": _prompt}]}]
+    # func, modelId, system_prompt, messages
+    return backoff_mechanism(
+        func=invoke_model,
+        deadline=request_deadline,
+        modelId=BedrockModelId,
+        system_prompt=_system_prompt,
+        messages=_messages,
+    )
+
+
+#########################
+##### Generate CFN #####
+#######################
+
+
+def generate_cloudformation(architectureExplanation, sessionId):
+    """
+    Generates a CloudFormation template from an architecture explanation. Stores this generated template in DynamoDB.
+
+    Args:
+        event (dict): The event data.
+
+    Returns:
+        bool: Indicating if the template was generated successfully.
+    """
+    try:
+
+        documents = retrieve_yaml(sessionId=sessionId, query=architectureExplanation)
+
+        _system_prompt = load_prompt(
+            "sys_generateCloudFormationPrompt", "SYS_GENERATE_CLOUDFORMATION_PROMPT"
+        )
+
+        _prompt = load_prompt(
+            "generateCloudFormationPrompt", "GENERATE_CLOUDFORMATION_PROMPT"
+        ).replace("{{architectureExplanation}}", architectureExplanation)
+
+        _messages = get_document_messages(documents=documents, prompt=_prompt)
+    except Exception as ex:
+        return False, ex
+    else:
+        # func, modelId, system_prompt, messages
+        try:
+            generated_cloudformation_stack = backoff_mechanism(
+                func=invoke_model,
+                deadline=request_deadline,
+                modelId=BedrockModelId,
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except Exception as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
+
+        if put_generated_cloudformation(
+            sessionId=sessionId, template=generated_cloudformation_stack
+        ):
+            return True, {"CloudformationTemplate": True}
+        else:
+            return False, f"Template storage unsuccessful"
+
+
+#########################
+##### Validate CFN #####
+#######################
+
+
+def check_cloudformation(cloudformationTemplate, document=None):
+    """
+    Checks a CloudFormation template locally against the resource specification,
+    then with the ValidateTemplate API if RemoteValidation is enabled.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+        document (dict): The parsed template, None to parse it again.
+
+    Returns:
+        tuple: Whether the template is valid, the validation error and whether
+            the result is conclusive (not a failed remote call).
+    """
+    errors = validate_template(
+        document if isinstance(document, dict) else cloudformationTemplate
+    )
+    if errors:
+        validation_errors = f"Cloudformation template invalid:\n{format_errors(errors)}"
+        print(validation_errors)
+        return False, validation_errors, True
+    if not RemoteValidation:
+        print("Cloudformation valid")
+        return True, str(), True
+
+    try:
+        get_cfn().validate_template(
+            TemplateBody=cloudformationTemplate,
+        )
+    except Exception as ex:
+        print(f"Cloudformation template invalid: {ex}")
+        # Only a rejection of the template itself is worth caching
+        conclusive = (
+            isinstance(ex, ClientError)
+            and ex.response.get("Error", {}).get("Code") == "ValidationError"
+        )
+        return False, f"Cloudformation template invalid: {ex}", conclusive
+    print("Cloudformation valid")
+    return True, str(), True
+
+
+def get_validity(cloudformationTemplate):
+    """
+    Validates a CloudFormation template, reusing the result of an identical
+    template validated before by any session.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template.
+
+    Returns:
+        tuple: Whether the template is valid and the validation error.
+    """
+    key, document = template_key(
+        cloudformationTemplate,
+        salt=f"{get_resource_spec_source()} remote={RemoteValidation}",
+    )
+    result = validation_cache.get(key)
+    if result is None:
+        is_valid, validation_errors, conclusive = check_cloudformation(
+            cloudformationTemplate, document
+        )
+        if conclusive:
+            validation_cache.put(key, is_valid, validation_errors)
+    else:
+        is_valid, validation_errors = result["is_valid"], result["error"]
+        print(f"Cloudformation {'valid' if is_valid else 'invalid'} (cached)")
+    validation_cache.log_stats()
+    return is_valid, validation_errors
+
+
+def get_eager_validity(sessionId):
+    """
+    Returns the validation result stream_handler recorded for the latest
+    template, None if it is not validated yet.
+
+    Args:
+        sessionId (str): The ID of the session.
+
+    Returns:
+        dict: {"isValid": True/False, "error": Error Message} or None.
+    """
+    try:
+        latest, is_valid, validation_error = read_template_validity(
+            get_table(), sessionId
+        )
+    except Exception as ex:
+        print(f"Error at get_eager_validity {ex}")
+        return None
+    if not latest or is_valid is None:
+        return None
+    print(f"Cloudformation {'valid' if is_valid else 'invalid'} (validated on write)")
+    return {"isValid": bool(is_valid), "error": str(validation_error)}
+
+
+def validate_cloudformtaion(sessionId):
+    """
+    Validates the CloudFormation template stored in version vo (latest) in DynamoDB.
+    The result recorded by stream_handler when the template was written is
+    returned if there is one.
+
+    Args:
+        event (dict): The event data.
+
+    Returns:
+        dict: {"isValid": True/False, "error": Error Message}
+    """
+    if EagerValidation:
+        result = get_eager_validity(sessionId)
+        if result is not None:
+            return True, result
+
+    try:
+        cloudformationTemplate, version = get_template_version(sessionId=sessionId)
+    except Exception as ex:
+        return False, ex
+
+    is_valid, validation_errors = get_validity(cloudformationTemplate)
+
+    if put_validity_cloudformation(
+        sessionId=sessionId,
+        version=version,
+        is_valid=is_valid,
+        error=validation_errors,
+    ):
+        return True, {"isValid": is_valid, "error": str(validation_errors)}
+    else:
+        return False, f"Template storage unsuccessful"
+
+
+##########################
+##### Reiterate CFN #####
+########################
+
+
+def reiterate_cloudformation(sessionId):
+    """
+    Reiterates the CloudFormation template stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
+
+    Args:
+        event (dict): The event data.
+
+    Returns:
+        bool: Indicating if the template was generated successfully.
+    """
+    try:
+
+        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
+
+        documents = retrieve_yaml(
+            sessionId=sessionId,
+        )
+        _system_prompt = load_prompt(
+            "sys_reiterateCloudFormationPrompt", "SYS_REITERATE_CLOUDFORMATION_PROMPT"
+        )
+        _prompt = load_prompt(
+            "reiterateCloudFormationPrompt", "REITERATE_CLOUDFORMATION_PROMPT"
+        ).replace("{{cloudformationTemplate}}", cloudformationTemplate)
+
+        _messages = get_document_messages(documents=documents, prompt=_prompt)
+    except Exception as ex:
+        return False, ex
+    else:
+        # func, modelId, system_prompt, messages
+
+        try:
+            updated_cloudformation = backoff_mechanism(
+                func=invoke_model,
+                deadline=request_deadline,
+                modelId=BedrockModelId,
+                system_prompt=_system_prompt,
+                messages=_messages,
+            )
+        except Exception as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
+
+        if put_generated_cloudformation(
+            sessionId=sessionId, template=updated_cloudformation
+        ):
+            return True, {"reiteratedCloudformationTemplate": True}
+        else:
+            return False, "Template storage unsuccessful"
+
+
+#######################
+##### Patch CFN #####
+#####################
+
+
+def patch_cloudformation(cloudformationTemplate, system_prompt, messages):
+    """
+    Asks the model for edit operations on the CloudFormation template and applies them locally.
+
+    Args:
+        cloudformationTemplate (str): The CloudFormation template to update.
+        system_prompt (str): The system prompt of the action.
+        messages (list): The messages asking for the edit operations.
+
+    Returns:
+        str: The patched template, or None if the patch could not be applied.
+
+    Raises:
+        RetryError: The Amazon Bedrock call failed after its retries.
+    """
+    patch = backoff_mechanism(
+        func=invoke_model,
+        deadline=request_deadline,
+        modelId=BedrockModelId,
+        system_prompt=system_prompt,
+        messages=messages,
+    )
+    if not patch:
+        return None
+
+    try:
+        return apply_patch(extract_code(cloudformationTemplate), patch)
+    except PatchError as ex:
+        print(f"Patch not applied, regenerating the full template: {ex}")
+        return None
+
+
+#######################
+##### Update CFN #####
+#####################
+
+
+def update_cloudformation(updateInstruction, sessionId):
+    """
+    Updates the CloudFormation template stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
+
+    Args:
+        event (dict): The event data.
+
+    Returns:
+        bool: Indicating if the template was generated successfully.
+    """
+    try:
+
+        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
+
+        documents = retrieve_yaml(sessionId=sessionId, query=None)
+
+        _system_prompt = load_prompt(
+            "sys_updateInstructionPrompt", "SYS_UPDATE_CLOUDFORMATION_PROMPT"
+        )
+
+        _prompt = (
+            load_prompt("updateInstructionPrompt", "UPDATE_CLOUDFORMATION_PROMPT")
+            .replace("{{cloudformationTemplate}}", cloudformationTemplate)
+            .replace("{{updateInstruction}}", updateInstruction)
+        )
+
+        _messages = get_document_messages(documents=documents, prompt=_prompt)
+
+        if PatchMode:
+            _patch_prompt = (
+                load_prompt("patchPrompt", "UPDATE_CLOUDFORMATION_PATCH_PROMPT")
+                .replace("{{cloudformationTemplate}}", cloudformationTemplate)
+                .replace("{{updateInstruction}}", updateInstruction)
+            )
+            _patch_messages = get_document_messages(
+                documents=documents, prompt=_patch_prompt
+            )
+    except Exception as ex:
+        return False, ex
+    else:
+
+        # func, modelId, system_prompt, messages
+
+        try:
+            updated_cloudformation = None
+            if PatchMode:
+                updated_cloudformation = patch_cloudformation(
+                    cloudformationTemplate=cloudformationTemplate,
+                    system_prompt=_system_prompt,
+                    messages=_patch_messages,
+                )
+
+            if not updated_cloudformation:
+                updated_cloudformation = backoff_mechanism(
+                    func=invoke_model,
+                    deadline=request_deadline,
+                    modelId=BedrockModelId,
+                    system_prompt=_system_prompt,
+                    messages=_messages,
+                )
+        except Exception as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
+
+        if put_generated_cloudformation(
+            sessionId=sessionId, template=updated_cloudformation
+        ):
+            return True, {"updatedCloudformationTemplate": True}
+        else:
+            return False, "Template storage unsuccessful"
+
+
+##########################
+##### Resolve Error #####
+########################
+
+
+def resolve_cloudformation(cloudformationInstruction, sessionId):
+    """
+    Resolves the error message stored in version vo (latest) in DynamoDB. Stores the new generated template in DynamoDB.
+
+    Args:
+        event (dict): The event data.
+
+    Returns:
+        bool: Indicating if the template was generated successfully.
+    """
+    try:
+
+        cloudformationTemplate = get_generated_cloudformation(sessionId=sessionId)
+
+        documents = retrieve_yaml(sessionId=sessionId, query=None)
+        _system_prompt = load_prompt(
+            "sys_resolveErrorPrompt", "SYS_RESOLVE_CLOUDFORMATION_PROMPT"
+        )
+
+        _prompt = (
+            load_prompt("resolveErrorPrompt", "RESOLVE_CLOUDFORMATION_PROMPT")
+            .replace("{{cloudformationTemplate}}", cloudformationTemplate)
+            .replace("{{cloudformationInstruction}}", cloudformationInstruction)
+        )
+
+        _messages = get_document_messages(documents=documents, prompt=_prompt)
+
+        if PatchMode:
+            _patch_prompt = (
+                load_prompt("patchPrompt", "RESOLVE_CLOUDFORMATION_PATCH_PROMPT")
+                .replace("{{cloudformationTemplate}}", cloudformationTemplate)
+                .replace("{{cloudformationInstruction}}", cloudformationInstruction)
+            )
+            _patch_messages = get_document_messages(
+                documents=documents, prompt=_patch_prompt
+            )
+    except Exception as ex:
+        return False, ex
+    else:
+        # func, modelId, system_prompt, messages
+
+        try:
+            updated_cloudformation = None
+            if PatchMode:
+                updated_cloudformation = patch_cloudformation(
+                    cloudformationTemplate=cloudformationTemplate,
+                    system_prompt=_system_prompt,
+                    messages=_patch_messages,
+                )
+
+            if not updated_cloudformation:
+                updated_cloudformation = backoff_mechanism(
+                    func=invoke_model,
+                    deadline=request_deadline,
+                    modelId=BedrockModelId,
+                    system_prompt=_system_prompt,
+                    messages=_messages,
+                )
+        except Exception as ex:
+            return False, f"Bedrock call was unsuccessful: {ex}"
+        if put_generated_cloudformation(
+            sessionId=sessionId, template=updated_cloudformation
+        ):
+            return True, {"updatedCloudformationTemplate": True}
+        else:
+            return False, "Template storage unsuccessful"
+
+
+###########################
+##### Lambda Handler #####
+#########################
+
+
+def lambda_handler(event, context):
+    print(event)
+
+    global request_deadline
+    request_deadline = (
+        deadline_in(context.get_remaining_time_in_millis() / 1000 - DeadlineMargin)
+        if context is not None
+        else None
+    )
+
+    response_code = 200
+    action_group = event["actionGroup"]
+    api_path = event["apiPath"]
+    session_cache.start_action(api_path)
+    http_method = event["httpMethod"]
+    parameters = event.get("parameters", [])
+    session_attributes = event.get("sessionAttributes", {})
+    validate_counter = int(session_attributes.get("validate_counter", ""))
+
+    architectureExplanation, updateInstruction, cloudformationInstruction = (
+        None,
+        None,
+        None,
+    )
+
+    if validate_counter == 0 or validate_counter == 1:
+
+        if api_path == "/generateCloudFormation":
+
+            for param in parameters:
+                if param["name"] == "architectureExplanation":
+                    architectureExplanation = param["value"]
+
+            if not architectureExplanation:
+                valid, result = (
+                    False,
+                    "Missing mandatory parameter: architectureExplanation",
+                )
+            else:
+                valid, result = generate_cloudformation(
+                    architectureExplanation=architectureExplanation,
+                    sessionId=event["sessionId"],
+                )
+
+        elif api_path == "/validateCloudFormation":
+            validate_counter += 1
+
+            valid, result = validate_cloudformtaion(sessionId=event["sessionId"])
+
+        elif api_path == "/reiterateCloudFormation":
+
+            valid, result = reiterate_cloudformation(
+                sessionId=event["sessionId"],
+            )
+
+        elif api_path == "/updateCloudFormation":
+
+            for param in parameters:
+                if param["name"] == "updateInstruction":
+                    updateInstruction = param["value"]
+
+            if not updateInstruction:
+                valid, result = False, "Missing mandatory parameter: updateInstruction"
+            else:
+                valid, result = update_cloudformation(
+                    updateInstruction=updateInstruction,
+                    sessionId=event["sessionId"],
+                )
+        elif api_path == "/resolveCloudFormation":
+            for param in parameters:
+                if param["name"] == "cloudformationInstruction":
+                    cloudformationInstruction = param["value"]
+
+            if not cloudformationInstruction:
+                valid, result = (
+                    False,
+                    "Missing mandatory parameter: cloudformationInstruction",
+                )
+            else:
+                valid, result = resolve_cloudformation(
+                    cloudformationInstruction=cloudformationInstruction,
+                    sessionId=event["sessionId"],
+                )
+        else:
+            valid, result = False, f"Unrecognized api path: {action_group}::{api_path}"
+    else:
+        response_code = 423
+        valid, result = (
+            True,
+            f"/validateCloudFormation has been called twice returning control",
+        )
+
+    if not valid:
+        response_code = 404
+        response_body = {
+            "application/json": {
+                "body": {
+                    "error_message": f"Api path {action_group}::{api_path} returned an error: {result}"
+                }
+            }
+        }
+    else:
+        response_body = {"application/json": {"body": result}}
+
+    response = {
+        "actionGroup": action_group,
+        "apiPath": api_path,
+        "httpMethod": http_method,
+        "httpStatusCode": response_code,
+        "responseBody": response_body,
+        "sessionState": {
+            "sessionAttributes": {"validate_counter": str(validate_counter)},
+        },
+    }
+
+    session_cache.log_action()
+
+    api_response = {"messageVersion": "1.0", "response": response}
+    return api_response
+
+
+###########################
+##### Stream Handler #####
+#########################
+# Deployed as a second function on the template storage table stream: every
+# new template is validated while the agent plans its next action, so the
+# validate action usually finds the result on the "v0" head.
+
+deserializer = TypeDeserializer()
+
+
+def stream_handler(event, context):
+    validated = 0
+    for record in event.get("Records", []):
+        image = record.get("dynamodb", {}).get("NewImage")
+        if not image:
+            continue
+        item = {name: deserializer.deserialize(value) for name, value in image.items()}
+        # Only "v0" heads of versions not validated yet, the event source
+        # mapping filters the rest out already
+        if (
+            item.get("version") != "v0"
+            or item.get("is_valid") is not None
+            or "Latest" not in item
+        ):
+            continue
+
+        # The head only points to the body, written just before it
+        template = read_template_body(
+            get_table(), item["sessionId"], item, codec=template_codec
+        )
+        is_valid, validation_errors = get_validity(template)
+        put_validity_cloudformation(
+            sessionId=item["sessionId"],
+            version=int(item["Latest"]),
+            is_valid=is_valid,
+            error=validation_errors,
+        )
+        validated += 1
+
+    print(
+        f"Stream handler validated {validated} of {len(event.get('Records', []))} records"
+    )
+    return {"validated": validated}
@@ -0,0 +1,414 @@
+import json
+import re
+import textwrap
+
+import yaml
+
+# Edit operations accepted in a patch, applied in order:
+#   {"op": "replace", "path": "Resources/WebBucket", "content": "WebBucket:\n  Type: ..."}
+#   {"op": "add", "path": "Resources/LogBucket", "content": "LogBucket:\n  Type: ..."}
+#   {"op": "remove", "path": "Resources/OldQueue"}
+# CloudFormation paths are "/"-separated mapping keys (any depth). Terraform
+# paths are a top-level block type followed by its labels, e.g.
+# "resource/aws_s3_bucket/web", "variable/region" or "locals".
+PATCH_OPS = ("add", "replace", "remove")
+
+
+class PatchError(Exception):
+    """
+    Raised when a patch cannot be parsed or applied.
+    """
+
+
+def extract_code(text):
+    """
+    Returns the content of the first fenced code block in text, or the stripped text.
+    """
+    match = re.search(r"```[\w-]*[^\S\n]*\n(.*?)```", text, re.DOTALL)
+    return match.group(1).strip("\n") if match else text.strip()
+
+
+def parse_patch(text):
+    """
+    Parses the edit operations returned by the model.
+
+    Args:
+        text (str): The model response, a JSON array optionally in a code block.
+
+    Returns:
+        list: The validated operations.
+    """
+    code = extract_code(text)
+    start, end = code.find("["), code.rfind("]")
+    if start == -1 or end < start:
+        raise PatchError("No JSON array of operations found")
+
+    try:
+        operations = json.loads(code[start : end + 1])
+    except ValueError as ex:
+        raise PatchError(f"Invalid JSON patch: {ex}")
+
+    if not operations:
+        raise PatchError("Empty patch")
+
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get("op") not in PATCH_OPS:
+            raise PatchError(f"Unsupported operation {operation}")
+        if not isinstance(operation.get("path"), str) or not operation["path"].strip(
+            "/"
+        ):
+            raise PatchError(f"Missing path in {operation}")
+        if operation["op"] != "remove" and not isinstance(
+            operation.get("content"), str
+        ):
+            raise PatchError(f"Missing content in {operation}")
+
+    return operations
+
+
+def _split_path(path):
+    return [segment for segment in path.strip("/").split("/") if segment]
+
+
+def _is_content(line):
+    stripped = line.strip()
+    return bool(stripped) and not stripped.startswith("#")
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip(" "))
+
+
+def _indent_block(content, indent):
+    return [
+        " " * indent + line if line.strip() else ""
+        for line in textwrap.dedent(content).strip("\n").splitlines()
+    ]
+
+
+##### CloudFormation YAML #####
+
+
+class _TaggedLoader(yaml.SafeLoader):
+    """
+    SafeLoader accepting the CloudFormation short-form tags (!Ref, !Sub, ...).
+    """
+
+
+_TaggedLoader.add_multi_constructor(
+    "!",
+    lambda loader, suffix, node: (
+        loader.construct_scalar(node)
+        if isinstance(node, yaml.ScalarNode)
+        else (
+            loader.construct_sequence(node)
+            if isinstance(node, yaml.SequenceNode)
+            else loader.construct_mapping(node)
+        )
+    ),
+)
+
+
+def load_yaml(text):
+    """
+    Parses a CloudFormation YAML template, ignoring short-form tags.
+    """
+    return yaml.load(text, Loader=_TaggedLoader)
+
+
+class _YamlDocument:
+    """
+    Line-based view of a YAML document addressing mapping keys by path. Edits
+    only touch the lines of the addressed block, so formatting and comments of
+    the rest of the template are kept.
+    """
+
+    def __init__(self, text):
+        self.lines = text.splitlines()
+
+    def _child_indent(self, start, end, default):
+        for line in self.lines[start:end]:
+            if _is_content(line):
+                return _indent(line)
+        return default
+
+    def _find_key(self, start, end, indent, key):
+        pattern = re.compile(rf"""(["']?){re.escape(key)}\1\s*:(\s|$)""")
+        for index in range(start, end):
+            line = self.lines[index]
+            if (
+                _is_content(line)
+                and _indent(line) == indent
+                and pattern.match(line[indent:])
+            ):
+                return index
+        return None
+
+    def _block_end(self, start, end, indent):
+        last = start
+        for index in range(start + 1, end):
+            line = self.lines[index]
+            if _is_content(line):
+                # A sequence may start at the indentation of its key
+                if _indent(line) < indent or (
+                    _indent(line) == indent and not line.lstrip().startswith("- ")
+                ):
+                    break
+                last = index
+        return last + 1
+
+    def _content_end(self, start, end):
+        for index in range(end - 1, start - 1, -1):
+            if _is_content(self.lines[index]):
+                return index + 1
+        return start
+
+    def locate(self, path):
+        """
+        Returns (start, end, indent) of the block at path, or (None, parent end, indent)
+        if the last key is missing. Raises PatchError if a parent key is missing.
+        """
+        start, end, indent = 0, len(self.lines), 0
+        segments = _split_path(path)
+
+        for depth, key in enumerate(segments):
+            index = self._find_key(start, end, indent, key)
+            if index is None:
+                if depth < len(segments) - 1:
+                    raise PatchError(f"Path {path} not found")
+                # New keys are inserted after the last line of the parent block
+                return None, self._content_end(start, end), indent
+
+            block_end = self._block_end(index, end, indent)
+            if depth == len(segments) - 1:
+                return index, block_end, indent
+
+            start, end = index + 1, block_end
+            indent = self._child_indent(start, end, indent + 2)
+            if indent <= _indent(self.lines[index]):
+                raise PatchError(f"Path {path} not found")
+
+    def _block_lines(self, key, content, indent):
+        lines = _indent_block(content, indent)
+        if not lines or not re.match(
+            rf"""(["']?){re.escape(key)}\1\s*:""", lines[0].strip()
+        ):
+            # Content without its key line is the value of the key
+            lines = [" " * indent + f"{key}:"] + _indent_block(content, indent + 2)
+        return lines
+
+    def apply(self, operation):
+        segments = _split_path(operation["path"])
+        start, end, indent = self.locate(operation["path"])
+
+        if operation["op"] == "remove":
+            if start is None:
+                raise PatchError(f"Cannot remove missing {operation['path']}")
+            del self.lines[start:end]
+            return
+
+        block = self._block_lines(segments[-1], operation["content"], indent)
+        if start is not None:
+            self.lines[start:end] = block
+        elif operation["op"] == "replace":
+            raise PatchError(f"Cannot replace missing {operation['path']}")
+        elif len(segments) == 1:
+            self.lines.extend([""] + block)
+        else:
+            # Inserted after the last line of the parent block
+            self.lines[end:end] = block
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _ensure_parents(document, path):
+    """
+    Adds an empty top-level section for an "add" below a missing section.
+    """
+    segments = _split_path(path)
+    if (
+        len(segments) == 2
+        and document._find_key(0, len(document.lines), 0, segments[0]) is None
+    ):
+        document.lines.extend(["", f"{segments[0]}:"])
+
+
+def apply_yaml_patch(template, operations):
+    """
+    Applies edit operations to a CloudFormation YAML template.
+
+    Args:
+        template (str): The CloudFormation YAML template.
+        operations (list): Operations returned by parse_patch.
+
+    Returns:
+        str: The patched template.
+    """
+    document = _YamlDocument(template)
+    for operation in operations:
+        if operation["op"] == "add":
+            _ensure_parents(document, operation["path"])
+        document.apply(operation)
+
+    patched = document.text()
+    try:
+        parsed = load_yaml(patched)
+    except yaml.YAMLError as ex:
+        raise PatchError(f"Patched template is not valid YAML: {ex}")
+    if not isinstance(parsed, dict):
+        raise PatchError("Patched template is not a YAML mapping")
+
+    return patched
+
+
+##### Terraform HCL #####
+
+
+def _hcl_block_end(lines, start):
+    """
+    Returns the index after the line closing the block opened on lines[start],
+    skipping braces in strings, comments and heredocs.
+    """
+    depth = 0
+    heredoc = None
+    in_comment = False
+
+    for index in range(start, len(lines)):
+        line = lines[index]
+        position = 0
+        if heredoc:
+            match = re.match(rf"\s*{heredoc}\b", line)
+            if not match:
+                continue
+            # Scanning resumes after the closing marker, e.g. "EOT)"
+            heredoc = None
+            position = match.end()
+
+        in_string = False
+        while position < len(line):
+            char = line[position]
+            pair = line[position : position + 2]
+            if in_comment:
+                if pair == "*/":
+                    in_comment = False
+                    position += 1
+            elif in_string:
+                if char == "\\":
+                    position += 1
+                elif char == '"':
+                    in_string = False
+            elif pair == "/*":
+                in_comment = True
+                position += 1
+            elif char == "#" or pair == "//":
+                break
+            elif char == '"':
+                in_string = True
+            elif pair == "<<":
+                match = re.match(r"<<-?(\w+)", line[position:])
+                if match:
+                    heredoc = match.group(1)
+                    break
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            position += 1
+
+    raise PatchError("Unbalanced braces in Terraform block")
+
+
+class _HclDocument:
+    """
+    Line-based view of a Terraform file addressing top-level blocks by type and labels.
+    """
+
+    def __init__(self, text):
+        self.lines = text.splitlines()
+
+    def locate(self, path):
+        segments = _split_path(path)
+        labels = "".join(rf'\s+"?{re.escape(label)}"?' for label in segments[1:])
+        pattern = re.compile(rf"{re.escape(segments[0])}{labels}\s*\{{")
+
+        for index, line in enumerate(self.lines):
+            if pattern.match(line):
+                return index, _hcl_block_end(self.lines, index)
+        return None, None
+
+    def apply(self, operation):
+        start, end = self.locate(operation["path"])
+
+        if operation["op"] == "remove":
+            if start is None:
+                raise PatchError(f"Cannot remove missing {operation['path']}")
+            # Drop the blank line separating the block from the next one
+            if end < len(self.lines) and not self.lines[end].strip():
+                end += 1
+            del self.lines[start:end]
+            return
+
+        block = _indent_block(operation["content"], 0)
+        if start is not None:
+            self.lines[start:end] = block
+        elif operation["op"] == "replace":
+            raise PatchError(f"Cannot replace missing {operation['path']}")
+        else:
+            self.lines.extend([""] + block)
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def apply_hcl_patch(template, operations):
+    """
+    Applies edit operations to a Terraform template.
+
+    Args:
+        template (str): The Terraform HCL code.
+        operations (list): Operations returned by parse_patch.
+
+    Returns:
+        str: The patched template.
+    """
+    document = _HclDocument(template)
+    for operation in operations:
+        document.apply(operation)
+
+    patched = document.lines
+    index = 0
+    while index < len(patched):
+        if re.match(r"[A-Za-z_][\w-]*(\s+\"?[\w-]+\"?)*\s*\{", patched[index]):
+            index = _hcl_block_end(patched, index)
+        else:
+            index += 1
+
+    return document.text()
+
+
+PATCHERS = {"CloudFormation": apply_yaml_patch, "Terraform": apply_hcl_patch}
+
+
+def apply_patch(template, patch, template_type="CloudFormation"):
+    """
+    Parses the model response and applies it to the template.
+
+    Args:
+        template (str): The current template code.
+        patch (str): The model response containing the edit operations.
+        template_type (str): "CloudFormation" or "Terraform".
+
+    Returns:
+        str: The patched template.
+
+    Raises:
+        PatchError: If the patch cannot be parsed or applied. Callers then
+            fall back to a full regeneration.
+    """
+    if template_type not in PATCHERS:
+        raise PatchError(f"Patch mode does not support {template_type}")
+
+    return PATCHERS[template_type](template, parse_patch(patch))
@@ -0,0 +1,433 @@
+"""
+Shared retry layer for Amazon Bedrock (and other AWS) calls.
+
+Errors are classified as throttle, transient, mid-stream or fatal. Fatal errors
+are raised at once, the others are retried with jittered exponential backoff
+until the attempts, the process-wide retry budget or the caller's deadline run
+out, then RetryError is raised instead of returning an empty result.
+
+Throttling switches on an adaptive client-side token bucket: its fill rate is
+halved on every throttle and grows back on success, so concurrent callers slow
+down together instead of amplifying the throttling with retry storms.
+
+This module only depends on botocore, so it is packaged with the action group
+Lambda as well as used by the Streamlit apps.
+
+Usage:
+
+result = backoff_mechanism(
+    func=invoke_model,
+    deadline=deadline_in(300),
+    modelId=modelId,
+    system_prompt=system_prompt,
+    messages=messages,
+)
+"""
+
+from botocore.exceptions import (
+    ClientError,
+    ConnectionError,
+    EventStreamError,
+    HTTPClientError,
+)
+
+from collections import deque
+
+import os
+import random
+import threading
+import time
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_INITIAL_DELAY = float(os.environ.get("RETRY_INITIAL_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "60"))
+
+# Retry budget: every retry spends one token, every successful call earns
+# RETRY_BUDGET_REFILL tokens back, up to RETRY_BUDGET.
+RETRY_BUDGET = float(os.environ.get("RETRY_BUDGET", "20"))
+RETRY_BUDGET_REFILL = float(os.environ.get("RETRY_BUDGET_REFILL", "0.2"))
+
+# Adaptive rate limit (requests per second) once throttling was seen.
+RATE_LIMIT_MAX = float(os.environ.get("RATE_LIMIT_MAX", "10"))
+RATE_LIMIT_MIN = float(os.environ.get("RATE_LIMIT_MIN", "0.1"))
+RATE_LIMIT_GROWTH = float(os.environ.get("RATE_LIMIT_GROWTH", "1.2"))
+
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+MID_STREAM = "mid_stream"
+FATAL = "fatal"
+
+THROTTLE_CODES = (
+    "throttlingexception",
+    "throttling",
+    "toomanyrequestsexception",
+    "provisionedthroughputexceededexception",
+    "requestlimitexceeded",
+    "slowdown",
+)
+TRANSIENT_CODES = (
+    "internalserverexception",
+    "internalfailure",
+    "serviceunavailableexception",
+    "serviceunavailable",
+    "modelnotreadyexception",
+    "modeltimeoutexception",
+    "modelstreamerrorexception",
+    "requesttimeout",
+    "requesttimeoutexception",
+)
+
+
+class RetryError(Exception):
+    """
+    Raised when a call still fails after its retries.
+
+    Attributes:
+        error_class (str): The class of the last error (throttle, transient or mid_stream).
+        attempts (int): The number of attempts made.
+        last_error (Exception): The last error raised by the call.
+    """
+
+    def __init__(self, message, error_class, attempts, last_error):
+        super().__init__(message)
+        self.error_class = error_class
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+class DeadlineExceeded(RetryError):
+    """
+    Raised when the caller's deadline leaves no time for another attempt.
+    """
+
+
+def deadline_in(seconds):
+    """
+    Returns a deadline (time.monotonic() based) the given seconds from now, None for no deadline.
+    """
+    if seconds is None:
+        return None
+    return time.monotonic() + seconds
+
+
+def error_code(ex):
+    """
+    Returns the lowercased error code of a botocore error, or the exception class name.
+    """
+    if isinstance(ex, ClientError):
+        code = ex.response.get("Error", {}).get("Code")
+        if code:
+            return code.lower()
+    return type(ex).__name__.lower()
+
+
+def classify_error(ex):
+    """
+    Classifies an error raised by an AWS call.
+
+    Returns:
+        str: THROTTLE, TRANSIENT, MID_STREAM or FATAL.
+    """
+    code = error_code(ex)
+    if code in THROTTLE_CODES:
+        return THROTTLE
+    if isinstance(ex, EventStreamError):
+        # The stream was accepted and broke off part way through
+        return FATAL if code.startswith("validation") else MID_STREAM
+    if code in TRANSIENT_CODES or isinstance(ex, (ConnectionError, HTTPClientError)):
+        return TRANSIENT
+    if isinstance(ex, ClientError):
+        status = ex.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        if status >= 500:
+            return TRANSIENT
+    return FATAL
+
+
+class AdaptiveRateLimiter:
+    """
+    Client-side token bucket, enabled by the first throttle.
+
+    The fill rate starts at RATE_LIMIT_MAX, is halved on every throttle and
+    multiplied by RATE_LIMIT_GROWTH on every successful call. The bucket is
+    switched off again once the rate is back at RATE_LIMIT_MAX.
+    """
+
+    def __init__(
+        self,
+        max_rate=RATE_LIMIT_MAX,
+        min_rate=RATE_LIMIT_MIN,
+        growth=RATE_LIMIT_GROWTH,
+    ):
+        self._lock = threading.Lock()
+        self._max_rate = max_rate
+        self._min_rate = min_rate
+        self._growth = growth
+        self._rate = max_rate
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self.enabled = False
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def _refill(self, now):
+        capacity = max(self._rate, 1.0)
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, deadline=None):
+        """
+        Waits for a token.
+
+        Returns:
+            float: The seconds waited, None if the deadline would pass first.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                if not self.enabled:
+                    return waited
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                wait = (1.0 - self._tokens) / self._rate
+
+            if deadline is not None and now + wait > deadline:
+                return None
+            time.sleep(wait)
+            waited += wait
+
+    def on_throttle(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.enabled = True
+            self._rate = max(self._rate / 2, self._min_rate)
+
+    def on_success(self):
+        with self._lock:
+            if self.enabled:
+                self._rate = min(self._rate * self._growth, self._max_rate)
+                self.enabled = self._rate < self._max_rate
+
+
+class RetryBudget:
+    """
+    Process-wide budget of retries, so failures under load do not multiply requests.
+    """
+
+    def __init__(self, capacity=RETRY_BUDGET, refill=RETRY_BUDGET_REFILL):
+        self._lock = threading.Lock()
+        self._capacity = capacity
+        self._refill = refill
+        self._tokens = capacity
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+    def withdraw(self):
+        """
+        Spends one retry, returns False if the budget is exhausted.
+        """
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._capacity, self._tokens + self._refill)
+
+
+class RetryMetrics:
+    """
+    Counters and call latencies of the retry layer.
+    """
+
+    def __init__(self, max_samples=200):
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "attempts": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "budget_exhausted": 0,
+            "deadline_exceeded": 0,
+            "rate_limited_seconds": 0.0,
+        }
+        self._errors = {THROTTLE: 0, TRANSIENT: 0, MID_STREAM: 0, FATAL: 0}
+        self._latency = deque(maxlen=max_samples)
+
+    def add(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] += value
+
+    def error(self, error_class):
+        with self._lock:
+            self._errors[error_class] += 1
+
+    def latency(self, seconds):
+        with self._lock:
+            self._latency.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            latency = sorted(self._latency)
+            return {
+                **self._counters,
+                "errors": dict(self._errors),
+                "latency_p50": latency[len(latency) // 2] if latency else 0.0,
+                "latency_p90": latency[int(len(latency) * 0.9)] if latency else 0.0,
+            }
+
+
+class Retrier:
+    """
+    Calls functions with classified retries, an adaptive rate limit, a retry
+    budget and an optional deadline. One instance is shared by the process.
+
+    Usage:
+
+    retrier = Retrier()
+
+    # Calls func(**kwargs), retrying throttles, transient and mid-stream errors.
+    result = retrier.call(func, deadline=deadline_in(300), **kwargs)
+
+    # Attempts, errors per class and call latencies so far.
+    retrier.stats()
+    """
+
+    def __init__(
+        self,
+        max_attempts=RETRY_MAX_ATTEMPTS,
+        initial_delay=RETRY_INITIAL_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        rate_limiter=None,
+        budget=None,
+    ):
+        self._max_attempts = max_attempts
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        self.budget = budget or RetryBudget()
+        self.metrics = RetryMetrics()
+
+    def _fail(self, error_class, attempts, ex, message, error=RetryError):
+        self.metrics.add("failed")
+        print(f"Retries {self.stats()}")
+        return error(
+            f"{message} after {attempts} attempt(s): {ex}", error_class, attempts, ex
+        )
+
+    def call(self, func, deadline=None, **kwargs):
+        """
+        Calls func(**kwargs) until it succeeds.
+
+        Args:
+            func (function): The function to call.
+            deadline (float): time.monotonic() deadline for starting attempts, None for none.
+
+        Returns:
+            The result of func.
+
+        Raises:
+            RetryError: The retries, the budget or the deadline ran out.
+            Exception: The error of func if it is not retryable.
+        """
+        self.metrics.add("calls")
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire(deadline)
+            if waited is None:
+                self.metrics.add("deadline_exceeded")
+                raise self._fail(
+                    THROTTLE,
+                    attempt,
+                    "rate limited",
+                    "Deadline exceeded",
+                    DeadlineExceeded,
+                )
+            self.metrics.add("rate_limited_seconds", waited)
+
+            attempt += 1
+            self.metrics.add("attempts")
+            try:
+                result = func(**kwargs)
+            except Exception as ex:
+                error_class = classify_error(ex)
+                self.metrics.error(error_class)
+                if error_class == FATAL:
+                    self.metrics.add("failed")
+                    raise
+                if error_class == THROTTLE:
+                    self.rate_limiter.on_throttle()
+
+                if attempt >= self._max_attempts:
+                    raise self._fail(
+                        error_class, attempt, ex, "Retries exhausted"
+                    ) from ex
+
+                delay = min(
+                    self._initial_delay * 2 ** (attempt - 1), self._max_delay
+                ) + random.uniform(0, 1)
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    self.metrics.add("deadline_exceeded")
+                    raise self._fail(
+                        error_class, attempt, ex, "Deadline exceeded", DeadlineExceeded
+                    ) from ex
+                if not self.budget.withdraw():
+                    self.metrics.add("budget_exhausted")
+                    raise self._fail(
+                        error_class, attempt, ex, "Retry budget exhausted"
+                    ) from ex
+
+                print(
+                    f"Retry {attempt}/{self._max_attempts - 1} ({error_class}) in {delay:.1f}s: {ex}"
+                )
+                time.sleep(delay)
+            else:
+                self.rate_limiter.on_success()
+                self.budget.deposit()
+                self.metrics.add("succeeded")
+                self.metrics.latency(time.monotonic() - start)
+                if attempt > 1:
+                    print(f"Retries {self.stats()}")
+                return result
+
+    def stats(self):
+        """
+        Returns the metrics, the current rate limit and the retry budget left.
+        """
+        return {
+            **self.metrics.stats(),
+            "rate_limit": (
+                round(self.rate_limiter.rate, 2) if self.rate_limiter.enabled else None
+            ),
+            "budget": round(self.budget.tokens, 2),
+        }
+
+
+retrier = Retrier()
+
+
+def backoff_mechanism(func, deadline=None, **kwargs):
+    """
+    Calls func(**kwargs) through the process-wide retrier.
+
+    Args:
+        func (function): The function to be called with retries.
+        deadline (float): time.monotonic() deadline, see deadline_in().
+        **kwargs: The arguments of func.
+
+    Returns:
+        The result of func.
+
+    Raises:
+        RetryError: The call failed after its retries.
+    """
+    return retrier.call(func, deadline=deadline, **kwargs)
@@ -0,0 +1,292 @@
+# AWS services and the names they go by in architecture explanations, matched
+# case-insensitively as whole words by service_extractor.py. The key is the
+# name used in knowledge base queries. Aliases are kept specific: generic words
+# ("config", "backup", "batch", "amplify") are only listed with their AWS or
+# Amazon prefix.
+AWS_SERVICES = {
+    # Compute
+    "AWS Lambda": ["lambda", "aws lambda", "lambda function"],
+    "Amazon EC2": [
+        "ec2",
+        "amazon ec2",
+        "elastic compute cloud",
+        "amazon elastic compute cloud",
+        "ec2 instance",
+    ],
+    "AWS Auto Scaling": [
+        "auto scaling",
+        "autoscaling",
+        "auto-scaling",
+        "aws auto scaling",
+        "ec2 auto scaling",
+        "amazon ec2 auto scaling",
+        "application auto scaling",
+        "auto scaling group",
+    ],
+    "AWS Fargate": ["fargate", "aws fargate"],
+    "Amazon ECS": [
+        "ecs",
+        "amazon ecs",
+        "elastic container service",
+        "amazon elastic container service",
+    ],
+    "Amazon EKS": [
+        "eks",
+        "amazon eks",
+        "elastic kubernetes service",
+        "amazon elastic kubernetes service",
+    ],
+    "Amazon ECR": [
+        "ecr",
+        "amazon ecr",
+        "elastic container registry",
+        "amazon elastic container registry",
+    ],
+    "AWS Batch": ["aws batch"],
+    "AWS Elastic Beanstalk": ["elastic beanstalk", "aws elastic beanstalk"],
+    "AWS App Runner": ["app runner", "aws app runner"],
+    "Amazon Lightsail": ["lightsail", "amazon lightsail"],
+    # Storage
+    "Amazon S3": [
+        "s3",
+        "amazon s3",
+        "s3 bucket",
+        "simple storage service",
+        "amazon simple storage service",
+    ],
+    "Amazon S3 Glacier": ["glacier", "s3 glacier", "amazon s3 glacier"],
+    "Amazon EBS": [
+        "ebs",
+        "amazon ebs",
+        "elastic block store",
+        "amazon elastic block store",
+    ],
+    "Amazon EFS": [
+        "efs",
+        "amazon efs",
+        "elastic file system",
+        "amazon elastic file system",
+    ],
+    "Amazon FSx": ["fsx", "amazon fsx"],
+    "AWS Backup": ["aws backup"],
+    "AWS Storage Gateway": ["storage gateway", "aws storage gateway"],
+    "AWS DataSync": ["datasync", "aws datasync"],
+    "AWS Transfer Family": ["transfer family", "aws transfer family"],
+    # Databases
+    "Amazon DynamoDB": ["dynamodb", "dynamo db", "amazon dynamodb", "dynamodb table"],
+    "Amazon DynamoDB Streams": [
+        "dynamodb stream",
+        "dynamodb streams",
+        "amazon dynamodb streams",
+    ],
+    "Amazon RDS": [
+        "rds",
+        "amazon rds",
+        "relational database service",
+        "amazon relational database service",
+    ],
+    "Amazon Aurora": ["aurora", "amazon aurora", "aurora serverless"],
+    "Amazon ElastiCache": ["elasticache", "amazon elasticache"],
+    "Amazon MemoryDB": ["memorydb", "amazon memorydb"],
+    "Amazon Neptune": ["neptune", "amazon neptune"],
+    "Amazon DocumentDB": ["documentdb", "amazon documentdb"],
+    "Amazon Keyspaces": ["amazon keyspaces"],
+    "Amazon Timestream": ["timestream", "amazon timestream"],
+    "Amazon Redshift": ["redshift", "amazon redshift"],
+    "AWS Database Migration Service": [
+        "aws dms",
+        "database migration service",
+        "aws database migration service",
+    ],
+    # Networking and content delivery
+    "Amazon VPC": [
+        "vpc",
+        "amazon vpc",
+        "virtual private cloud",
+        "aws virtual private cloud",
+        "amazon virtual private cloud",
+    ],
+    "Internet Gateway": ["internet gateway", "igw"],
+    "NAT Gateway": ["nat gateway", "network address translation (nat) gateway"],
+    "AWS Transit Gateway": ["transit gateway", "aws transit gateway"],
+    "AWS PrivateLink": [
+        "privatelink",
+        "aws privatelink",
+        "vpc endpoint",
+        "interface endpoint",
+    ],
+    "AWS Site-to-Site VPN": ["site-to-site vpn", "aws site-to-site vpn", "vpn gateway"],
+    "AWS Direct Connect": ["direct connect", "aws direct connect"],
+    "Elastic Load Balancing": [
+        "elastic load balancing",
+        "elastic load balancer",
+        "elb",
+    ],
+    "Application Load Balancer": ["application load balancer", "alb"],
+    "Network Load Balancer": ["network load balancer", "nlb"],
+    "Gateway Load Balancer": ["gateway load balancer", "gwlb"],
+    "Amazon CloudFront": ["cloudfront", "amazon cloudfront"],
+    "Amazon Route 53": ["route 53", "route53", "amazon route 53"],
+    "AWS Global Accelerator": ["global accelerator", "aws global accelerator"],
+    "Amazon API Gateway": [
+        "api gateway",
+        "amazon api gateway",
+        "rest api gateway",
+        "http api gateway",
+    ],
+    # Application integration
+    "AWS Step Functions": [
+        "step functions",
+        "step function",
+        "aws step functions",
+        "state machine",
+        "aws state machine",
+    ],
+    "Amazon SNS": [
+        "sns",
+        "amazon sns",
+        "simple notification service",
+        "amazon simple notification service",
+        "sns topic",
+    ],
+    "Amazon SQS": [
+        "sqs",
+        "amazon sqs",
+        "simple queue service",
+        "amazon simple queue service",
+        "sqs queue",
+    ],
+    "Amazon EventBridge": [
+        "eventbridge",
+        "amazon eventbridge",
+        "eventbridge rule",
+        "eventbridge scheduler",
+        "cloudwatch events",
+    ],
+    "Amazon MQ": ["amazon mq"],
+    "Amazon MSK": ["msk", "amazon msk", "managed streaming for apache kafka"],
+    "Amazon Kinesis Data Streams": [
+        "kinesis",
+        "kinesis data streams",
+        "amazon kinesis",
+        "kinesis stream",
+    ],
+    "Amazon Data Firehose": [
+        "firehose",
+        "kinesis firehose",
+        "kinesis data firehose",
+        "amazon data firehose",
+        "amazon kinesis data firehose",
+    ],
+    "AWS AppSync": ["appsync", "aws appsync"],
+    "Amazon SES": [
+        "ses",
+        "amazon ses",
+        "simple email service",
+        "amazon simple email service",
+    ],
+    "Amazon Pinpoint": ["amazon pinpoint"],
+    # Analytics
+    "Amazon Athena": ["athena", "amazon athena"],
+    "AWS Glue": ["aws glue", "glue job", "glue crawler", "glue data catalog"],
+    "Amazon EMR": ["emr", "amazon emr", "elastic mapreduce"],
+    "AWS Lake Formation": ["lake formation", "aws lake formation"],
+    "Amazon QuickSight": ["quicksight", "amazon quicksight"],
+    "Amazon OpenSearch Service": [
+        "opensearch",
+        "amazon opensearch",
+        "opensearch service",
+        "amazon opensearch service",
+        "opensearch serverless",
+        "elasticsearch service",
+    ],
+    # Machine learning
+    "Amazon Bedrock": ["bedrock", "amazon bedrock", "aws bedrock"],
+    "Agents for Amazon Bedrock": [
+        "agents for amazon bedrock",
+        "amazon bedrock agent",
+        "bedrock agent",
+        "agents for bedrock",
+    ],
+    "Knowledge Bases for Amazon Bedrock": [
+        "knowledge bases for amazon bedrock",
+        "knowledge base for amazon bedrock",
+        "bedrock knowledge base",
+        "amazon bedrock knowledge base",
+    ],
+    "Amazon SageMaker": ["sagemaker", "amazon sagemaker"],
+    "Amazon Comprehend": ["amazon comprehend"],
+    "Amazon Rekognition": ["rekognition", "amazon rekognition"],
+    "Amazon Textract": ["textract", "amazon textract"],
+    "Amazon Transcribe": ["amazon transcribe"],
+    "Amazon Translate": ["amazon translate"],
+    "Amazon Polly": ["polly", "amazon polly"],
+    "Amazon Lex": ["amazon lex"],
+    "Amazon Kendra": ["kendra", "amazon kendra"],
+    "Amazon Q": ["amazon q"],
+    # Security, identity and compliance
+    "AWS IAM": [
+        "iam",
+        "aws iam",
+        "identity and access management",
+        "aws identity and access management",
+        "iam role",
+        "iam policy",
+    ],
+    "Amazon Cognito": ["cognito", "amazon cognito", "cognito user pool"],
+    "AWS KMS": [
+        "kms",
+        "aws kms",
+        "key management service",
+        "aws key management service",
+    ],
+    "AWS Secrets Manager": ["secrets manager", "aws secrets manager"],
+    "AWS Certificate Manager": [
+        "certificate manager",
+        "aws certificate manager",
+        "acm",
+    ],
+    "AWS WAF": ["waf", "aws waf", "web application firewall"],
+    "AWS Shield": ["aws shield", "shield advanced"],
+    "AWS Network Firewall": ["network firewall", "aws network firewall"],
+    "Amazon GuardDuty": ["guardduty", "amazon guardduty"],
+    "AWS Security Hub": ["security hub", "aws security hub"],
+    "Amazon Inspector": ["amazon inspector"],
+    "Amazon Macie": ["macie", "amazon macie"],
+    "Security Group": ["security group"],
+    # Management and governance
+    "Amazon CloudWatch": [
+        "cloudwatch",
+        "amazon cloudwatch",
+        "cloudwatch alarm",
+        "cloudwatch metrics",
+    ],
+    "Amazon CloudWatch Logs": [
+        "cloudwatch logs",
+        "amazon cloudwatch logs",
+        "cloudwatch log group",
+    ],
+    "AWS CloudTrail": ["cloudtrail", "aws cloudtrail"],
+    "AWS X-Ray": ["x-ray", "aws x-ray"],
+    "AWS Config": ["aws config"],
+    "AWS Systems Manager": [
+        "systems manager",
+        "aws systems manager",
+        "ssm",
+        "parameter store",
+    ],
+    "AWS CloudFormation": [
+        "cloudformation",
+        "aws cloudformation",
+        "cloudformation stack",
+    ],
+    "AWS Organizations": ["aws organizations"],
+    "AWS Control Tower": ["control tower", "aws control tower"],
+    # Developer tools and front end
+    "AWS CodePipeline": ["codepipeline", "aws codepipeline"],
+    "AWS CodeBuild": ["codebuild", "aws codebuild"],
+    "AWS CodeCommit": ["codecommit", "aws codecommit"],
+    "AWS CodeDeploy": ["codedeploy", "aws codedeploy"],
+    "AWS Amplify": ["aws amplify"],
+    "AWS IoT Core": ["iot core", "aws iot core", "aws iot"],
+}
@@ -0,0 +1,156 @@
+"""
+Local extraction of the AWS services named in an architecture explanation.
+
+get_summary_document used to ask the model to "list all the AWS Services in
+the document", a converse round trip on the first action of every session,
+only to shorten the explanation to the knowledge base query limit. The names
+and aliases of service_dictionary.py are compiled once into an Aho-Corasick
+automaton, so one pass over the lowercased explanation finds every alias.
+
+Matches must be whole words (a trailing plural "s" is allowed). Where aliases
+overlap, the leftmost longest one wins, so "DynamoDB Streams" is not also
+counted as "DynamoDB" and "Amazon Simple Notification Service (SNS)" is one
+service. Services are returned once each, in order of first mention.
+
+Usage:
+
+services = extract_services(explanation)  # ["AWS Lambda", "Amazon S3", ...]
+
+query = service_query(services)  # "AWS Lambda, Amazon S3, ..." within the query limit
+"""
+
+from collections import deque
+
+import re
+
+from service_dictionary import AWS_SERVICES
+
+# Characters accepted by the knowledge base retrieve query.
+KNOWLEDGE_BASE_QUERY_LIMIT = 1000
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    """
+    Lowercases text and collapses whitespace, keeping every other character.
+    """
+    return _WHITESPACE.sub(" ", text.lower())
+
+
+class ServiceAutomaton:
+    """
+    Aho-Corasick automaton over the aliases of a service dictionary.
+    """
+
+    def __init__(self, services):
+        # Trie nodes: outgoing edges, failure link and (alias length, service) outputs
+        self._goto = [dict()]
+        self._fail = [0]
+        self._output = [list()]
+
+        for service, aliases in services.items():
+            for alias in {normalize(service), *map(normalize, aliases)}:
+                node = 0
+                for char in alias:
+                    if char not in self._goto[node]:
+                        self._goto.append(dict())
+                        self._fail.append(0)
+                        self._output.append(list())
+                        self._goto[node][char] = len(self._goto) - 1
+                    node = self._goto[node][char]
+                self._output[node].append((len(alias), service))
+
+        # Breadth-first failure links, outputs of the suffix states are merged in
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] = (
+                    self._output[child] + self._output[self._fail[child]]
+                )
+
+    def matches(self, text):
+        """
+        Returns the (start, end, service) of every alias found in normalized text.
+        """
+        found = list()
+        node = 0
+        for end, char in enumerate(text, start=1):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, service in self._output[node]:
+                found.append((end - length, end, service))
+        return found
+
+
+def _is_word(text, start, end):
+    """
+    Returns True if text[start:end] is not part of a longer word, allowing a plural "s".
+    """
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    if end < len(text) and text[end] == "s":
+        end += 1
+    return end >= len(text) or not text[end].isalnum()
+
+
+_automaton = None
+
+
+def get_automaton():
+    """
+    Returns the automaton of AWS_SERVICES, compiled on first use.
+    """
+    global _automaton
+    if _automaton is None:
+        _automaton = ServiceAutomaton(AWS_SERVICES)
+    return _automaton
+
+
+def extract_services(explanation):
+    """
+    Returns the AWS services named in an architecture explanation.
+
+    Args:
+        explanation (str): The architecture explanation.
+
+    Returns:
+        list: The service names, each once, in order of first mention.
+    """
+    text = normalize(explanation)
+    candidates = [
+        match for match in get_automaton().matches(text) if _is_word(text, *match[:2])
+    ]
+    # Leftmost longest, non-overlapping
+    candidates.sort(key=lambda match: (match[0], match[0] - match[1]))
+
+    services, covered = list(), 0
+    for start, end, service in candidates:
+        if start < covered:
+            continue
+        covered = end
+        if service not in services:
+            services.append(service)
+    return services
+
+
+def service_query(services, limit=KNOWLEDGE_BASE_QUERY_LIMIT):
+    """
+    Joins service names into a knowledge base query of at most limit characters.
+    """
+    query = str()
+    for service in services:
+        candidate = f"{query}, {service}" if query else service
+        if len(candidate) > limit:
+            break
+        query = candidate
+    return query
@@ -0,0 +1,177 @@
+"""
+Warm-container cache of the template and knowledge base documents of agent sessions.
+
+One agent turn runs generate, reiterate, validate, resolve and validate again,
+and every action used to read the "v0" template from DynamoDB and the example
+documents from the METADATA item and Amazon S3. A warm container keeps both in
+memory between invocations, keyed by sessionId:
+
+- The template is stored with its version number. It is only used while the
+  session's Latest counter still equals that version, so a template written by
+  another container or the Streamlit app is never missed. Checking Latest is a
+  projected read of one number instead of the whole template.
+- The documents are chosen once per session (the METADATA item is only written
+  by the first retrieval), so they are used as long as the entry is not older
+  than the table TTL.
+
+The cache is bounded by entries and by the bytes of the cached text; the least
+recently used sessions are evicted first. A Lambda container handles one event
+at a time, so no locking is needed.
+
+Usage:
+
+session_cache = SessionCache()
+
+session_cache.start_action("/validateCloudFormation")
+template = session_cache.get_template(sessionId, latest)  # None if missing or stale
+session_cache.put_template(sessionId, latest, template)
+
+documents = session_cache.get_documents(sessionId)  # None if missing
+session_cache.put_documents(sessionId, documents)
+
+# Hits and misses of the action, logged at the end of the invocation.
+session_cache.log_action()
+"""
+
+from collections import OrderedDict
+
+import os
+import time
+
+# Sessions and bytes of template and document text kept per container.
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SessionCacheMaxEntries", "256"))
+SESSION_CACHE_MAX_BYTES = int(
+    os.environ.get("SessionCacheMaxBytes", str(32 * 1024 * 1024))
+)
+# Seconds an entry is used, the TTL of the template storage table items.
+SESSION_CACHE_TTL = float(os.environ.get("SessionCacheTTL", "900"))
+
+
+class SessionCache:
+    """
+    Size-bounded LRU of the template and example documents per session.
+    """
+
+    def __init__(
+        self,
+        max_entries=SESSION_CACHE_MAX_ENTRIES,
+        max_bytes=SESSION_CACHE_MAX_BYTES,
+        ttl=SESSION_CACHE_TTL,
+    ):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._bytes = 0
+        self._action = None
+        self._stats = dict()
+
+    def _entry(self, sessionId):
+        """
+        Returns the entry of a session, None if missing or expired.
+        """
+        entry = self._entries.get(sessionId)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["stored"] > self._ttl:
+            self._remove(sessionId)
+            return None
+        self._entries.move_to_end(sessionId)
+        return entry
+
+    def _remove(self, sessionId):
+        entry = self._entries.pop(sessionId)
+        self._bytes -= entry["size"]
+
+    def _store(self, sessionId, **values):
+        entry = self._entries.pop(sessionId, None)
+        if entry is None:
+            entry = {"version": None, "template": None, "documents": None}
+        else:
+            self._bytes -= entry["size"]
+        entry.update(values, stored=time.monotonic())
+        entry["size"] = len((entry["template"] or "").encode()) + sum(
+            len(document.encode()) for document in entry["documents"] or []
+        )
+
+        self._entries[sessionId] = entry
+        self._bytes += entry["size"]
+        while self._entries and (
+            len(self._entries) > self._max_entries or self._bytes > self._max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+
+    def _count(self, kind, hit):
+        counters = self._stats.setdefault(
+            self._action, {"template": [0, 0], "documents": [0, 0]}
+        )
+        counters[kind][0 if hit else 1] += 1
+
+    def has_template(self, sessionId):
+        """
+        Returns True if a template of the session is cached, whatever its version.
+        """
+        entry = self._entry(sessionId)
+        return entry is not None and entry["template"] is not None
+
+    def get_template(self, sessionId, latest):
+        """
+        Returns the cached template if it is the session's Latest version, else None.
+        """
+        entry = self._entry(sessionId)
+        hit = (
+            entry is not None
+            and entry["template"] is not None
+            and entry["version"] == latest
+        )
+        self._count("template", hit)
+        return entry["template"] if hit else None
+
+    def put_template(self, sessionId, version, template):
+        self._store(sessionId, version=int(version), template=template)
+
+    def get_documents(self, sessionId):
+        """
+        Returns the cached example documents of the session, None if missing.
+        """
+        entry = self._entry(sessionId)
+        hit = entry is not None and entry["documents"] is not None
+        self._count("documents", hit)
+        return entry["documents"] if hit else None
+
+    def put_documents(self, sessionId, documents):
+        self._store(sessionId, documents=list(documents))
+
+    def start_action(self, action):
+        """
+        Sets the action the following hits and misses are counted for.
+        """
+        self._action = action
+
+    def stats(self):
+        """
+        Returns the hits, misses and hit rate per action and the cache size.
+        """
+        actions = dict()
+        for action, counters in self._stats.items():
+            actions[action] = {
+                kind: {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": (
+                        round(hits / (hits + misses), 2) if hits + misses else None
+                    ),
+                }
+                for kind, (hits, misses) in counters.items()
+            }
+        return {"entries": len(self._entries), "bytes": self._bytes, "actions": actions}
+
+    def log_action(self):
+        """
+        Logs the hit rates of the current action since the container started.
+        """
+        stats = self.stats()
+        print(
+            f"Session cache {self._action}: {stats['actions'].get(self._action, {})} "
+            f"entries={stats['entries']} bytes={stats['bytes']}"
+        )
@@ -0,0 +1,537 @@
+"""
+Versioned CloudFormation template writes for the template storage table.
+
+Bodies are content addressed: a template body is stored once per session in
+a "body#<hash>" item. The "v0" head only points to the current body by its
+template_hash, next to the Latest counter and the validation result, and a
+"v<Latest>" version item only holds the template_hash of its body. Every save
+is one TransactWriteItems call, one round trip, writing the body item, the
+version item and the head, instead of an update_item on "v0" (to increment
+Latest) followed by a put_item of the version. The body is written once per
+save, to its own item only; as every item of a transaction, it is billed
+twice its write capacity.
+
+Saving the head's current template again (a reiterate or resolve that changed
+nothing) is a reference-only write: the body is not encoded or written again,
+only its ttl is updated in the same transaction, and the head keeps its
+validation result. If the body item expired meanwhile, the transaction is
+cancelled and the save is retried with the body.
+
+The body, the version and the head of a save all get the same ttl, so a body
+item never expires before a version or head referring to it.
+
+Readers follow the template_hash of the head or of a version to its body, see
+read_template_state and read_template_version.
+
+Validation results are a small attribute update of the "v0" head of the
+validated version: the template is not rewritten and no version is added.
+
+Template bodies are stored by TemplateCodec, gzip compressed as a binary
+"template" attribute with template_encoding "gzip". A compressed body larger
+than spill_bytes is uploaded once to Amazon S3 (content addressed, under
+templates/) and the body item only holds its "template_location". Heads and
+versions written before, holding their body themselves, are still read.
+
+The new version number is the Latest counter the caller last saw plus one.
+The transaction only succeeds if "v0" still holds that counter (and, for a
+reference-only write, still points to that body) and the version item does not
+exist yet. If another writer got there first, Latest is read again and the
+write is retried.
+
+This module only depends on boto3, so it is packaged with the action group
+Lambda and used by the Streamlit app's KnowledgeBase.
+
+Usage:
+
+codec = TemplateCodec(bucket=bucket, get_s3=get_s3)
+
+latest = write_template_version(table, sessionId, template, expected_latest=latest, codec=codec, expected_hash=head_hash)
+
+write_template_validity(table, sessionId, latest, is_valid, error)
+
+template = read_template_body(table, sessionId, item, codec=codec)
+template = read_template_version(table, sessionId, "v3", codec=codec)
+state = read_template_state(table, sessionId, consistent=True, codec=codec, cached=state)
+"""
+
+from botocore.exceptions import ClientError
+
+import datetime
+import gzip
+import hashlib
+import os
+
+# Seconds a template is kept in the table after its last write.
+TEMPLATE_TTL = 900
+
+# Compressed bytes above which a template is stored in Amazon S3 instead of the item.
+TEMPLATE_SPILL_BYTES = int(os.environ.get("TemplateSpillBytes", "8192"))
+
+BODY_PREFIX = "body#"
+
+# Item attributes a template body is stored in, depending on its encoding.
+# Heads and versions written before bodies were content addressed hold them too.
+TEMPLATE_ATTRIBUTES = ("template", "template_encoding", "template_location")
+TEMPLATE_PROJECTION = ", ".join(TEMPLATE_ATTRIBUTES)
+
+# Writes retried after a concurrent writer moved Latest.
+MAX_WRITE_CONFLICTS = 3
+
+
+class TemplateCodec:
+    """
+    Compresses template bodies into item attributes and back, spilling large
+    bodies to Amazon S3 when a bucket is configured.
+    """
+
+    ENCODING = "gzip"
+    PREFIX = "templates"
+
+    def __init__(self, bucket=None, get_s3=None, spill_bytes=TEMPLATE_SPILL_BYTES):
+        self._bucket = bucket
+        self._get_s3 = get_s3
+        self._spill_bytes = spill_bytes
+
+    def encode(self, template):
+        """
+        Returns the item attributes storing a template.
+
+        Args:
+            template (str): The CloudFormation template.
+
+        Returns:
+            dict: "template" (gzip bytes) or "template_location" (s3:// URI),
+                and "template_encoding".
+        """
+        # mtime=0 keeps the output, and so the spilled object key, deterministic
+        body = gzip.compress(template.encode(), compresslevel=6, mtime=0)
+        if self._bucket is None or len(body) <= self._spill_bytes:
+            return {"template": body, "template_encoding": self.ENCODING}
+
+        key = f"{self.PREFIX}/{hashlib.sha256(body).hexdigest()}.yaml.gz"
+        self._get_s3().put_object(
+            Bucket=self._bucket,
+            Key=key,
+            Body=body,
+            ContentType="application/yaml",
+            ContentEncoding=self.ENCODING,
+        )
+        return {
+            "template_location": f"s3://{self._bucket}/{key}",
+            "template_encoding": self.ENCODING,
+        }
+
+    def decode(self, item):
+        """
+        Returns the template stored in an item, as written by encode or as a plain string.
+        """
+        if "template_location" in item:
+            bucket, key = item["template_location"][len("s3://") :].split("/", 1)
+            body = self._get_s3().get_object(Bucket=bucket, Key=key)["Body"].read()
+        else:
+            body = item["template"]
+            # boto3 returns binary attributes as Binary
+            body = getattr(body, "value", body)
+
+        if item.get("template_encoding") == self.ENCODING:
+            return gzip.decompress(body).decode()
+        return body if isinstance(body, str) else body.decode()
+
+
+# Inline compression only, for callers without a bucket.
+DEFAULT_CODEC = TemplateCodec()
+
+
+def cancellation_codes(ex):
+    """
+    Returns the cancellation reason code of each item of a cancelled
+    transaction ("None" for items that did not fail), empty for other errors.
+    """
+    if not isinstance(ex, ClientError):
+        return []
+    if ex.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+        return []
+    return [
+        reason.get("Code", "None")
+        for reason in ex.response.get("CancellationReasons", [])
+    ]
+
+
+def is_write_conflict(ex):
+    """
+    Returns True if a transaction was cancelled by one of its conditions.
+    """
+    return "ConditionalCheckFailed" in cancellation_codes(ex)
+
+
+def read_latest_version(table, sessionId):
+    """
+    Returns the Latest counter of a session, 0 if nothing was stored yet.
+    """
+    item = table.get_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        ProjectionExpression="Latest",
+        ConsistentRead=True,
+    ).get("Item", {})
+    return int(item.get("Latest", 0))
+
+
+def read_template_validity(table, sessionId):
+    """
+    Returns the Latest counter and the validation result recorded on the "v0" head.
+
+    Returns:
+        tuple: Latest (0 if nothing was stored yet), is_valid (None until the
+            version is validated) and the validation error.
+    """
+    item = table.get_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        ProjectionExpression="Latest, is_valid, validation_error",
+        ConsistentRead=True,
+    ).get("Item", {})
+    return (
+        int(item.get("Latest", 0)),
+        item.get("is_valid"),
+        item.get("validation_error", ""),
+    )
+
+
+def read_template_head(table, sessionId):
+    """
+    Returns the Latest counter of a session and the hash of its current template.
+
+    Returns:
+        tuple: Latest (0 if nothing was stored yet) and template_hash (None if unknown).
+    """
+    item = table.get_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        ProjectionExpression="Latest, template_hash",
+        ConsistentRead=True,
+    ).get("Item", {})
+    return int(item.get("Latest", 0)), item.get("template_hash")
+
+
+def read_template_state(
+    table, sessionId, consistent=False, codec=DEFAULT_CODEC, cached=None
+):
+    """
+    Returns the current template of a session with its validation result:
+    one get_item of the "v0" pointer projected on Latest, template_hash and
+    the validation result, and one of the body it points to only if cached
+    does not hold that body already.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The template storage table.
+        sessionId (str): The ID of the session.
+        consistent (bool): Whether to read strongly consistent, to see a
+            write that just returned.
+        codec (TemplateCodec): Decodes the template attributes.
+        cached (dict): A state returned before, its template is reused without
+            reading (or downloading) it again if the head still points to it.
+
+    Returns:
+        dict: Latest (0 if nothing was stored yet), template (None if nothing
+            was stored yet), template_hash, is_valid (None until validated)
+            and validation_error.
+    """
+    item = table.get_item(
+        Key={"sessionId": sessionId, "version": "v0"},
+        ProjectionExpression="Latest, template_hash, is_valid, validation_error",
+        ConsistentRead=consistent,
+    ).get("Item", {})
+    if "Latest" not in item:
+        template = None
+    elif cached is not None and (
+        cached["Latest"] == int(item["Latest"])
+        or (
+            item.get("template_hash") is not None
+            and cached["template_hash"] == item["template_hash"]
+        )
+    ):
+        template = cached["template"]
+    elif "template_hash" in item:
+        template = read_template_body(table, sessionId, item, codec, consistent)
+    else:
+        # A head written before templates were hashed holds its body itself
+        item = table.get_item(
+            Key={"sessionId": sessionId, "version": "v0"}, ConsistentRead=consistent
+        )["Item"]
+        template = codec.decode(item)
+    return {
+        "Latest": int(item.get("Latest", 0)),
+        "template": template,
+        "template_hash": item.get("template_hash"),
+        "is_valid": item.get("is_valid"),
+        "validation_error": item.get("validation_error", ""),
+    }
+
+
+def template_hash(template):
+    """
+    Returns the content hash a template body is stored under.
+    """
+    return hashlib.sha256(template.encode()).hexdigest()
+
+
+def _expiry(seconds):
+    return str(
+        int((datetime.datetime.now() + datetime.timedelta(seconds=seconds)).timestamp())
+    )
+
+
+def template_write_items(
+    table_name, sessionId, version, body_hash, ttl, attributes=None
+):
+    """
+    Returns the TransactItems writing version `version` of a template, its
+    body and the "v0" head.
+
+    The first item writes the body. Without attributes the head points to the
+    body already: the body item only gets the new ttl, on the condition that it
+    still exists, and the head only gets its Latest counter and keeps its
+    validation result.
+
+    Args:
+        table_name (str): The template storage table.
+        sessionId (str): The ID of the session.
+        version (int): The new version number, the current Latest plus one.
+        body_hash (str): The template_hash of the template.
+        ttl (str): The expiry of the body, the version and the head.
+        attributes (dict): The template attributes returned by
+            TemplateCodec.encode, None for an unchanged body.
+
+    Returns:
+        list: The TransactItems of a transact_write_items call, with plain
+            values as accepted by the client of a boto3 Table resource.
+    """
+    creationDate = str(int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp()))
+    body_key = {"sessionId": sessionId, "version": f"{BODY_PREFIX}{body_hash}"}
+
+    names = {"#creationDate": "creationDate", "#ttl": "ttl"}
+    values = {
+        ":latest": version,
+        ":creationDate": creationDate,
+        ":ttl": ttl,
+        ":template_hash": body_hash,
+    }
+    assignments = ["Latest = :latest", "#creationDate = :creationDate", "#ttl = :ttl"]
+    if version > 1:
+        values[":previous"] = version - 1
+        condition = "Latest = :previous"
+    else:
+        condition = "attribute_not_exists(Latest)"
+
+    if attributes is None:
+        body = {
+            "Update": {
+                "TableName": table_name,
+                "Key": body_key,
+                "UpdateExpression": "SET #ttl = :ttl",
+                "ConditionExpression": "attribute_exists(version)",
+                "ExpressionAttributeNames": {"#ttl": "ttl"},
+                "ExpressionAttributeValues": {":ttl": ttl},
+            }
+        }
+        # The head must still point to the body the version refers to
+        condition += " AND template_hash = :template_hash"
+        update_expression = f"SET {', '.join(assignments)}"
+    else:
+        body = {
+            "Put": {
+                "TableName": table_name,
+                "Item": {
+                    **body_key,
+                    "creationDate": creationDate,
+                    "ttl": ttl,
+                    **attributes,
+                },
+            }
+        }
+        names["#is_valid"] = "is_valid"
+        values[":is_valid"] = None
+        assignments += ["template_hash = :template_hash", "#is_valid = :is_valid"]
+        # A head written before may still hold a body
+        update_expression = (
+            f"SET {', '.join(assignments)} "
+            f"REMOVE validation_error, {TEMPLATE_PROJECTION}"
+        )
+
+    return [
+        body,
+        {
+            "Put": {
+                "TableName": table_name,
+                "Item": {
+                    "sessionId": sessionId,
+                    "version": f"v{version}",
+                    "creationDate": creationDate,
+                    "ttl": ttl,
+                    "template_hash": body_hash,
+                },
+                "ConditionExpression": "attribute_not_exists(version)",
+            }
+        },
+        {
+            "Update": {
+                "TableName": table_name,
+                "Key": {"sessionId": sessionId, "version": "v0"},
+                "UpdateExpression": update_expression,
+                "ConditionExpression": condition,
+                "ExpressionAttributeNames": names,
+                "ExpressionAttributeValues": values,
+            }
+        },
+    ]
+
+
+def write_template_version(
+    table,
+    sessionId,
+    template,
+    expected_latest=None,
+    codec=DEFAULT_CODEC,
+    expected_hash=None,
+):
+    """
+    Stores a template as the next version and points the "v0" head to it, in
+    one transaction with its body.
+
+    If the template is the head's current one, the body only gets a new ttl.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The template storage table.
+        sessionId (str): The ID of the session.
+        template (str): The CloudFormation template.
+        expected_latest (int): The Latest counter last read for the session,
+            None if unknown (a new session is assumed).
+        codec (TemplateCodec): Encodes the template into item attributes.
+        expected_hash (str): The template_hash of the head's template last
+            read for the session, None if unknown.
+
+    Returns:
+        int: The version number the template was stored as.
+    """
+    body_hash = template_hash(template)
+    ttl = _expiry(TEMPLATE_TTL)
+    attributes = None
+    body_expired = False
+    latest, head_hash = expected_latest or 0, expected_hash
+    for attempt in range(MAX_WRITE_CONFLICTS + 1):
+        unchanged = latest > 0 and head_hash == body_hash and not body_expired
+        if not unchanged and attributes is None:
+            # Compressed (and spilled) once, whatever the write conflicts
+            attributes = codec.encode(template)
+        try:
+            table.meta.client.transact_write_items(
+                TransactItems=template_write_items(
+                    table.name,
+                    sessionId,
+                    latest + 1,
+                    body_hash,
+                    ttl,
+                    None if unchanged else attributes,
+                )
+            )
+        except ClientError as ex:
+            if not is_write_conflict(ex) or attempt == MAX_WRITE_CONFLICTS:
+                raise
+            if unchanged and cancellation_codes(ex)[0] == "ConditionalCheckFailed":
+                # The head's body item expired, it is written again
+                body_expired = True
+                print(f"Template body of {sessionId} expired, writing it again")
+                continue
+            latest, head_hash = read_template_head(table, sessionId)
+            print(f"Template version conflict for {sessionId}, Latest is {latest}")
+        else:
+            if unchanged:
+                print(f"Template of {sessionId} unchanged, v{latest + 1} references it")
+            return latest + 1
+
+
+def read_template_body(table, sessionId, item, codec=DEFAULT_CODEC, consistent=False):
+    """
+    Returns the template of a "v0" head or version item, read from the body
+    item its template_hash refers to.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The template storage table.
+        sessionId (str): The ID of the session.
+        item (dict): The head or version item, with template_hash.
+        codec (TemplateCodec): Decodes the template attributes.
+        consistent (bool): Whether to read the body strongly consistent.
+
+    Returns:
+        str: The CloudFormation template.
+    """
+    if "template" in item or "template_location" in item:
+        # Written before bodies were content addressed
+        return codec.decode(item)
+
+    key = {"sessionId": sessionId, "version": f"{BODY_PREFIX}{item['template_hash']}"}
+    body = table.get_item(Key=key, ConsistentRead=consistent).get("Item")
+    if body is None and not consistent:
+        # The body is written just before the head, it may not be replicated yet
+        body = table.get_item(Key=key, ConsistentRead=True).get("Item")
+    if body is None:
+        raise KeyError(f"Template body {key['version']} of {sessionId} not found")
+    return codec.decode(body)
+
+
+def read_template_version(table, sessionId, version, codec=DEFAULT_CODEC):
+    """
+    Returns the template of a version, following its reference to the body.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The template storage table.
+        sessionId (str): The ID of the session.
+        version (str): The version, "v0" for the head.
+        codec (TemplateCodec): Decodes the template attributes.
+
+    Returns:
+        str: The CloudFormation template.
+    """
+    item = table.get_item(Key={"sessionId": sessionId, "version": version})["Item"]
+    return read_template_body(table, sessionId, item, codec)
+
+
+def write_template_validity(table, sessionId, version, is_valid, error=""):
+    """
+    Records the validation result of a template version on the "v0" head.
+
+    Only is_valid and validation_error are written, and only while "v0" still
+    holds the validated version, so a result never lands on a newer template.
+
+    Args:
+        table (boto3.resources.factory.dynamodb.Table): The template storage table.
+        sessionId (str): The ID of the session.
+        version (int): The Latest counter of the validated template.
+        is_valid (bool): Whether the template is valid.
+        error (str): The validation error, empty if valid.
+
+    Returns:
+        bool: True if stored, False if the template changed since it was read.
+    """
+    try:
+        table.update_item(
+            Key={"sessionId": sessionId, "version": "v0"},
+            UpdateExpression="SET #is_valid = :is_valid, #validation_error = :error",
+            ConditionExpression="Latest = :version",
+            ExpressionAttributeNames={
+                "#is_valid": "is_valid",
+                "#validation_error": "validation_error",
+            },
+            ExpressionAttributeValues={
+                ":is_valid": is_valid,
+                ":error": error,
+                ":version": version,
+            },
+        )
+    except ClientError as ex:
+        if (
+            ex.response.get("Error", {}).get("Code")
+            != "ConditionalCheckFailedException"
+        ):
+            raise
+        print(f"Template of {sessionId} changed since version {version} was validated")
+        return False
+    return True
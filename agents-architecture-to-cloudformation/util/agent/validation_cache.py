@@ -0,0 +1,218 @@
+"""
+Cross-session cache of template validation results.
+
+The validate, resolve, validate loop of an agent turn often lands on a
+template that was already validated, and sessions generated from the same
+knowledge base examples validate the same templates. Results are keyed by the
+SHA-256 of the canonical template: parsed (comments, whitespace, quoting and
+short-form tags do not matter) and dumped as JSON with sorted keys. The key
+also covers the validator configuration, so a new resource specification or
+enabling the remote stage never reuses older results.
+
+Results are kept at two levels:
+
+- an LRU per container, checked first at no cost,
+- the template storage table, shared by all containers: one item per key
+  ("VALIDATION#<key>", "RESULT") that expires with the table TTL after
+  ValidationCacheTTL seconds. A hit is one projected get_item.
+
+The shared level only pays off when validation includes the remote
+ValidateTemplate call: the local validator takes a few milliseconds, less than
+a DynamoDB read and write, so without the remote stage only the container LRU
+is used.
+
+Only conclusive results may be stored: a throttled or failed remote call must
+not be cached as an invalid template.
+
+Usage:
+
+validation_cache = ValidationCache(get_table=get_table, shared=True)
+
+key, document = template_key(template, salt="cfn-lint 1.57.2 us-east-1")
+result = validation_cache.get(key)  # {"is_valid": ..., "error": ...} or None
+validation_cache.put(key, is_valid, error)
+
+# Hits per level since the container started.
+validation_cache.log_stats()
+"""
+
+from collections import OrderedDict
+
+import hashlib
+import json
+import os
+import time
+
+from cfn_validator import parse_template
+from patching import extract_code
+
+# Results kept per container.
+VALIDATION_CACHE_MAX_ENTRIES = int(os.environ.get("ValidationCacheMaxEntries", "1024"))
+# Seconds a result is kept in the shared table.
+VALIDATION_CACHE_TTL = int(os.environ.get("ValidationCacheTTL", str(7 * 24 * 3600)))
+
+# Partition and sort key of the shared results, next to the session items.
+VALIDATION_KEY_PREFIX = "VALIDATION#"
+VALIDATION_SORT_KEY = "RESULT"
+
+
+def canonical_template(document):
+    """
+    Returns the canonical JSON text of a parsed template.
+    """
+    return json.dumps(
+        document, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+def template_key(template, salt=""):
+    """
+    Returns the cache key of a template and the parsed template.
+
+    Templates that do not parse are keyed by their text with blank lines and
+    trailing whitespace removed.
+
+    Args:
+        template (str): The CloudFormation template, JSON or YAML.
+        salt (str): The validator configuration, part of the key.
+
+    Returns:
+        tuple: The hex key and the parsed template, None if it does not parse.
+    """
+    try:
+        document = parse_template(template)
+    except ValueError:
+        document = None
+
+    if isinstance(document, (dict, list)):
+        canonical = canonical_template(document)
+    else:
+        canonical = "\n".join(
+            line.rstrip()
+            for line in extract_code(template).splitlines()
+            if line.strip()
+        )
+    digest = hashlib.sha256(f"{salt}\n{canonical}".encode()).hexdigest()
+    return digest, document
+
+
+class ValidationCache:
+    """
+    Validation results per template key, in a container LRU over the shared table.
+    """
+
+    def __init__(
+        self,
+        get_table,
+        shared=True,
+        max_entries=VALIDATION_CACHE_MAX_ENTRIES,
+        ttl=VALIDATION_CACHE_TTL,
+    ):
+        self._get_table = get_table
+        self._shared = shared
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._stats = {"local": 0, "shared": 0, "misses": 0}
+
+    def _remember(self, key, result, expires):
+        self._entries.pop(key, None)
+        self._entries[key] = (result, expires)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        result, expires = entry
+        if expires <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _get_shared(self, key):
+        try:
+            item = (
+                self._get_table()
+                .get_item(
+                    Key={
+                        "sessionId": f"{VALIDATION_KEY_PREFIX}{key}",
+                        "version": VALIDATION_SORT_KEY,
+                    },
+                    ProjectionExpression="is_valid, validation_error, #ttl",
+                    ExpressionAttributeNames={"#ttl": "ttl"},
+                )
+                .get("Item")
+            )
+        except Exception as ex:
+            print(f"Error at validation cache read {ex}")
+            return None
+        # Expired items are deleted by DynamoDB some time after their TTL
+        if item is None or int(item.get("ttl", 0)) <= time.time():
+            return None
+        result = {
+            "is_valid": bool(item["is_valid"]),
+            "error": item.get("validation_error", ""),
+        }
+        self._remember(key, result, int(item["ttl"]))
+        return result
+
+    def get(self, key):
+        """
+        Returns the cached result of a template key, None if unknown.
+
+        Returns:
+            dict: {"is_valid": True/False, "error": Error Message} or None.
+        """
+        result = self._get_local(key)
+        if result is not None:
+            self._stats["local"] += 1
+            return result
+        result = self._get_shared(key) if self._shared else None
+        if result is not None:
+            self._stats["shared"] += 1
+            return result
+        self._stats["misses"] += 1
+        return None
+
+    def put(self, key, is_valid, error=""):
+        """
+        Stores a conclusive validation result in the container and the shared table.
+        """
+        result = {"is_valid": bool(is_valid), "error": str(error)}
+        expires = int(time.time()) + self._ttl
+        self._remember(key, result, expires)
+        if not self._shared:
+            return
+        try:
+            self._get_table().put_item(
+                Item={
+                    "sessionId": f"{VALIDATION_KEY_PREFIX}{key}",
+                    "version": VALIDATION_SORT_KEY,
+                    "is_valid": result["is_valid"],
+                    "validation_error": result["error"],
+                    "ttl": expires,
+                }
+            )
+        except Exception as ex:
+            print(f"Error at validation cache write {ex}")
+
+    def stats(self):
+        """
+        Returns the hits per level, the misses and the hit rate.
+        """
+        lookups = sum(self._stats.values())
+        hits = self._stats["local"] + self._stats["shared"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 2) if lookups else None,
+            "entries": len(self._entries),
+        }
+
+    def log_stats(self):
+        """
+        Logs the hit rates since the container started.
+        """
+        print(f"Validation cache: {self.stats()}")
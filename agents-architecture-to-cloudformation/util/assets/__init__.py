@@ -1,2 +1,3 @@
-from util.assets.streamlit_download_button import download_button
-from util.assets.kb_util import read_image, download_cfn
+from util.assets.streamlit_download_button import download_button
+from util.assets.kb_util import read_image, download_cfn
+from util.assets.stream_renderer import StreamRenderer
@@ -1,3 +1,7 @@
-from util.invoke.agent import BedrockAgent
-from util.invoke.bedrock import Bedrock
-from util.invoke.knowledgebase import KnowledgeBase
+from util.invoke.agent import BedrockAgent
+from util.invoke.bedrock import Bedrock
+from util.invoke.knowledgebase import KnowledgeBase
+from util.invoke.client_registry import get_client_registry
+from util.invoke.explain_cache import get_explain_cache
+from util.invoke.parameter_cache import get_parameter_cache
+from util.agent.retries import RetryError
@@ -0,0 +1,116 @@
+import streamlit as st
+
+from boto3.session import Session
+from botocore.config import Config
+
+import os
+import threading
+
+# Size of the HTTP connection pool of each client. Every concurrent Streamlit
+# session streaming a response holds one connection.
+MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+
+# Clients created when the Streamlit server starts.
+PREWARM_SERVICES = ("bedrock-runtime",)
+
+# Services whose calls are retried by the shared retry layer. botocore does not
+# retry them as well, which would multiply the attempts under throttling.
+RETRY_LAYER_SERVICES = ("bedrock-runtime",)
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of boto3 clients shared by every Streamlit session and rerun.
+
+    boto3 clients are thread safe, so a single client per service is built once
+    (credential resolution, endpoint resolution, connection pool) and its
+    keep-alive connections are reused by every model call.
+
+    Usage:
+
+    registry = get_client_registry()
+
+    # Get the shared Amazon Bedrock runtime client.
+    bedrock = registry.get_client("bedrock-runtime")
+
+    # Number of clients created and reused so far.
+    registry.stats()
+    """
+
+    def __init__(self, max_pool_connections=MAX_POOL_CONNECTIONS):
+        self._max_pool_connections = max_pool_connections
+        self._lock = threading.Lock()
+        self._clients = dict()
+        self._created = 0
+        self._reused = 0
+
+    def get_client(self, service_name, read_timeout=600, connect_timeout=60):
+        """
+        Returns the shared client of a service, creating it on first use.
+
+        Args:
+            service_name (str): The boto3 service name.
+            read_timeout (int): Read timeout in seconds.
+            connect_timeout (int): Connect timeout in seconds.
+
+        Returns:
+            botocore.client.BaseClient: The shared client.
+        """
+        key = (service_name, read_timeout, connect_timeout)
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._reused += 1
+                return client
+
+            # boto3 sessions are not thread safe, each client gets its own.
+            client = Session().client(
+                service_name,
+                config=Config(
+                    read_timeout=read_timeout,
+                    connect_timeout=connect_timeout,
+                    max_pool_connections=self._max_pool_connections,
+                    tcp_keepalive=True,
+                    retries=(
+                        {"total_max_attempts": 1}
+                        if service_name in RETRY_LAYER_SERVICES
+                        else None
+                    ),
+                ),
+            )
+            self._clients[key] = client
+            self._created += 1
+
+        print(f"Created {service_name} client {self.stats()}")
+        return client
+
+    def warm(self, services=PREWARM_SERVICES):
+        """
+        Creates the clients of the given services ahead of the first model call.
+        """
+        for service_name in services:
+            self.get_client(service_name)
+
+    def stats(self):
+        """
+        Returns how often clients were created and reused.
+        """
+        return {"created": self._created, "reused": self._reused}
+
+
+@st.cache_resource
+def get_client_registry():
+    """
+    Returns the registry shared across all sessions, warmed on first access.
+    """
+    registry = ClientRegistry()
+    registry.warm()
+    return registry
+
+
+def get_bedrock_runtime():
+    """
+    Returns the shared Amazon Bedrock runtime client.
+    """
+    return get_client_registry().get_client("bedrock-runtime")
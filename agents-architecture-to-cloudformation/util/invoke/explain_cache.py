@@ -0,0 +1,286 @@
+import streamlit as st
+
+from boto3.session import Session
+from PIL import Image
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import threading
+
+from util.invoke.lru_cache import LRUCache
+
+# Backend of the explain cache: "memory", "disk" or "dynamodb".
+EXPLAIN_CACHE_BACKEND = os.environ.get("EXPLAIN_CACHE_BACKEND", "memory")
+EXPLAIN_CACHE_MAX_ENTRIES = int(os.environ.get("EXPLAIN_CACHE_MAX_ENTRIES", "256"))
+EXPLAIN_CACHE_DIR = os.environ.get("EXPLAIN_CACHE_DIR", "/tmp/explain-cache")
+EXPLAIN_CACHE_TABLE = os.environ.get("EXPLAIN_CACHE_TABLE")
+EXPLAIN_CACHE_PARTITION_KEY = os.environ.get("EXPLAIN_CACHE_PARTITION_KEY", "cacheKey")
+EXPLAIN_CACHE_SORT_KEY = os.environ.get("EXPLAIN_CACHE_SORT_KEY")
+EXPLAIN_CACHE_TTL = int(os.environ.get("EXPLAIN_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Perceptual hash tier: a diagram whose dHash is within this Hamming distance of
+# a cached diagram reuses its explanation. Off by default, as a visually similar
+# but different diagram would get another image's explanation. Set
+# EXPLAIN_CACHE_PHASH=1 to enable.
+EXPLAIN_CACHE_PHASH = os.environ.get("EXPLAIN_CACHE_PHASH", "0") == "1"
+EXPLAIN_CACHE_PHASH_DISTANCE = int(os.environ.get("EXPLAIN_CACHE_PHASH_DISTANCE", "4"))
+
+
+def image_digest(image_bytes):
+    """
+    Returns the SHA-256 of the decoded pixels, so re-encoding an image with the
+    same pixels (metadata, PNG compression level) maps to the same digest.
+    Falls back to hashing the raw bytes if the image cannot be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    except Exception:
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    digest = hashlib.sha256(f"{image.width}x{image.height}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def perceptual_hash(image_bytes):
+    """
+    Returns the 64-bit difference hash (dHash) of an image, or None if it cannot be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes)).convert("L").resize((9, 8))
+    except Exception:
+        return None
+
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def fingerprint(*parts):
+    """
+    Returns the SHA-256 of the canonical JSON of the given parts.
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-process LRU backend.
+    """
+
+    def __init__(self, max_entries=EXPLAIN_CACHE_MAX_ENTRIES):
+        self._cache = LRUCache(max_entries=max_entries)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def put(self, key, explanation):
+        self._cache.put(key, explanation)
+
+
+class DiskBackend:
+    """
+    Local disk backend, one JSON file per entry. Survives server restarts.
+    """
+
+    def __init__(self, directory=EXPLAIN_CACHE_DIR):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self._directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r") as entry_file:
+                return json.load(entry_file)["explanation"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, explanation):
+        # Write to a temporary file first so readers never see partial entries.
+        temporary_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w") as entry_file:
+            json.dump({"explanation": explanation}, entry_file)
+        os.replace(temporary_path, self._path(key))
+
+
+class DynamoDBBackend:
+    """
+    DynamoDB (or DynamoDB-compatible) backend shared by every server.
+
+    Entries are stored under partition key `partition_key` and, for tables with
+    a composite key, under sort key `sort_key` with value `sort_value`.
+    """
+
+    def __init__(
+        self,
+        table_name=EXPLAIN_CACHE_TABLE,
+        partition_key=EXPLAIN_CACHE_PARTITION_KEY,
+        sort_key=EXPLAIN_CACHE_SORT_KEY,
+        sort_value="EXPLAIN",
+        ttl=EXPLAIN_CACHE_TTL,
+        endpoint_url=os.environ.get("EXPLAIN_CACHE_ENDPOINT_URL"),
+    ):
+        self._table = (
+            Session().resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+        )
+        self._partition_key = partition_key
+        self._sort_key = sort_key
+        self._sort_value = sort_value
+        self._ttl = ttl
+
+    def _key(self, key):
+        item_key = {self._partition_key: f"EXPLAIN#{key}"}
+        if self._sort_key:
+            item_key[self._sort_key] = self._sort_value
+        return item_key
+
+    def get(self, key):
+        item = self._table.get_item(Key=self._key(key)).get("Item")
+        return item["explanation"] if item else None
+
+    def put(self, key, explanation):
+        ttl = int(
+            (
+                datetime.datetime.now() + datetime.timedelta(seconds=self._ttl)
+            ).timestamp()
+        )
+        self._table.put_item(
+            Item={**self._key(key), "explanation": explanation, "ttl": ttl}
+        )
+
+
+BACKENDS = {"memory": MemoryBackend, "disk": DiskBackend, "dynamodb": DynamoDBBackend}
+
+
+class ExplainCache:
+    """
+    Content-addressed cache of architecture diagram explanations.
+
+    The key is the hash of the decoded image pixels together with the model id,
+    the prompts and the inference parameters, so any change that could alter
+    the explanation misses the cache. An opt-in perceptual hash tier
+    (EXPLAIN_CACHE_PHASH=1) catches re-exported or re-compressed copies of an
+    already explained diagram.
+
+    Usage:
+
+    cache = get_explain_cache()
+
+    explain = cache.get(image_bytes, modelId, prompts, inference_params)
+    if explain is None:
+        explain = ...  # invoke the model
+        cache.put(image_bytes, modelId, prompts, inference_params, explain)
+
+    # Number of exact hits, perceptual hits and misses.
+    cache.stats()
+    """
+
+    def __init__(
+        self,
+        backend,
+        phash=EXPLAIN_CACHE_PHASH,
+        phash_distance=EXPLAIN_CACHE_PHASH_DISTANCE,
+    ):
+        self._backend = backend
+        self._phash = phash
+        self._phash_distance = phash_distance
+        # (request fingerprint, dHash, key) of the entries stored by this process.
+        self._phash_index = LRUCache(max_entries=EXPLAIN_CACHE_MAX_ENTRIES)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "phash_hits": 0, "misses": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _keys(self, image_bytes, modelId, prompts, inference_params):
+        request = fingerprint(modelId, prompts, inference_params)
+        return request, fingerprint(request, image_digest(image_bytes))
+
+    def _find_similar(self, request, image_bytes):
+        image_phash = perceptual_hash(image_bytes)
+        if image_phash is None:
+            return None
+
+        for entry_request, entry_phash, key in self._phash_index.keys():
+            if entry_request == request and (
+                bin(entry_phash ^ image_phash).count("1") <= self._phash_distance
+            ):
+                return key
+        return None
+
+    def get(self, image_bytes, modelId, prompts, inference_params):
+        """
+        Returns the cached explanation of the image, or None.
+
+        Args:
+            image_bytes (bytes): The uploaded diagram.
+            modelId (str): The explain model id.
+            prompts (tuple): The system and user prompts of the explain request.
+            inference_params (dict): The inference parameters of the explain request.
+        """
+        request, key = self._keys(image_bytes, modelId, prompts, inference_params)
+
+        try:
+            explanation = self._backend.get(key)
+            if explanation is not None:
+                self._count("hits")
+                return explanation
+
+            if self._phash:
+                similar_key = self._find_similar(request, image_bytes)
+                if similar_key:
+                    explanation = self._backend.get(similar_key)
+                    if explanation is not None:
+                        self._count("phash_hits")
+                        return explanation
+        except Exception as ex:
+            print(f"Error at explain cache get {ex}")
+            self._count("errors")
+
+        self._count("misses")
+        return None
+
+    def put(self, image_bytes, modelId, prompts, inference_params, explanation):
+        """
+        Stores the explanation of the image.
+        """
+        request, key = self._keys(image_bytes, modelId, prompts, inference_params)
+
+        try:
+            self._backend.put(key, explanation)
+        except Exception as ex:
+            print(f"Error at explain cache put {ex}")
+            self._count("errors")
+            return
+
+        if self._phash:
+            image_phash = perceptual_hash(image_bytes)
+            if image_phash is not None:
+                self._phash_index.put((request, image_phash, key), True)
+
+    def stats(self):
+        """
+        Returns exact hits, perceptual hits, misses and backend errors.
+        """
+        return dict(self._stats)
+
+
+@st.cache_resource
+def get_explain_cache():
+    """
+    Returns the explain cache shared across all sessions, using EXPLAIN_CACHE_BACKEND.
+    """
+    return ExplainCache(backend=BACKENDS[EXPLAIN_CACHE_BACKEND]())
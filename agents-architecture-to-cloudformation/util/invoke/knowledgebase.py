@@ -1,249 +1,303 @@
-from boto3.session import Session
-from botocore.exceptions import ClientError
-from botocore.config import Config
-
-import streamlit as st
-
-import datetime
-import json
-import random
-import time
-
-
-def invoke_model(modelId, system_prompt, messages):
-    """
-    Invokes Amazon Bedrock Foundational model.
-
-    Args:
-        modelId (str): The ID or name of the foundational model to be invoked.
-        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
-        messages (list): A list of messages or input data to be processed by the model.
-
-    Returns:
-        str: The response or output generated by the model.
-    """
-
-    response = st.session_state["BEDROCK_RUNTIME_CLIENT"].invoke_model(
-        modelId=modelId,
-        body=json.dumps(
-            {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 4096,
-                "temperature": 0,
-                "system": system_prompt,
-                "messages": messages,
-            }
-        ),
-    )
-    result = json.loads(response.get("body").read())
-    response = result.get("content", [])[0]["text"]
-    return response
-
-
-def backoff_mechanism(func, modelId, system_prompt, messages):
-    """
-    Implements a backoff mechanism to handle throttling exceptions.
-
-    Args:
-        func (function): The function to be called with backoff.
-        modelId (str): The ID or name of the foundational model to be invoked.
-        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
-        messages (list): A list of messages or input data to be processed by the model.
-
-    Returns:
-        str: The response or output generated by the model.
-    """
-    MAX_RETRIES = 5  # Maximum number of retries
-    INITIAL_DELAY = 1  # Initial delay in seconds
-    MAX_DELAY = 60  # Maximum delay in second
-
-    delay = INITIAL_DELAY
-    retries = 0
-
-    while retries < MAX_RETRIES:
-        try:
-            return func(modelId=modelId, system_prompt=system_prompt, messages=messages)
-        except st.session_state[
-            "BEDROCK_RUNTIME_CLIENT"
-        ].exceptions.ThrottlingException as e:
-            print(f"Retry {retries + 1}/{MAX_RETRIES}: {e}")
-            time.sleep(delay + random.uniform(0, 1))  # Add a random jitter
-            delay = min(delay * 2, MAX_DELAY)
-            retries += 1
-
-    return False
-
-
-class KnowledgeBase:
-    """KnowledgeBase class for invoking an Amazon Bedrock knowledgebase instance.
-
-    This class provides a wrapper for invoking a knowledgebase instance hosted on Amazon Bedrock platform.
-
-    Usage:
-
-    knowledgebase = KnowledgeBase(environmentName=environmentName)
-
-    # Retrieves the metadata from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
-    metadata_uri = knowledgebase.retrieve_metadata(query, sessionId)
-
-    # Get the latest generated CloudFormation template from DynamoDB.
-    response_text = knowledgebase.get_generated_cloudformation(sessionId=agent.get_session_id())
-
-    # Reset the session.
-    knowledgebase.new_session()
-
-    The class initializes session state on first run. It reuses the session for subsequent calls for continuity.
-    """
-
-    def __init__(self, environmentName):
-        self.environmentName = environmentName
-
-        if "AGENT_RUNTIME_CLIENT" not in st.session_state:
-
-            st.session_state["AGENT_RUNTIME_CLIENT"] = Session().client(
-                "bedrock-agent-runtime", config=Config(read_timeout=600)
-            )
-
-        if "TEMPLATE_TABLE" not in st.session_state:
-
-            st.session_state["TEMPLATE_TABLE"] = (
-                Session()
-                .resource("dynamodb")
-                .Table(f"templatestorage-atc-{environmentName}")
-            )
-
-        self.KnowledgeBaseId = (
-            Session()
-            .client("ssm")
-            .get_parameter(
-                Name=f"/streamlitapp/{environmentName}/KNOWLEDGEBASEID",
-                WithDecryption=False,
-            )["Parameter"]["Value"]
-        )
-
-    def get_kb_yaml(self, sessionId, version="METADATA"):
-        """
-        Retrieves the YAML metadata from DynamoDB.
-
-        Args:
-            sessionId (str): The ID of the session.
-            version (str): The version of the metadata to retrieve.
-
-        Returns:
-            dict: The YAML metadata.
-        """
-        return st.session_state["TEMPLATE_TABLE"].get_item(
-            Key={"sessionId": sessionId, "version": version}
-        )
-
-    def get_generated_cloudformation(self, sessionId, version="v0", key="template"):
-        """
-        Retrieves the generated CloudFormation template from DynamoDB.
-
-        Args:
-            sessionId (str): The ID of the session.
-            version (str): The version of the template to retrieve.
-
-        Returns:
-            str: The generated CloudFormation template.
-        """
-        return st.session_state["TEMPLATE_TABLE"].get_item(
-            Key={"sessionId": sessionId, "version": version}
-        )["Item"][key]
-
-    def put_generated_cloudformation(self, sessionId, template):
-        """
-        Stores the generated CloudFormation template in DynamoDB.
-
-        Args:
-            sessionId (str): The ID of the session.
-            template (str): The generated CloudFormation template.
-
-        Returns:
-            bool: True if the template is stored successfully, False otherwise.
-        """
-        try:
-            creationDate = str(
-                int(datetime.datetime.now(tz=datetime.timezone.utc).timestamp())
-            )
-            ttl = str(
-                int(
-                    (
-                        datetime.datetime.now() + datetime.timedelta(seconds=900)
-                    ).timestamp()
-                )
-            )
-
-            response = st.session_state["TEMPLATE_TABLE"].update_item(
-                Key={"sessionId": sessionId, "version": "v0"},
-                # Atomic counter is used to increment the latest version
-                UpdateExpression="SET Latest = if_not_exists(Latest, :defaultval) + :incrval, #creationDate = :creationDate, #template = :template, #ttl = :ttl, #is_valud = :is_valid",
-                ExpressionAttributeNames={
-                    "#creationDate": "creationDate",
-                    "#template": "template",
-                    "#ttl": "ttl",
-                    "#is_valud": "is_valid",
-                },
-                ExpressionAttributeValues={
-                    ":creationDate": creationDate,
-                    ":template": template,
-                    ":ttl": ttl,
-                    ":defaultval": 0,
-                    ":incrval": 1,
-                    ":is_valid": None,
-                },
-                # return the affected attribute after the update
-                ReturnValues="UPDATED_NEW",
-            )
-
-            # Get the updated version
-            latest_version = response["Attributes"]["Latest"]
-
-            # Add the new item with the latest version
-            st.session_state["TEMPLATE_TABLE"].put_item(
-                Item={
-                    "sessionId": sessionId,
-                    "version": "v" + str(latest_version),
-                    "creationDate": creationDate,
-                    "template": template,
-                    "ttl": ttl,
-                }
-            )
-        except Exception as ex:
-            print(f"Error at put_generated_cloudformation {ex}")
-            return False
-        else:
-            return True
-
-    def retrieve_metadata(self, sessionId, query=None):
-        """
-        Retrieves the metadata from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
-
-        Args:
-            sessionId (str): The ID of the session.
-            query (str): The query to search for relevant documents.
-
-        Returns:
-            dict: The YAML metadata.
-        """
-        response = self.get_kb_yaml(sessionId=sessionId, version="METADATA")
-
-        if "Item" in response:
-            # TODO: "S" in response
-            relevant_documents = response["Item"]
-            print(f"Found item in dynamodb {sessionId}")
-        else:
-            print(f"Item with key {sessionId} not found.")
-            relevant_documents = self.retrieve_relevant_documents(
-                sessionId=sessionId, query=query
-            )
-
-        metadata = [v for k, v in relevant_documents.items() if "document" in k]
-
-        return metadata
-
-    def new_session(self):
-        """
-        Resets the session.
-        """
-        del st.session_state["TEMPLATE_TABLE"]
+from boto3.session import Session
+from botocore.config import Config
+
+import streamlit as st
+
+from util.agent.template_store import (
+    TemplateCodec,
+    read_template_body,
+    read_template_state,
+    read_template_version,
+    template_hash,
+    write_template_version,
+)
+from util.invoke.client_registry import get_bedrock_runtime, get_client_registry
+from util.invoke.parameter_cache import get_parameter_cache
+
+import json
+
+
+def invoke_model(modelId, system_prompt, messages):
+    """
+    Invokes Amazon Bedrock Foundational model.
+
+    Args:
+        modelId (str): The ID or name of the foundational model to be invoked.
+        system_prompt (str): The prompt or instruction to be provided to the model, setting the context or guiding the model's behavior.
+        messages (list): A list of messages or input data to be processed by the model.
+
+    Returns:
+        str: The response or output generated by the model.
+    """
+
+    response = get_bedrock_runtime().invoke_model(
+        modelId=modelId,
+        body=json.dumps(
+            {
+                "anthropic_version": "bedrock-2023-05-31",
+                "max_tokens": 4096,
+                "temperature": 0,
+                "system": system_prompt,
+                "messages": messages,
+            }
+        ),
+    )
+    result = json.loads(response.get("body").read())
+    response = result.get("content", [])[0]["text"]
+    return response
+
+
+class KnowledgeBase:
+    """KnowledgeBase class for invoking an Amazon Bedrock knowledgebase instance.
+
+    This class provides a wrapper for invoking a knowledgebase instance hosted on Amazon Bedrock platform.
+
+    Usage:
+
+    knowledgebase = KnowledgeBase(environmentName=environmentName)
+
+    # Retrieves the metadata from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
+    metadata_uri = knowledgebase.retrieve_metadata(query, sessionId)
+
+    # Get the latest generated CloudFormation template from DynamoDB.
+    response_text = knowledgebase.get_generated_cloudformation(sessionId=agent.get_session_id())
+
+    # Get the latest template and its validation result after the agent may have changed them, its body is only read if it changed.
+    state = knowledgebase.get_template_state(sessionId=agent.get_session_id(), consistent=True)
+
+    # Reset the session.
+    knowledgebase.new_session()
+
+    The class initializes session state on first run. It reuses the session for subsequent calls for continuity.
+    """
+
+    def __init__(self, environmentName):
+        self.environmentName = environmentName
+
+        if "AGENT_RUNTIME_CLIENT" not in st.session_state:
+
+            st.session_state["AGENT_RUNTIME_CLIENT"] = Session().client(
+                "bedrock-agent-runtime", config=Config(read_timeout=600)
+            )
+
+        if "TEMPLATE_TABLE" not in st.session_state:
+
+            st.session_state["TEMPLATE_TABLE"] = (
+                Session()
+                .resource("dynamodb")
+                .Table(f"templatestorage-atc-{environmentName}")
+            )
+
+        # Latest version counter last read or written per session
+        if "TEMPLATE_LATEST" not in st.session_state:
+            st.session_state["TEMPLATE_LATEST"] = dict()
+
+        # Hash of the template held by the "v0" head per session
+        if "TEMPLATE_HASH" not in st.session_state:
+            st.session_state["TEMPLATE_HASH"] = dict()
+
+        # Template and validation result last read or written per session, its
+        # template is reused while the "v0" pointer still holds its hash
+        if "TEMPLATE_STATE" not in st.session_state:
+            st.session_state["TEMPLATE_STATE"] = dict()
+
+        # Same template encoding as the action group Lambda, large templates
+        # are spilled to the bucket of the TEMPLATE_BUCKET parameter
+        if "TEMPLATE_CODEC" not in st.session_state:
+            st.session_state["TEMPLATE_CODEC"] = TemplateCodec(
+                bucket=self.get_template_bucket(environmentName),
+                get_s3=lambda: get_client_registry().get_client("s3"),
+            )
+
+        # Served from the process-wide cache, not one SSM call per rerun
+        self.KnowledgeBaseId = get_parameter_cache().get(
+            environmentName, "KNOWLEDGEBASEID"
+        )
+
+    @staticmethod
+    def get_template_bucket(environmentName):
+        """
+        Returns the bucket large templates are spilled to, None if not configured.
+        """
+        bucket = get_parameter_cache().get(
+            environmentName, "TEMPLATE_BUCKET", default=None
+        )
+        if bucket is None:
+            print(
+                "Templates are not spilled to Amazon S3: no TEMPLATE_BUCKET parameter"
+            )
+        return bucket
+
+    def get_kb_yaml(self, sessionId, version="METADATA"):
+        """
+        Retrieves the YAML metadata from DynamoDB.
+
+        Args:
+            sessionId (str): The ID of the session.
+            version (str): The version of the metadata to retrieve.
+
+        Returns:
+            dict: The YAML metadata.
+        """
+        return st.session_state["TEMPLATE_TABLE"].get_item(
+            Key={"sessionId": sessionId, "version": version}
+        )
+
+    def get_template_state(self, sessionId, consistent=False):
+        """
+        Retrieves the latest CloudFormation template with its validation result.
+
+        The agent may have written to "v0" since the last call, so its small
+        pointer item is read every time, projected on Latest, template_hash
+        and the validation result. The template body is only read if its hash
+        is not that of the template last read or written for the session, so
+        a validation or an unchanged reiterate does not read it again.
+
+        Args:
+            sessionId (str): The ID of the session.
+            consistent (bool): Whether to read strongly consistent, after the
+                agent just wrote.
+
+        Returns:
+            dict: Latest, template, template_hash, is_valid and validation_error.
+        """
+        cached = st.session_state["TEMPLATE_STATE"].get(sessionId)
+        state = read_template_state(
+            st.session_state["TEMPLATE_TABLE"],
+            sessionId,
+            consistent=consistent,
+            codec=st.session_state["TEMPLATE_CODEC"],
+            cached=cached,
+        )
+        self.remember_template_state(sessionId, state)
+        return state
+
+    def remember_template_state(self, sessionId, state):
+        """
+        Records the template state of a session and its Latest counter.
+        """
+        st.session_state["TEMPLATE_STATE"][sessionId] = state
+        st.session_state["TEMPLATE_LATEST"][sessionId] = state["Latest"]
+        st.session_state["TEMPLATE_HASH"][sessionId] = state["template_hash"]
+
+    def get_generated_cloudformation(self, sessionId, version="v0", key="template"):
+        """
+        Retrieves the generated CloudFormation template from DynamoDB.
+
+        Args:
+            sessionId (str): The ID of the session.
+            version (str): The version of the template to retrieve.
+            key (str): The attribute to return, the template is decoded.
+
+        Returns:
+            str: The generated CloudFormation template.
+        """
+        if version == "v0" and key in (
+            "Latest",
+            "template",
+            "is_valid",
+            "validation_error",
+        ):
+            return self.get_template_state(sessionId=sessionId)[key]
+
+        if version != "v0" and key == "template":
+            # Versions reference their body by hash
+            return read_template_version(
+                st.session_state["TEMPLATE_TABLE"],
+                sessionId,
+                version,
+                codec=st.session_state["TEMPLATE_CODEC"],
+            )
+
+        item = st.session_state["TEMPLATE_TABLE"].get_item(
+            Key={"sessionId": sessionId, "version": version}
+        )["Item"]
+        if "Latest" in item:
+            st.session_state["TEMPLATE_LATEST"][sessionId] = int(item["Latest"])
+            st.session_state["TEMPLATE_HASH"][sessionId] = item.get("template_hash")
+        if key == "template":
+            return read_template_body(
+                st.session_state["TEMPLATE_TABLE"],
+                sessionId,
+                item,
+                codec=st.session_state["TEMPLATE_CODEC"],
+            )
+        return item[key]
+
+    def put_generated_cloudformation(self, sessionId, template):
+        """
+        Stores the generated CloudFormation template in DynamoDB.
+
+        Args:
+            sessionId (str): The ID of the session.
+            template (str): The generated CloudFormation template.
+
+        Returns:
+            bool: True if the template is stored successfully, False otherwise.
+        """
+        try:
+            # One transaction writes the body, the version and the "v0" head pointing
+            # to it. An unchanged template only adds a version reference
+            expected_hash = st.session_state["TEMPLATE_HASH"].get(sessionId)
+            latest = write_template_version(
+                table=st.session_state["TEMPLATE_TABLE"],
+                sessionId=sessionId,
+                template=template,
+                expected_latest=st.session_state["TEMPLATE_LATEST"].get(sessionId),
+                codec=st.session_state["TEMPLATE_CODEC"],
+                expected_hash=expected_hash,
+            )
+            body_hash = template_hash(template)
+            cached = st.session_state["TEMPLATE_STATE"].get(sessionId)
+            # An unchanged template keeps its validation result
+            unchanged = cached is not None and body_hash == expected_hash
+            self.remember_template_state(
+                sessionId,
+                {
+                    "Latest": latest,
+                    "template": template,
+                    "template_hash": body_hash,
+                    "is_valid": cached["is_valid"] if unchanged else None,
+                    "validation_error": (
+                        cached["validation_error"] if unchanged else ""
+                    ),
+                },
+            )
+        except Exception as ex:
+            print(f"Error at put_generated_cloudformation {ex}")
+            return False
+        else:
+            return True
+
+    def retrieve_metadata(self, sessionId, query=None):
+        """
+        Retrieves the metadata from DynamoDB if it exists there, or from the knowledge base if the metadata is not found in DynamoDB.
+
+        Args:
+            sessionId (str): The ID of the session.
+            query (str): The query to search for relevant documents.
+
+        Returns:
+            dict: The YAML metadata.
+        """
+        response = self.get_kb_yaml(sessionId=sessionId, version="METADATA")
+
+        if "Item" in response:
+            # TODO: "S" in response
+            relevant_documents = response["Item"]
+            print(f"Found item in dynamodb {sessionId}")
+        else:
+            print(f"Item with key {sessionId} not found.")
+            relevant_documents = self.retrieve_relevant_documents(
+                sessionId=sessionId, query=query
+            )
+
+        metadata = [v for k, v in relevant_documents.items() if "document" in k]
+
+        return metadata
+
+    def new_session(self):
+        """
+        Resets the session.
+        """
+        del st.session_state["TEMPLATE_TABLE"]
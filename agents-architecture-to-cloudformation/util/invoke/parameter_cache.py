@@ -0,0 +1,194 @@
+import streamlit as st
+
+import os
+import threading
+import time
+
+from util.invoke.client_registry import get_client_registry
+
+# Seconds the parameters of an environment are served before a background refresh.
+PARAMETER_CACHE_TTL = float(os.environ.get("PARAMETER_CACHE_TTL", "300"))
+
+
+class ParameterCache:
+    """
+    Process-wide cache of the /streamlitapp/<environmentName>/ SSM parameters.
+
+    BedrockAgent and KnowledgeBase are built on every Streamlit rerun. Instead
+    of one GetParameter call (and one new client) per parameter and rerun, all
+    parameters of an environment are loaded with one paginated
+    GetParametersByPath call and served from memory. Once older than the TTL
+    they are still served while a background thread loads them again, so only
+    the first access of a server waits for SSM. A failed refresh keeps the
+    previous values.
+
+    Usage:
+
+    parameters = get_parameter_cache()
+
+    # Load the parameters of an environment ahead of the first rerun.
+    parameters.warm(environmentName)
+
+    # Get a parameter, KeyError if it does not exist.
+    agent_id = parameters.get(environmentName, "AGENT_ID")
+
+    # Get an optional parameter.
+    bucket = parameters.get(environmentName, "TEMPLATE_BUCKET", default=None)
+
+    # Hits, misses, refreshes, errors and load latency.
+    parameters.stats()
+    """
+
+    _MISSING = object()
+
+    def __init__(self, get_ssm, ttl=PARAMETER_CACHE_TTL):
+        self._get_ssm = get_ssm
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # Path: (values by name, monotonic load time)
+        self._entries = dict()
+        self._loading = dict()
+        self._refreshing = set()
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        self._loads = {"count": 0, "seconds": 0.0, "last_seconds": None}
+
+    @staticmethod
+    def path(environmentName):
+        """
+        Returns the SSM path of the parameters of an environment.
+        """
+        return f"/streamlitapp/{environmentName}/"
+
+    def _fetch(self, path):
+        start = time.perf_counter()
+        values = dict()
+        paginator = self._get_ssm().get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(
+            Path=path, Recursive=False, WithDecryption=False
+        ):
+            for parameter in page["Parameters"]:
+                values[parameter["Name"][len(path) :]] = parameter["Value"]
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._loads["count"] += 1
+            self._loads["seconds"] += seconds
+            self._loads["last_seconds"] = seconds
+            self._entries[path] = (values, time.monotonic())
+        print(f"Loaded {len(values)} parameters of {path} in {seconds * 1000:.0f} ms")
+        return values
+
+    def _load(self, path):
+        """
+        Loads a path once, concurrent first accesses wait for the same load.
+        """
+        with self._lock:
+            event = self._loading.get(path)
+            owner = event is None
+            if owner:
+                event = self._loading[path] = threading.Event()
+        if not owner:
+            event.wait()
+            with self._lock:
+                entry = self._entries.get(path)
+            if entry is None:
+                raise RuntimeError(f"Parameters of {path} could not be loaded")
+            return entry[0]
+        try:
+            return self._fetch(path)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._loading[path]
+            event.set()
+
+    def _refresh(self, path):
+        try:
+            self._fetch(path)
+            with self._lock:
+                self._stats["refreshes"] += 1
+        except Exception as ex:
+            print(
+                f"Error at parameter refresh of {path}, keeping the cached values {ex}"
+            )
+            with self._lock:
+                self._stats["errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(path)
+
+    def warm(self, environmentName):
+        """
+        Loads the parameters of an environment if they are not cached yet.
+        """
+        path = self.path(environmentName)
+        with self._lock:
+            cached = path in self._entries
+        if not cached:
+            self._load(path)
+
+    def get(self, environmentName, name, default=_MISSING):
+        """
+        Returns the value of a parameter of an environment.
+
+        Args:
+            environmentName (str): The environment of the parameters.
+            name (str): The parameter name, below /streamlitapp/<environmentName>/.
+            default: Returned if the parameter does not exist, else KeyError is raised.
+
+        Returns:
+            str: The parameter value.
+        """
+        path = self.path(environmentName)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._stats["hits"] += 1
+                values, loaded = entry
+                if (
+                    time.monotonic() - loaded >= self._ttl
+                    and path not in self._refreshing
+                ):
+                    self._refreshing.add(path)
+                    threading.Thread(
+                        target=self._refresh, args=(path,), daemon=True
+                    ).start()
+            else:
+                self._stats["misses"] += 1
+
+        if entry is None:
+            values = self._load(path)
+
+        if name in values:
+            return values[name]
+        if default is self._MISSING:
+            raise KeyError(f"Parameter {path}{name} not found")
+        return default
+
+    def stats(self):
+        """
+        Returns hits, misses, background refreshes, load errors and load latency.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            loads = dict(self._loads)
+        stats["loads"] = loads["count"]
+        stats["mean_load_ms"] = (
+            round(loads["seconds"] / loads["count"] * 1000, 1)
+            if loads["count"]
+            else None
+        )
+        stats["last_load_ms"] = (
+            round(loads["last_seconds"] * 1000, 1) if loads["count"] else None
+        )
+        return stats
+
+
+@st.cache_resource
+def get_parameter_cache():
+    """
+    Returns the parameter cache shared across all sessions.
+    """
+    return ParameterCache(get_ssm=lambda: get_client_registry().get_client("ssm"))
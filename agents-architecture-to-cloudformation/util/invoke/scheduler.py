@@ -0,0 +1,275 @@
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from collections import deque
+from contextlib import contextmanager
+
+import itertools
+import os
+import threading
+import time
+
+# Model calls running at the same time across all sessions of the server.
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_MAX_CONCURRENCY", "8"))
+
+# Input plus output tokens admitted per minute, 0 for no budget. Requests are
+# admitted with an estimate that is corrected by the reported usage.
+SCHEDULER_TOKENS_PER_MINUTE = int(
+    os.environ.get("SCHEDULER_TOKENS_PER_MINUTE", "400000")
+)
+SCHEDULER_OUTPUT_TOKENS = int(os.environ.get("SCHEDULER_OUTPUT_TOKENS", "2000"))
+
+# Priorities, lower runs first: interactive update turns before generations.
+UPDATE = 0
+GENERATE = 1
+PRIORITY_NAMES = {UPDATE: "update", GENERATE: "generate"}
+
+
+class SlotCancelled(Exception):
+    """
+    Raised by Scheduler.slot when the call is cancelled while it waits.
+    """
+
+
+def current_session_id():
+    """
+    Returns the id of the Streamlit session of the calling thread.
+    """
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else "default"
+
+
+def estimate_tokens(system_prompt, messages, output_tokens=SCHEDULER_OUTPUT_TOKENS):
+    """
+    Estimates the tokens of a converse request at 4 characters per token.
+    """
+    characters = len(system_prompt) + sum(
+        len(block.get("text", ""))
+        for message in messages
+        for block in message["content"]
+    )
+    return characters // 4 + output_tokens
+
+
+def queue_notice(data_placeholder):
+    """
+    Returns an on_wait callback showing the queue position in the placeholder.
+    """
+    if data_placeholder is None:
+        return None
+    return lambda position: data_placeholder.info(
+        f"Waiting for model capacity, position {position} in the queue"
+    )
+
+
+class _Ticket:
+    def __init__(self, seq, session_id, priority, tokens):
+        self.seq = seq
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.window_entry = None
+
+    def record_usage(self, usage):
+        """
+        Replaces the admitted token estimate with the tokens the call used.
+        """
+        if self.window_entry is not None:
+            self.window_entry[1] = usage.get("totalTokens", self.window_entry[1])
+
+
+class Scheduler:
+    """
+    Process-wide admission control for model calls of all Streamlit sessions.
+
+    A call is admitted when fewer than max_concurrency calls are running and
+    the tokens admitted in the last minute leave room for its estimate.
+    Waiting calls are ordered by priority, then fairly across sessions: each
+    session has a virtual time counting its admitted calls, and the session
+    with the lowest one goes first, so a session queuing many calls (generate
+    all, several tabs) does not starve the others.
+
+    Usage:
+
+    scheduler = get_scheduler()
+
+    with scheduler.slot(session_id, priority=UPDATE, tokens=estimate, on_wait=callback) as ticket:
+        # Invoke the model, then correct the admitted token estimate.
+        ticket.record_usage(usage)
+
+    # Queue depth, running calls, tokens in the window and wait times.
+    scheduler.stats()
+    """
+
+    def __init__(
+        self,
+        max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+        tokens_per_minute=SCHEDULER_TOKENS_PER_MINUTE,
+        window=60.0,
+    ):
+        self._cond = threading.Condition()
+        self._max_concurrency = max_concurrency
+        self._tokens_per_minute = tokens_per_minute
+        self._window_seconds = window
+        self._window = deque()
+        self._waiting = list()
+        self._running = 0
+        self._virtual_time = 0
+        self._session_time = dict()
+        self._seq = itertools.count()
+        self._max_depth = 0
+        self._admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._waits = {name: deque(maxlen=200) for name in PRIORITY_NAMES.values()}
+
+    def _order(self):
+        """
+        Returns the waiting tickets in the order they would be admitted.
+        """
+        session_time = dict(self._session_time)
+        pending = list(self._waiting)
+        order = list()
+        while pending:
+            ticket = min(
+                pending,
+                key=lambda t: (t.priority, session_time[t.session_id], t.seq),
+            )
+            pending.remove(ticket)
+            order.append(ticket)
+            session_time[ticket.session_id] += 1
+        return order
+
+    def _tokens_in_window(self, now):
+        while self._window and now - self._window[0][0] >= self._window_seconds:
+            self._window.popleft()
+        return sum(tokens for _, tokens in self._window)
+
+    def _blocked_for(self, ticket, now):
+        """
+        Returns 0 if the ticket can run now, else the seconds to wait before checking again.
+        """
+        if self._running >= self._max_concurrency:
+            return 1.0
+        if self._tokens_per_minute:
+            used = self._tokens_in_window(now)
+            # A request larger than the budget still runs, alone in the window
+            if used and used + ticket.tokens > self._tokens_per_minute:
+                return self._window[0][0] + self._window_seconds - now
+        return 0
+
+    def _admit(self, ticket, on_wait, cancelled):
+        last_position = None
+        while True:
+            with self._cond:
+                if cancelled is not None and cancelled.is_set():
+                    raise SlotCancelled()
+                now = time.monotonic()
+                order = self._order()
+                position = order.index(ticket) + 1
+                blocked_for = self._blocked_for(ticket, now) if position == 1 else 1.0
+
+                if not blocked_for:
+                    self._waiting.remove(ticket)
+                    self._running += 1
+                    self._virtual_time = self._session_time[ticket.session_id]
+                    self._session_time[ticket.session_id] += 1
+                    ticket.window_entry = [now, ticket.tokens]
+                    self._window.append(ticket.window_entry)
+
+                    name = PRIORITY_NAMES[ticket.priority]
+                    self._admitted[name] += 1
+                    self._waits[name].append(now - ticket.enqueued)
+                    self._cond.notify_all()
+                    return now - ticket.enqueued
+
+                if on_wait is None or position == last_position:
+                    timeout = max(blocked_for, 0.05)
+                    if cancelled is not None:
+                        timeout = min(timeout, 0.25)
+                    self._cond.wait(timeout=timeout)
+                    continue
+
+            # Rendered outside the lock, the position is re-checked afterwards
+            last_position = position
+            on_wait(position)
+
+    def _release(self, ticket):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(
+        self, session_id, priority=GENERATE, tokens=0, on_wait=None, cancelled=None
+    ):
+        """
+        Waits until the call may run and holds its slot for the duration of the block.
+
+        Args:
+            session_id (str): The Streamlit session making the call.
+            priority (int): UPDATE or GENERATE.
+            tokens (int): Estimated input plus output tokens.
+            on_wait (function): Called with the queue position while waiting.
+            cancelled (threading.Event): Stops waiting with SlotCancelled once set.
+
+        Yields:
+            _Ticket: The admitted call, see _Ticket.record_usage.
+        """
+        with self._cond:
+            ticket = _Ticket(next(self._seq), session_id, priority, tokens)
+            # Sessions returning from idle start at the current virtual time
+            self._session_time[session_id] = max(
+                self._session_time.get(session_id, 0), self._virtual_time
+            )
+            self._waiting.append(ticket)
+            self._max_depth = max(self._max_depth, len(self._waiting))
+
+        try:
+            waited = self._admit(ticket, on_wait, cancelled)
+        except BaseException:
+            with self._cond:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            raise
+
+        print(
+            f"Scheduler admitted {PRIORITY_NAMES[priority]} call after {waited:.2f}s {self.stats()}"
+        )
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def stats(self):
+        """
+        Returns the queue depth, running calls, tokens in the window and wait times per priority.
+        """
+        with self._cond:
+            waits = dict()
+            for name, samples in self._waits.items():
+                ordered = sorted(samples)
+                waits[name] = {
+                    "admitted": self._admitted[name],
+                    "wait_p50": (
+                        round(ordered[len(ordered) // 2], 3) if ordered else 0.0
+                    ),
+                    "wait_p90": (
+                        round(ordered[int(len(ordered) * 0.9)], 3) if ordered else 0.0
+                    ),
+                    "wait_max": round(ordered[-1], 3) if ordered else 0.0,
+                }
+            return {
+                "queue_depth": len(self._waiting),
+                "max_queue_depth": self._max_depth,
+                "running": self._running,
+                "tokens_in_window": self._tokens_in_window(time.monotonic()),
+                **waits,
+            }
+
+
+@st.cache_resource
+def get_scheduler():
+    """
+    Returns the scheduler shared across all sessions.
+    """
+    return Scheduler()
@@ -0,0 +1,34 @@
+PATCH_FORMAT_PROMPT = """
+Do not output the revised CloudFormation YAML template. Output only the edits needed on the CloudFormation YAML template in <cloudformation></cloudformation>, as a JSON array encapsulated between triple backticks (```json ```). Skip the preamble.
+
+Each edit is an object with:
+- "op": "replace" to replace an existing key, "add" to add a new key or "remove" to delete a key.
+- "path": the "/"-separated path of mapping keys, for example "Resources/WebBucket" or "Resources/WebBucket/Properties/VersioningConfiguration".
+- "content": for "replace" and "add", the complete YAML of the key including the key line, for example "VersioningConfiguration:\\n  Status: Enabled".
+
+Prefer the most specific path. Edits are applied in order.
+"""
+
+UPDATE_CLOUDFORMATION_PATCH_PROMPT = """
+I need your assistance in updating AWS CloudFormation template. Please review the following:
+
+<cloudformation>
+{{cloudformationTemplate}}
+</cloudformation>
+
+<update>
+{{updateInstruction}}
+</update>
+""" + PATCH_FORMAT_PROMPT
+
+RESOLVE_CLOUDFORMATION_PATCH_PROMPT = """
+I need your assistance in troubleshooting an issue with an AWS CloudFormation template. Please review the following:
+
+<cloudformation>
+{{cloudformationTemplate}}
+</cloudformation>
+
+<error>
+{{cloudformationInstruction}}
+</error>
+""" + PATCH_FORMAT_PROMPT
@@ -0,0 +1,124 @@
+"""
+Builds util/agent/resource_spec.json, the CloudFormation resource specification
+index used by util/agent/cfn_validator.py.
+
+The index is generated from the resource provider schemas shipped with
+cfn-lint (pip install cfn-lint), so it follows the registry without calling
+AWS. For every resource type of the region it keeps only what the validator
+checks: the top-level property names with their shape (scalar, array or
+object), the required properties and the Fn::GetAtt attributes.
+
+Usage:
+
+python util/resource_spec/build_resource_spec.py
+python util/resource_spec/build_resource_spec.py --region eu-west-1
+"""
+
+from argparse import ArgumentParser
+
+import json
+import os
+
+from cfnlint.schema import PROVIDER_SCHEMA_MANAGER
+from cfnlint.version import __version__ as cfnlint_version
+
+OUTPUT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "agent",
+    "resource_spec.json",
+)
+
+SCALAR_TYPES = ("string", "integer", "number", "boolean")
+
+
+def property_shape(schema, prop):
+    """
+    Returns "scalar", "array", "object" or "" (any) for a property schema.
+    """
+    if "$ref" in prop:
+        name = prop["$ref"].rsplit("/", 1)[-1]
+        prop = schema.get("definitions", {}).get(name, {})
+
+    types = prop.get("type")
+    if types is None and "properties" in prop:
+        types = "object"
+    if isinstance(types, str):
+        types = [types]
+    if not types:
+        return ""
+
+    shapes = {
+        "scalar" if kind in SCALAR_TYPES else kind
+        for kind in types
+        if kind in SCALAR_TYPES + ("array", "object")
+    }
+    return shapes.pop() if len(shapes) == 1 else ""
+
+
+def build(region):
+    """
+    Returns the index of every resource type of the region.
+    """
+    index = dict()
+    for resource_type in sorted(PROVIDER_SCHEMA_MANAGER.get_resource_types(region)):
+        schema = PROVIDER_SCHEMA_MANAGER.get_resource_schema(
+            region, resource_type
+        ).schema
+        properties = schema.get("properties", {})
+        read_only = {
+            pointer.split("/")[2]
+            for pointer in schema.get("readOnlyProperties", [])
+            if pointer.count("/") == 2
+        }
+
+        attributes, patterns = list(), list()
+        for attribute in PROVIDER_SCHEMA_MANAGER.get_resource_schema(
+            region, resource_type
+        ).get_atts:
+            if "\\" in attribute or "*" in attribute:
+                patterns.append(attribute)
+            else:
+                attributes.append(attribute)
+
+        entry = {
+            # Read-only properties cannot be set in a template
+            "properties": {
+                name: property_shape(schema, prop)
+                for name, prop in properties.items()
+                if name not in read_only
+            },
+            "required": sorted(schema.get("required", [])),
+            "attributes": sorted(attributes),
+        }
+        if patterns:
+            entry["attribute_patterns"] = patterns
+        index[resource_type] = entry
+    return index
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--output", default=OUTPUT)
+    args = parser.parse_args()
+
+    index = build(args.region)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "region": args.region,
+                "source": f"cfn-lint {cfnlint_version}",
+                "resources": index,
+            },
+            f,
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+    print(
+        f"Wrote {len(index)} resource types to {args.output} "
+        f"({os.path.getsize(args.output) / 1024:.0f} KB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
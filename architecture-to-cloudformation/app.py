@@ -1,122 +1,239 @@
-import streamlit as st
-
-import util
-from argparse import ArgumentParser
-
-parser = ArgumentParser()
-parser.add_argument("--modelId", type=str, default=None)
-
-args = parser.parse_args()
-st.set_page_config(
-    page_title="AWS",
-    page_icon="👋",
-    layout="wide",
-)
-
-modelId = args.modelId
-
-st.header("Architecture to CloudFormation")
-
-# Using object notation
-
-st.sidebar.header("Inference Parameters")
-Temperature = st.sidebar.slider(
-    "Temperature", min_value=0.0, max_value=1.0, step=0.1, value=0.0
-)
-Top_P = st.sidebar.slider("Top P", min_value=0.0, max_value=1.0, step=0.001, value=1.0)
-Top_K = st.sidebar.slider("Top K", min_value=0, max_value=500, step=1, value=250)
-
-# JPL adding modelId override
-if modelId is None:
-    modelId = "anthropic.claude-3-sonnet-20240229-v1:0"
-    
-modelId2 = "anthropic.claude-3-opus-20240229-v1:0"
-modelId3 = "anthropic.claude-3-5-sonnet-20240620-v1:0"
-modelId4 = "anthropic.claude-3-5-sonnet-20241022-v2:0"
-modelId5 = "anthropic.claude-3-5-haiku-20241022-v1:0"
-
-# JPL adding modelId selection
-modelId = st.sidebar.selectbox(
-    "Select Model ID",
-    [modelId, modelId2, modelId3, modelId4, modelId5],
-)
-
-# JPL adding example selection
-examples = st.sidebar.multiselect(
-    "Select Examples",
-    ["example1", "example2", "example3", "example4", "example5"],
-)
-
-# JPL adding CloudFormation Template / Terraform Template selection
-template = st.sidebar.selectbox(
-    "Select Template",
-    ["CloudFormation", "Terraform", "Mermaid",],
-)
-
-# JPL adding fedramp selection
-fedramp = st.sidebar.checkbox("Include FedRAMP")
-
-bedrock = util.Model(
-    modelId=modelId,
-    inference_params={"temperature": Temperature, "top_p": Top_P, "top_k": Top_K},
-    template=template,
-    fedramp=fedramp,
-    examples=examples,
-)
-
-if st.button("Clear", type="secondary"):
-    uploaded_file = None
-    bedrock.clear_memory()
-    bedrock.clear_explain()
-    st.rerun()
-
-uploaded_file = st.file_uploader(
-    "Upload an Architecture diagram to generate AWS CloudFormation code",
-    type=["jpeg", "png"],
-    disabled=bool(bedrock.get_explain()),
-)
-
-if uploaded_file is not None:
-
-    image, explain = st.columns((5, 5))
-
-    with image:
-        st.image(uploaded_file.getvalue())
-
-    with explain:
-
-        if bedrock.get_explain():
-            st.write(bedrock.get_explain())
-        else:
-            explain_placeholder = st.empty()
-            bedrock.invoke_explain_model(
-                uploaded_file,
-                uploaded_file.type.replace("image/", ""),
-                explain_placeholder,
-            )
-
-    if bedrock.check_memory():
-        role = "assistant"
-        for chat in bedrock.return_memory():
-            role = "human" if chat["role"] == "user" else "assistant"
-            content = chat["content"][0]["text"]
-            with st.chat_message(role):
-                st.markdown(content)
-
-
-    if not bedrock.check_memory():
-        with st.chat_message("assistant"):
-            code_placeholder = st.empty()
-
-            bedrock.invoke_code_model(code_placeholder)
-
-    if prompt := st.chat_input(
-        "Give the bot instructions to update stack...",
-    ):
-        with st.chat_message("human"):
-            st.markdown(prompt)
-
-        with st.chat_message("assistant"):
-            if bedrock.check_memory():
-                update_placeholder = st.empty()
-                bedrock.invoke_update_model(prompt, update_placeholder)
+import streamlit as st
+
+import util
+from argparse import ArgumentParser
+
+parser = ArgumentParser()
+parser.add_argument("--modelId", type=str, default=None)
+
+args = parser.parse_args()
+st.set_page_config(
+    page_title="AWS",
+    page_icon="👋",
+    layout="wide",
+)
+
+modelId = args.modelId
+
+# Build the shared Amazon Bedrock clients once per server, not per model call.
+util.get_client_registry()
+
+st.header("Architecture to CloudFormation")
+
+# Using object notation
+
+st.sidebar.header("Inference Parameters")
+Temperature = st.sidebar.slider(
+    "Temperature", min_value=0.0, max_value=1.0, step=0.1, value=0.0
+)
+Top_P = st.sidebar.slider("Top P", min_value=0.0, max_value=1.0, step=0.001, value=1.0)
+Top_K = st.sidebar.slider("Top K", min_value=0, max_value=500, step=1, value=250)
+
+# JPL adding modelId override
+if modelId is None:
+    modelId = "anthropic.claude-3-sonnet-20240229-v1:0"
+    
+modelId2 = "anthropic.claude-3-opus-20240229-v1:0"
+modelId3 = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+modelId4 = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+modelId5 = "anthropic.claude-3-5-haiku-20241022-v1:0"
+
+modelIds = [modelId, modelId2, modelId3, modelId4, modelId5]
+
+# JPL adding modelId selection
+modelId = st.sidebar.selectbox(
+    "Select Model ID",
+    modelIds,
+)
+
+# Hedged requests: code generation is also sent to this model when the
+# selected one is slow to stream its first token or fails
+hedge_modelId = st.sidebar.selectbox(
+    "Hedge with model",
+    [None] + [model for model in modelIds if model != modelId],
+    format_func=lambda model: "No hedging" if model is None else model,
+)
+hedge_delay = st.sidebar.number_input(
+    "Hedge delay (seconds)",
+    min_value=0.0,
+    max_value=60.0,
+    value=util.HEDGE_DELAY,
+    step=0.5,
+    disabled=hedge_modelId is None,
+    help="Used until enough first-token times are known, then their 90th percentile is used.",
+)
+
+# JPL adding example selection
+examples = st.sidebar.multiselect(
+    "Select Examples",
+    ["example1", "example2", "example3", "example4", "example5"],
+)
+
+# JPL adding CloudFormation Template / Terraform Template selection
+template = st.sidebar.selectbox(
+    "Select Template",
+    ["CloudFormation", "Terraform", "Mermaid",],
+)
+
+# JPL adding fedramp selection
+fedramp = st.sidebar.checkbox("Include FedRAMP")
+
+# Temperature 0 code generations are cached; bypass to force a new generation.
+bypass_generation_cache = st.sidebar.checkbox(
+    "Bypass generation cache",
+    help="Only applies when Temperature is 0.",
+)
+
+# Conversation history sent with chat updates
+history_policy = st.sidebar.selectbox(
+    "History policy",
+    list(util.HISTORY_POLICIES),
+)
+history_turns = st.sidebar.number_input(
+    "Turns kept",
+    min_value=0,
+    max_value=20,
+    value=2,
+    disabled=util.HISTORY_POLICIES[history_policy] != "last_turns",
+)
+
+# Chat updates return only the edits, applied locally to the latest template
+patch_mode = st.sidebar.checkbox(
+    "Patch mode updates",
+    help="CloudFormation and Terraform only. Falls back to full regeneration if the edits cannot be applied.",
+)
+
+# Generates CloudFormation, Terraform and Mermaid concurrently, one tab each
+generate_all = st.sidebar.checkbox(
+    "Generate all formats",
+    help="Chat updates apply to the template selected above.",
+)
+
+bedrock = util.Model(
+    modelId=modelId,
+    inference_params={"temperature": Temperature, "top_p": Top_P, "top_k": Top_K},
+    template=template,
+    fedramp=fedramp,
+    examples=examples,
+    generation_cache=not bypass_generation_cache,
+    history_policy=util.HISTORY_POLICIES[history_policy],
+    history_turns=history_turns,
+    patch_mode=patch_mode,
+    hedge_modelId=hedge_modelId,
+    hedge_delay=hedge_delay,
+)
+
+if st.button("Clear", type="secondary"):
+    uploaded_file = None
+    bedrock.clear_memory()
+    bedrock.clear_explain()
+    st.rerun()
+
+uploaded_file = st.file_uploader(
+    "Upload an Architecture diagram to generate AWS CloudFormation code",
+    type=["jpeg", "png"],
+    disabled=bool(bedrock.get_explain()),
+)
+
+if uploaded_file is not None:
+
+    image, explain = st.columns((5, 5))
+
+    with image:
+        st.image(uploaded_file.getvalue())
+
+    with explain:
+
+        if bedrock.get_explain():
+            st.write(bedrock.get_explain())
+        else:
+            explain_placeholder = st.empty()
+            try:
+                bedrock.invoke_explain_model(
+                    uploaded_file,
+                    uploaded_file.type.replace("image/", ""),
+                    explain_placeholder,
+                )
+            except util.RetryError as ex:
+                st.error(f"Amazon Bedrock call failed: {ex}")
+                st.stop()
+
+    if generate_all:
+        code_placeholders = dict()
+        for tab_template, tab in zip(util.TEMPLATES, st.tabs(util.TEMPLATES)):
+            with tab:
+                if bedrock.check_memory(tab_template):
+                    for chat in bedrock.return_memory(tab_template):
+                        role = "human" if chat["role"] == "user" else "assistant"
+                        content = chat["content"][0]["text"]
+                        with st.chat_message(role):
+                            st.markdown(content)
+                else:
+                    with st.chat_message("assistant"):
+                        code_placeholders[tab_template] = st.empty()
+
+        if code_placeholders:
+            # The templates that were generated are kept, the failed ones can be retried
+            errors = bedrock.invoke_code_models(code_placeholders)
+            for tab_template, ex in errors.items():
+                code_placeholders[tab_template].error(
+                    f"Amazon Bedrock call failed: {ex}"
+                )
+            if errors:
+                st.stop()
+
+    else:
+        if bedrock.check_memory():
+            role = "assistant"
+            for chat in bedrock.return_memory():
+                role = "human" if chat["role"] == "user" else "assistant"
+                content = chat["content"][0]["text"]
+                with st.chat_message(role):
+                    st.markdown(content)
+
+        if not bedrock.check_memory():
+            with st.chat_message("assistant"):
+                code_placeholder = st.empty()
+
+                try:
+                    bedrock.invoke_code_model(code_placeholder)
+                except util.RetryError as ex:
+                    st.error(f"Amazon Bedrock call failed: {ex}")
+                    st.stop()
+
+    if prompt := st.chat_input(
+        "Give the bot instructions to update stack...",
+    ):
+        with st.chat_message("human"):
+            st.markdown(prompt)
+
+        with st.chat_message("assistant"):
+            if bedrock.check_memory():
+                update_placeholder = st.empty()
+                try:
+                    bedrock.invoke_update_model(prompt, update_placeholder)
+                except util.RetryError as ex:
+                    st.error(f"Amazon Bedrock call failed: {ex}")
+
+
+# Rendered last so the table includes the turn of this run
+if bedrock.get_turn_usage():
+    with st.sidebar.expander("Input tokens per update turn"):
+        st.dataframe(bedrock.get_turn_usage(), hide_index=True)
+
+if bedrock.get_format_latency():
+    with st.sidebar.expander("Generate all latency (seconds)"):
+        st.dataframe(
+            [
+                {"template": name, "seconds": round(seconds, 2)}
+                for name, seconds in bedrock.get_format_latency().items()
+            ],
+            hide_index=True,
+        )
+
+if hedge_modelId is not None and bedrock.get_hedge_stats()["requests"]:
+    with st.sidebar.expander("Hedged requests"):
+        st.json(bedrock.get_hedge_stats())
+
+with st.sidebar.expander("Model scheduler"):
+    st.json(bedrock.get_scheduler_stats())
@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of ConvoChain message assembly.
+
+Compares reading and formatting every selected example on each call (the
+previous behaviour of ConvoChain.read_examples) with selecting the prebuilt
+blocks of the in-memory example corpus.
+
+Usage:
+
+python benchmarks/message_assembly.py --iterations 2000
+"""
+
+from argparse import ArgumentParser
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from util.conversation_chain import CODE_PROMPTS, ConvoChain
+from util.prompt_cache import CACHE_POINT
+from util.example_corpus import (
+    BLOCK_FORMATS,
+    EXAMPLE_FILES,
+    EXAMPLES_DIR,
+    LANGUAGES,
+)
+
+EXPLAIN = "The architecture has an Amazon API Gateway in front of an AWS Lambda function. " * 20
+EXAMPLES = ["example1", "example2", "example3", "example4", "example5"]
+
+
+def read_examples(file_path):
+    with open(file_path, "r") as template_file:
+        return template_file.read()
+
+
+def uncached_code_messages(explain, template, examples):
+    """
+    Assembles code messages the way ConvoChain did before the corpus cache.
+    """
+    content = [
+        {
+            "text": BLOCK_FORMATS["code"].format(
+                language=LANGUAGES[template],
+                example_id=example_id,
+                content=read_examples(os.path.join(EXAMPLES_DIR, file_name)),
+            )
+        }
+        for example_id, file_name in EXAMPLE_FILES[template].items()
+        if example_id in examples
+    ]
+    content.append(CACHE_POINT)
+    content.append({"text": CODE_PROMPTS[template].replace("{{ explain }}", explain)})
+    return [{"role": "user", "content": content}]
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    chain = ConvoChain()
+
+    print(f"Message assembly with all examples selected ({args.iterations} calls)")
+    print(f"{'template':<16}{'uncached us':>14}{'cached us':>12}{'speedup':>10}")
+    for template in ("CloudFormation", "Terraform"):
+        _, cached = chain.get_code_messages(EXPLAIN, template, False, EXAMPLES)
+        if cached != uncached_code_messages(EXPLAIN, template, EXAMPLES):
+            raise RuntimeError(f"{template} messages differ between both paths")
+
+        uncached_s = timeit.timeit(
+            lambda: uncached_code_messages(EXPLAIN, template, EXAMPLES),
+            number=args.iterations,
+        )
+        cached_s = timeit.timeit(
+            lambda: chain.get_code_messages(EXPLAIN, template, False, EXAMPLES),
+            number=args.iterations,
+        )
+        print(
+            f"{template:<16}{uncached_s / args.iterations * 1e6:>14.1f}"
+            f"{cached_s / args.iterations * 1e6:>12.1f}{uncached_s / cached_s:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
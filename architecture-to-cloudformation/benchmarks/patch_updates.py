@@ -0,0 +1,304 @@
+"""
+Benchmark of patch-mode chat updates against full regeneration.
+
+For every example template a one-resource update is expressed twice: as the
+full updated template (what a full regeneration returns) and as the edit
+operations of patch mode. The edits are applied locally with util.patching
+and checked against the expected template.
+
+Without --modelId or --replay the figures are estimates, not measurements:
+the patch is the hand-written edit above rather than a model response, output
+tokens are estimated at 4 characters per token, and wall-clock time is time to
+first token plus output tokens at the given decode rate, plus the local apply
+time for patches. Real patch responses are usually longer than these minimal
+edits, so the estimated speedup is an upper bound.
+
+With --modelId both prompts are sent to Amazon Bedrock, and the reported
+tokens and times are the measured ones. --record saves these responses, and
+--replay runs recorded responses through apply_patch again without Bedrock
+access: output tokens and model time are the recorded ones, the apply time is
+measured.
+
+Usage:
+
+python benchmarks/patch_updates.py
+python benchmarks/patch_updates.py --output-tokens-per-second 50 --ttft 0.8
+python benchmarks/patch_updates.py --modelId anthropic.claude-3-5-haiku-20241022-v1:0 --record recordings
+python benchmarks/patch_updates.py --replay recordings
+"""
+
+from argparse import ArgumentParser
+
+import glob
+import json
+import os
+import re
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from util.example_corpus import EXAMPLES_DIR
+from util.patching import _HclDocument, apply_patch, load_yaml
+from util.prompt_templates.patch_prompt import PATCH_PROMPT, PATCH_PROMPT_TERRAFORM
+from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
+from util.prompt_templates.sys_update_prompt_terraform import (
+    SYS_UPDATE_PROMPT_TERRAFORM,
+)
+
+FULL_PROMPT = "Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (``` ```). Skip the preamble. Think step-by-step."
+
+
+def estimate_tokens(text):
+    return len(text) // 4
+
+
+def cloudformation_update(template):
+    """
+    Returns (instruction, patch, expected) retaining the first resource on deletion.
+    """
+    resources = load_yaml(template)["Resources"]
+    name = next(iter(resources))
+    patch = [
+        {
+            "op": "add",
+            "path": f"Resources/{name}/DeletionPolicy",
+            "content": "DeletionPolicy: Retain",
+        }
+    ]
+
+    expected = dict(resources)
+    expected[name] = {**resources[name], "DeletionPolicy": "Retain"}
+    return f"Retain the {name} resource when the stack is deleted.", patch, expected
+
+
+def terraform_update(template):
+    """
+    Returns (instruction, patch, expected) preventing the destruction of the first resource.
+    """
+    match = re.search(r'^resource\s+"([^"]+)"\s+"([^"]+)"', template, re.MULTILINE)
+    path = f"resource/{match.group(1)}/{match.group(2)}"
+
+    document = _HclDocument(template)
+    start, end = document.locate(path)
+    block = "\n".join(document.lines[start:end])
+    updated_block = (
+        block[: block.rfind("}")] + "  lifecycle {\n    prevent_destroy = true\n  }\n}"
+    )
+
+    patch = [{"op": "replace", "path": path, "content": updated_block}]
+    expected = "\n".join(
+        document.lines[:start] + updated_block.splitlines() + document.lines[end:]
+    )
+    instruction = f"Prevent the destruction of {match.group(1)}.{match.group(2)}."
+    return instruction, patch, expected
+
+
+def check(template_type, patched, expected):
+    if template_type == "CloudFormation":
+        return load_yaml(patched)["Resources"] == expected
+    return patched.strip("\n") == expected.strip("\n")
+
+
+def simulate(template_type, template, instruction, patch, expected, args):
+    patch_output = f"```json\n{json.dumps(patch, indent=2)}\n```"
+    patched = apply_patch(template, patch_output, template_type)
+
+    # A full regeneration returns the whole updated template
+    full_output = f"```\n{patched}\n```"
+    apply_s = (
+        timeit.timeit(
+            lambda: apply_patch(template, patch_output, template_type), number=20
+        )
+        / 20
+    )
+
+    full_tokens = estimate_tokens(full_output)
+    patch_tokens = estimate_tokens(patch_output)
+    return {
+        "full_tokens": full_tokens,
+        "patch_tokens": patch_tokens,
+        "full_s": args.ttft + full_tokens / args.output_tokens_per_second,
+        "patch_s": args.ttft + patch_tokens / args.output_tokens_per_second + apply_s,
+        "applied": check(template_type, patched, expected),
+    }
+
+
+def converse(client, modelId, system_prompt, prompt):
+    start = time.perf_counter()
+    response = client.converse(
+        modelId=modelId,
+        system=[{"text": system_prompt}],
+        messages=[{"role": "user", "content": [{"text": prompt}]}],
+        inferenceConfig={"temperature": 0, "maxTokens": 4000},
+    )
+    elapsed = time.perf_counter() - start
+    text = response["output"]["message"]["content"][0]["text"]
+    return text, response["usage"]["outputTokens"], elapsed
+
+
+def measure(template_type, template, expected, full, patch):
+    """
+    Returns the measured result of a full and a patch response, applying the patch.
+
+    A patch that does not apply falls back to full regeneration, as in the
+    app, so its tokens and time are added to the patch side.
+    """
+    start = time.perf_counter()
+    try:
+        applied = check(
+            template_type, apply_patch(template, patch["text"], template_type), expected
+        )
+    except Exception as ex:
+        print(f"  patch not applied: {ex}")
+        applied = False
+    apply_s = time.perf_counter() - start
+
+    fallback = 0 if applied else 1
+    return {
+        "full_tokens": full["output_tokens"],
+        "patch_tokens": patch["output_tokens"] + fallback * full["output_tokens"],
+        "full_s": full["seconds"],
+        "patch_s": patch["seconds"] + apply_s + fallback * full["seconds"],
+        "applied": applied,
+    }
+
+
+def live(template_type, template, instruction, patch, expected, args, client):
+    """
+    Sends both prompts to Amazon Bedrock and returns the result and the responses.
+    """
+    system_prompt = (
+        SYS_UPDATE_PROMPT
+        if template_type == "CloudFormation"
+        else SYS_UPDATE_PROMPT_TERRAFORM
+    )
+    patch_prompt = (
+        PATCH_PROMPT if template_type == "CloudFormation" else PATCH_PROMPT_TERRAFORM
+    )
+    prompt = f"```\n{template}\n```\n\n{instruction}\n\n"
+
+    responses = {"modelId": args.modelId, "instruction": instruction}
+    for name, suffix in (("full", FULL_PROMPT), ("patch", patch_prompt)):
+        text, output_tokens, seconds = converse(
+            client, args.modelId, system_prompt, prompt + suffix
+        )
+        responses[name] = {
+            "text": text,
+            "output_tokens": output_tokens,
+            "seconds": seconds,
+        }
+
+    result = measure(
+        template_type, template, expected, responses["full"], responses["patch"]
+    )
+    return result, responses
+
+
+def recording_path(directory, template_type, path):
+    return os.path.join(directory, f"{template_type}-{os.path.basename(path)}.json")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--output-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--ttft", type=float, default=0.8)
+    parser.add_argument("--modelId", type=str, default=None)
+    parser.add_argument(
+        "--record", type=str, default=None, help="directory to save live responses to"
+    )
+    parser.add_argument(
+        "--replay", type=str, default=None, help="directory of recorded responses"
+    )
+    args = parser.parse_args()
+    if args.record and not args.modelId:
+        parser.error("--record needs --modelId")
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+
+    client = None
+    if args.modelId:
+        from boto3.session import Session
+
+        client = Session().client("bedrock-runtime")
+
+    updates = {"CloudFormation": cloudformation_update, "Terraform": terraform_update}
+    extensions = {"CloudFormation": "yaml", "Terraform": "tf"}
+
+    if client:
+        mode = f"measured, live {args.modelId}"
+    elif args.replay:
+        mode = f"measured, recorded in {args.replay}"
+    else:
+        mode = "estimated: hand-written patches, 4 characters per token, modelled times"
+    print(f"Patch mode against full regeneration ({mode})")
+    print(
+        f"{'template':<30}{'full tok':>10}{'patch tok':>11}"
+        f"{'full s':>9}{'patch s':>9}{'speedup':>9}  applied"
+    )
+
+    totals = {"full_tokens": 0, "patch_tokens": 0, "full_s": 0.0, "patch_s": 0.0}
+    for template_type, update in updates.items():
+        pattern = os.path.join(EXAMPLES_DIR, f"example*.{extensions[template_type]}")
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r") as template_file:
+                template = template_file.read()
+
+            name = f"{template_type}/{os.path.basename(path)}"
+            try:
+                instruction, patch, expected = update(template)
+            except Exception as ex:
+                # Patch mode falls back to full regeneration for these templates
+                print(f"{name:<30}skipped, not a single template: {type(ex).__name__}")
+                continue
+
+            if client:
+                result, responses = live(
+                    template_type, template, instruction, patch, expected, args, client
+                )
+                if args.record:
+                    with open(
+                        recording_path(args.record, template_type, path), "w"
+                    ) as recording:
+                        json.dump(responses, recording, indent=2)
+            elif args.replay:
+                recorded = recording_path(args.replay, template_type, path)
+                if not os.path.exists(recorded):
+                    print(f"{name:<30}skipped, no recorded responses")
+                    continue
+                with open(recorded, "r") as recording:
+                    responses = json.load(recording)
+                result = measure(
+                    template_type,
+                    template,
+                    expected,
+                    responses["full"],
+                    responses["patch"],
+                )
+            else:
+                result = simulate(
+                    template_type, template, instruction, patch, expected, args
+                )
+
+            for key in totals:
+                totals[key] += result[key]
+            print(
+                f"{name:<30}"
+                f"{result['full_tokens']:>10}{result['patch_tokens']:>11}"
+                f"{result['full_s']:>9.2f}{result['patch_s']:>9.2f}"
+                f"{result['full_s'] / result['patch_s']:>8.1f}x  {result['applied']}"
+            )
+
+    if not totals["patch_s"]:
+        return
+    print(
+        f"{'total' if client or args.replay else 'total (estimated)':<30}"
+        f"{totals['full_tokens']:>10}{totals['patch_tokens']:>11}"
+        f"{totals['full_s']:>9.2f}{totals['patch_s']:>9.2f}"
+        f"{totals['full_s'] / totals['patch_s']:>8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
-from util.model import Model
-from util.prompt_templates.code_prompt import CODE_PROMPT
-from util.prompt_templates.explain_prompt import EXPLAIN_PROMPT
-from util.prompt_templates.sys_code_prompt import SYS_CODE_PROMPT
-from util.prompt_templates.sys_explain_prompt import SYS_EXPLAIN_PROMPT
-from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
-from util.prompt_templates.code_prompt_terraform import CODE_PROMPT_TERRAFORM
-from util.prompt_templates.sys_code_prompt_terraform import SYS_CODE_PROMPT_TERRAFORM
+from util.model import Model, TEMPLATES
+from util.client_registry import get_client_registry
+from util.history import HISTORY_POLICIES
+from util.hedging import HEDGE_DELAY
+from util.retries import RetryError
+from util.prompt_templates.code_prompt import CODE_PROMPT
+from util.prompt_templates.explain_prompt import EXPLAIN_PROMPT
+from util.prompt_templates.sys_code_prompt import SYS_CODE_PROMPT
+from util.prompt_templates.sys_explain_prompt import SYS_EXPLAIN_PROMPT
+from util.prompt_templates.sys_update_prompt import SYS_UPDATE_PROMPT
+from util.prompt_templates.code_prompt_terraform import CODE_PROMPT_TERRAFORM
+from util.prompt_templates.sys_code_prompt_terraform import SYS_CODE_PROMPT_TERRAFORM
 from util.prompt_templates.sys_update_prompt_terraform import SYS_UPDATE_PROMPT_TERRAFORM
\ No newline at end of file
@@ -0,0 +1,136 @@
+import streamlit as st
+
+import os
+import threading
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "examples"
+)
+
+# Example files of every template type, in the order they are sent to the model.
+EXAMPLE_FILES = {
+    "CloudFormation": {f"example{idx}": f"example{idx}.yaml" for idx in range(1, 6)},
+    "Terraform": {f"example{idx}": f"example{idx}.tf" for idx in range(1, 6)},
+    "Mermaid": {"example1": "mermaid_example1.mer"},
+}
+
+# Name of the example language in the content blocks.
+LANGUAGES = {
+    "CloudFormation": "CloudFormation YAML code",
+    "Terraform": "Terraform tf code",
+    "Mermaid": "Mermaid code",
+}
+
+# Content block texts wrapping an example, for the first code generation ("code")
+# and for the conversation memory used by chat updates ("update").
+BLOCK_FORMATS = {
+    "code": """
+                        Take this example {language} as reference:
+                            <{example_id}>
+                                {content}
+                            </{example_id}>
+                            """,
+    "update": """
+                            Take this example {language} as a reference <{example_id}></{example_id}>:
+                            <{example_id}>
+                                {content}
+                            </{example_id}>
+                            """,
+}
+
+
+class ExampleCorpus:
+    """
+    Process-wide cache of the few-shot examples in data/examples.
+
+    Each example file is read once and kept together with its ready-to-send
+    "code" and "update" content blocks. An entry is rebuilt when the file's
+    modification time changes, so edited examples are picked up without a restart.
+
+    Usage:
+
+    corpus = get_example_corpus()
+
+    # Content blocks of the selected examples, in example order.
+    blocks = corpus.get_blocks("CloudFormation", ["example1", "example3"], "code")
+
+    The returned blocks are shared between sessions and must not be mutated.
+    """
+
+    def __init__(self, examples_dir=EXAMPLES_DIR):
+        self._examples_dir = examples_dir
+        self._lock = threading.Lock()
+        self._entries = dict()
+        self._loads = 0
+        self._hits = 0
+
+    def _load(self, template, example_id, path, mtime):
+        with open(path, "r") as template_file:
+            content = template_file.read()
+
+        blocks = {
+            purpose: {
+                "text": block_format.format(
+                    language=LANGUAGES[template],
+                    example_id=example_id,
+                    content=content,
+                )
+            }
+            for purpose, block_format in BLOCK_FORMATS.items()
+        }
+
+        return {"mtime": mtime, "content": content, "blocks": blocks}
+
+    def _get_entry(self, template, example_id):
+        path = os.path.join(self._examples_dir, EXAMPLE_FILES[template][example_id])
+        mtime = os.stat(path).st_mtime_ns
+        key = (template, example_id)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry["mtime"] == mtime:
+            self._hits += 1
+            return entry
+
+        with self._lock:
+            entry = self._load(template, example_id, path, mtime)
+            self._entries[key] = entry
+            self._loads += 1
+        return entry
+
+    def get_content(self, template, example_id):
+        """
+        Returns the raw text of one example.
+        """
+        return self._get_entry(template, example_id)["content"]
+
+    def get_blocks(self, template, examples, purpose):
+        """
+        Returns the content blocks of the selected examples.
+
+        Args:
+            template (str): One of "CloudFormation", "Terraform" or "Mermaid".
+            examples (list): Selected example ids, e.g. ["example1", "example2"].
+            purpose (str): "code" for code generation, "update" for the chat memory.
+
+        Returns:
+            list: Content blocks in example order.
+        """
+        return [
+            self._get_entry(template, example_id)["blocks"][purpose]
+            for example_id in EXAMPLE_FILES[template]
+            if example_id in examples
+        ]
+
+    def stats(self):
+        """
+        Returns the number of file loads and cache hits.
+        """
+        return {"loads": self._loads, "hits": self._hits}
+
+
+@st.cache_resource
+def get_example_corpus():
+    """
+    Returns the example corpus shared across all sessions.
+    """
+    return ExampleCorpus()
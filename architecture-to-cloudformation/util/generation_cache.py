@@ -0,0 +1,106 @@
+import streamlit as st
+
+import hashlib
+import json
+import os
+
+from util.lru_cache import LRUCache
+from util.stream_renderer import StreamRenderer
+
+GENERATION_CACHE_MAX_ENTRIES = int(
+    os.environ.get("GENERATION_CACHE_MAX_ENTRIES", "128")
+)
+GENERATION_CACHE_TTL = float(os.environ.get("GENERATION_CACHE_TTL", "3600"))
+
+
+def generation_fingerprint(modelId, inference_params, system_prompt, messages):
+    """
+    Returns the SHA-256 of the canonical JSON of a converse request.
+
+    Args:
+        modelId (str): The invoked model id.
+        inference_params (dict): Temperature, top_p and top_k of the request.
+        system_prompt (str): The system prompt.
+        messages (list): The converse messages.
+    """
+    request = {
+        "modelId": modelId,
+        "inference_params": inference_params,
+        "system": system_prompt,
+        "messages": messages,
+    }
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class GenerationCache:
+    """
+    Process-wide cache of code generation results.
+
+    Only deterministic requests (temperature 0) are cached: the same assembled
+    system prompt and messages then yield an equivalent template, so the stored
+    result is replayed instead of paying for a new generation.
+
+    Usage:
+
+    cache = get_generation_cache()
+
+    if cache.is_cacheable(inference_params):
+        code = cache.get(modelId, inference_params, system_prompt, messages)
+
+    # Replays a cached result into the placeholder like a streamed response.
+    cache.replay(code, data_placeholder)
+
+    cache.put(modelId, inference_params, system_prompt, messages, code)
+    """
+
+    def __init__(
+        self, max_entries=GENERATION_CACHE_MAX_ENTRIES, ttl=GENERATION_CACHE_TTL
+    ):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def is_cacheable(self, inference_params):
+        """
+        Returns True if the request is deterministic enough to reuse its result.
+        """
+        return inference_params["temperature"] == 0
+
+    def get(self, modelId, inference_params, system_prompt, messages):
+        """
+        Returns the cached result of the request, or None.
+        """
+        return self._cache.get(
+            generation_fingerprint(modelId, inference_params, system_prompt, messages)
+        )
+
+    def put(self, modelId, inference_params, system_prompt, messages, result):
+        """
+        Stores the result of the request.
+        """
+        self._cache.put(
+            generation_fingerprint(modelId, inference_params, system_prompt, messages),
+            result,
+        )
+
+    def replay(self, result, data_placeholder):
+        """
+        Renders a cached result through the same renderer as a streamed response.
+        """
+        renderer = StreamRenderer(data_placeholder)
+        renderer.write(result)
+        return renderer.close()
+
+    def stats(self):
+        """
+        Returns hit, miss, expiration and eviction counts and the current size.
+        """
+        return self._cache.stats()
+
+
+@st.cache_resource
+def get_generation_cache():
+    """
+    Returns the generation cache shared across all sessions.
+    """
+    return GenerationCache()
@@ -0,0 +1,354 @@
+from collections import deque
+from contextlib import ExitStack
+
+import functools
+import os
+import queue
+import threading
+import time
+
+from util.client_registry import get_bedrock_runtime
+from util.prompt_cache import cache_usage, get_system_blocks, prepare_messages
+from util.scheduler import (
+    GENERATE,
+    SlotCancelled,
+    current_session_id,
+    estimate_tokens,
+    get_scheduler,
+    queue_notice,
+)
+from util.stream_renderer import StreamRenderer
+
+# Seconds without a first token before the secondary model is started.
+HEDGE_DELAY = float(os.environ.get("HEDGE_DELAY", "2.0"))
+
+# Once HEDGE_MIN_SAMPLES first-token times of the primary model are known, the
+# delay is their HEDGE_PERCENTILE percentile instead of HEDGE_DELAY.
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "10"))
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of values, None if empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class HedgeStats:
+    """
+    Process-wide first-token times and outcomes of hedged requests.
+
+    For every hedged race the loser keeps running until its own first token,
+    so the time saved by the winner is measured rather than estimated.
+    """
+
+    def __init__(self, max_samples=200):
+        self._lock = threading.Lock()
+        self._ttft = dict()
+        self._max_samples = max_samples
+        self._totals = {"requests": 0, "hedged": 0, "failovers": 0}
+        self._wins = dict()
+        self._gains = deque(maxlen=max_samples)
+
+    def record_ttft(self, modelId, seconds):
+        """
+        Records a first-token time, measured from the start of the model's own request.
+        """
+        with self._lock:
+            self._ttft.setdefault(modelId, deque(maxlen=self._max_samples)).append(
+                seconds
+            )
+
+    def hedge_delay(self, modelId, default=HEDGE_DELAY):
+        """
+        Returns the seconds to wait for the first token of modelId before hedging.
+        """
+        with self._lock:
+            samples = list(self._ttft.get(modelId, []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return default
+        return percentile(samples, HEDGE_PERCENTILE)
+
+    def record_request(self, winner, hedged, failover):
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["hedged"] += int(hedged)
+            self._totals["failovers"] += int(failover)
+            self._wins[winner] = self._wins.get(winner, 0) + 1
+
+    def record_gain(self, seconds):
+        """
+        Records the first-token time saved by a secondary model winning the race.
+        """
+        with self._lock:
+            self._gains.append(seconds)
+
+    def stats(self):
+        """
+        Returns request counts, wins per model, first-token percentiles per model and gains.
+        """
+        with self._lock:
+            ttft = {
+                modelId: {
+                    "p50": percentile(list(samples), 50),
+                    "p90": percentile(list(samples), 90),
+                    "p99": percentile(list(samples), 99),
+                }
+                for modelId, samples in self._ttft.items()
+            }
+            gains = list(self._gains)
+            return {
+                **self._totals,
+                "wins": dict(self._wins),
+                "ttft": ttft,
+                "gain_mean": sum(gains) / len(gains) if gains else 0.0,
+                "gain_p90": percentile(gains, 90) or 0.0,
+            }
+
+
+hedge_stats = HedgeStats()
+
+
+class _Lane(threading.Thread):
+    """
+    One streaming converse request. Stream events are put on the shared queue
+    and consumed by the script thread, which alone renders the winner.
+
+    Every lane holds a scheduler slot until it stops, so a hedged race never
+    runs more Bedrock requests than it holds slots. With slot, the lane waits
+    for its own one. Otherwise ticket is a slot admitted by the caller, which
+    the lane releases with release.
+    """
+
+    def __init__(self, modelId, request, events, slot=None, ticket=None, release=None):
+        super().__init__(daemon=True)
+        self.modelId = modelId
+        self.ticket = ticket
+        self.first_token_at = None
+        self._slot = slot
+        self._release = release
+        self._request = request
+        self._events = events
+        self._cancelled = threading.Event()
+        self._on_first_token = None
+        self._lock = threading.Lock()
+
+    def cancel(self, on_first_token=None):
+        """
+        Stops the lane. With on_first_token, the lane first waits for its first
+        token and calls on_first_token(lane), so the race can be measured.
+        """
+        with self._lock:
+            self._on_first_token = on_first_token
+            self._cancelled.set()
+            # The first token may already have been streamed
+            if on_first_token and self.first_token_at is not None:
+                on_first_token(self)
+
+    def run(self):
+        try:
+            if self._slot is None:
+                self._stream()
+            else:
+                with self._slot(cancelled=self._cancelled) as self.ticket:
+                    self._stream()
+        except SlotCancelled:
+            # The race was decided while the lane waited for its slot
+            pass
+        except Exception as ex:
+            self._events.put((self, ex))
+        finally:
+            if self._release is not None:
+                self._release()
+
+    def _stream(self):
+        start = time.perf_counter()
+        try:
+            response = get_bedrock_runtime().converse_stream(
+                modelId=self.modelId,
+                messages=prepare_messages(self.modelId, self._request["messages"]),
+                system=get_system_blocks(self.modelId, self._request["system_prompt"]),
+                inferenceConfig=self._request["inferenceConfig"],
+                additionalModelRequestFields=self._request[
+                    "additionalModelRequestFields"
+                ],
+            )
+            stream = response.get("stream") or []
+            for event in stream:
+                if "contentBlockDelta" in event and self.first_token_at is None:
+                    with self._lock:
+                        self.first_token_at = time.perf_counter()
+                        if self._cancelled.is_set() and self._on_first_token:
+                            self._on_first_token(self)
+                    hedge_stats.record_ttft(self.modelId, self.first_token_at - start)
+
+                if self._cancelled.is_set():
+                    if self.first_token_at is not None or not self._on_first_token:
+                        stream.close()
+                        return
+                    continue
+
+                self._events.put((self, event))
+            self._events.put((self, None))
+        except Exception as ex:
+            self._events.put((self, ex))
+
+
+def invoke_hedged_model(
+    modelId,
+    inference_params,
+    messages,
+    system_prompt,
+    data_placeholder=None,
+    usage=None,
+    secondary_modelId=None,
+    hedge_delay=HEDGE_DELAY,
+    priority=GENERATE,
+):
+    """
+    Invokes modelId and, if it has not streamed a first token after the hedge
+    delay or fails before it, the same request on secondary_modelId. The first
+    model to stream a token is rendered and the other one is cancelled.
+
+    Takes the same arguments as conversation_chain.invoke_model, plus:
+        secondary_modelId (str): The hedge model, None to disable hedging.
+        hedge_delay (float): Seconds to wait for a first token before hedging,
+            until HEDGE_MIN_SAMPLES first-token times of modelId are known and
+            their HEDGE_PERCENTILE percentile is used instead.
+
+    Returns:
+        tuple: The response of the winning model and the modelId that won.
+    """
+    request = {
+        "messages": messages,
+        "system_prompt": system_prompt,
+        "inferenceConfig": {
+            "maxTokens": 4000,
+            "temperature": inference_params["temperature"],
+            "topP": inference_params["top_p"],
+        },
+        "additionalModelRequestFields": {"top_k": inference_params["top_k"]},
+    }
+    hedge_delay = hedge_stats.hedge_delay(modelId, default=hedge_delay)
+    slot = functools.partial(
+        get_scheduler().slot,
+        session_id=current_session_id(),
+        priority=priority,
+        tokens=estimate_tokens(system_prompt, messages),
+    )
+
+    # The primary lane is admitted here, so the queue position is shown, and
+    # releases its slot once it stops: a losing primary streams on until its
+    # first token to measure the race. The secondary lane waits for its own.
+    events = queue.Queue()
+    with ExitStack() as stack:
+        ticket = stack.enter_context(slot(on_wait=queue_notice(data_placeholder)))
+        primary = _Lane(
+            modelId, request, events, ticket=ticket, release=stack.pop_all().close
+        )
+    primary.start()
+
+    return _race(
+        primary,
+        events,
+        request,
+        slot,
+        data_placeholder,
+        usage,
+        secondary_modelId,
+        hedge_delay,
+    )
+
+
+def _race(
+    primary,
+    events,
+    request,
+    slot,
+    data_placeholder,
+    usage,
+    secondary_modelId,
+    hedge_delay,
+):
+    modelId = primary.modelId
+    started = time.perf_counter()
+    lanes = [primary]
+    errors = dict()
+    failover = False
+    winner = None
+
+    def start_secondary():
+        secondary = _Lane(secondary_modelId, request, events, slot=slot)
+        secondary.start()
+        lanes.append(secondary)
+
+    renderer = StreamRenderer(data_placeholder)
+    while True:
+        timeout = None
+        if winner is None and secondary_modelId and len(lanes) == 1:
+            timeout = max(hedge_delay - (time.perf_counter() - started), 0)
+
+        try:
+            lane, event = events.get(timeout=timeout)
+        except queue.Empty:
+            print(
+                f"Hedging {modelId} with {secondary_modelId} after {hedge_delay:.2f}s"
+            )
+            start_secondary()
+            continue
+
+        if isinstance(event, Exception):
+            if lane is winner:
+                raise event
+            errors[lane.modelId] = event
+            if winner is None and secondary_modelId and len(lanes) == 1:
+                print(f"Failing over from {modelId} to {secondary_modelId}: {event}")
+                failover = True
+                start_secondary()
+            elif winner is None and len(errors) == len(lanes):
+                raise errors[modelId]
+            continue
+
+        if winner is None:
+            # The first lane streaming text (or finishing) wins the race
+            if event is not None and "contentBlockDelta" not in event:
+                continue
+            winner = lane
+            # None when the winner finished without streaming any text
+            winner_first_token_at = winner.first_token_at
+            for loser in lanes:
+                if (
+                    loser is primary
+                    and loser is not winner
+                    and winner_first_token_at is not None
+                ):
+                    # Time saved: when the primary would have streamed its first token
+                    loser.cancel(
+                        on_first_token=lambda primary_lane: hedge_stats.record_gain(
+                            primary_lane.first_token_at - winner_first_token_at
+                        )
+                    )
+                elif loser is not winner:
+                    loser.cancel()
+        elif lane is not winner:
+            continue
+
+        if event is None:
+            break
+        if "contentBlockDelta" in event:
+            renderer.write(event["contentBlockDelta"]["delta"]["text"])
+        elif "metadata" in event:
+            cache_usage.record(lane.modelId, event["metadata"].get("usage", {}))
+            lane.ticket.record_usage(event["metadata"].get("usage", {}))
+            if usage is not None:
+                usage.update(event["metadata"].get("usage", {}))
+
+    result = renderer.close()
+    hedge_stats.record_request(winner.modelId, hedged=len(lanes) > 1, failover=failover)
+    print(f"Hedged request won by {winner.modelId} {hedge_stats.stats()}")
+    return result, winner.modelId
@@ -0,0 +1,120 @@
+HISTORY_POLICIES = {
+    "Full conversation": "full",
+    "Latest template only": "latest",
+    "Last N turns": "last_turns",
+    "Summarized instructions": "summarized",
+}
+
+
+def _user_message(text):
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def _text(message):
+    return message["content"][0]["text"]
+
+
+class HistoryPolicy:
+    """
+    Builds the messages of an update request from the conversation memory.
+
+    The memory is [prefix, template, instruction, template, ...]: the prefix is
+    the first user message (examples and explanation, ending in a cachePoint)
+    and is always sent unchanged so the cached prefix stays valid. Policies
+    choose which later turns are sent.
+
+    The returned list shares the memory's message dicts instead of copying
+    them; only the new user message is created. Neither must be mutated.
+
+    Usage:
+
+    policy = get_history_policy("latest")
+    messages = policy.build(st.session_state["messages"], instruction)
+    """
+
+    def select(self, memory):
+        """
+        Returns the turns sent after the prefix, ending with an assistant template.
+        """
+        return memory[1:]
+
+    def instruction(self, memory, instruction):
+        """
+        Returns the text of the new user message.
+        """
+        return instruction
+
+    def build(self, memory, instruction):
+        """
+        Args:
+            memory (list): The conversation memory, starting with the prefix.
+            instruction (str): The new update instruction.
+
+        Returns:
+            list: The messages of the update request.
+        """
+        return (
+            [memory[0]]
+            + self.select(memory)
+            + [_user_message(self.instruction(memory, instruction))]
+        )
+
+
+class LatestTemplate(HistoryPolicy):
+    """
+    Sends only the most recent template.
+    """
+
+    def select(self, memory):
+        return memory[-1:]
+
+
+class LastTurns(HistoryPolicy):
+    """
+    Sends the last `turns` instruction/template pairs, preceded by the
+    template the oldest kept instruction was applied to.
+    """
+
+    def __init__(self, turns=2):
+        self._turns = max(int(turns), 0)
+
+    def select(self, memory):
+        return memory[max(len(memory) - 1 - 2 * self._turns, 1) :]
+
+
+class SummarizedInstructions(HistoryPolicy):
+    """
+    Sends the most recent template and folds the previous instructions into
+    the new user message as a list.
+    """
+
+    def select(self, memory):
+        return memory[-1:]
+
+    def instruction(self, memory, instruction):
+        previous = [_text(message) for message in memory[2::2]]
+        if not previous:
+            return instruction
+
+        applied = "\n".join(f"- {text}" for text in previous)
+        return (
+            f"Instructions already applied to the template:\n{applied}\n\n"
+            f"New instruction:\n{instruction}"
+        )
+
+
+def get_history_policy(name, turns=2):
+    """
+    Returns the history policy.
+
+    Args:
+        name (str): One of the values of HISTORY_POLICIES.
+        turns (int): Number of turns kept by the "last_turns" policy.
+    """
+    if name == "latest":
+        return LatestTemplate()
+    if name == "last_turns":
+        return LastTurns(turns)
+    if name == "summarized":
+        return SummarizedInstructions()
+    return HistoryPolicy()
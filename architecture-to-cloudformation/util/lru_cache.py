@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+import threading
+import time
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with an optional time to live.
+
+    Usage:
+
+    cache = LRUCache(max_entries=128, ttl=3600)
+
+    cache.put(key, value)
+    value = cache.get(key)  # None if missing or expired
+
+    # Number of hits, misses, expirations and evictions.
+    cache.stats()
+    """
+
+    def __init__(self, max_entries=128, ttl=None):
+        """
+        Args:
+            max_entries (int): Maximum number of entries before the least recently used is evicted.
+            ttl (float): Seconds an entry stays valid, None to never expire.
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def get(self, key):
+        """
+        Returns the cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries above max_entries.
+        """
+        expires_at = time.monotonic() + self._ttl if self._ttl is not None else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def pop(self, key):
+        """
+        Removes and returns a value, None if missing.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def keys(self):
+        """
+        Returns a snapshot of the keys, least recently used first.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns hit, miss, expiration and eviction counts and the current size.
+        """
+        return {**self._stats, "size": len(self._entries)}
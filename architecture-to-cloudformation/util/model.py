@@ -1,115 +1,400 @@
-import streamlit as st
-
-from util.conversation_chain import ConvoChain, backoff_mechanism, invoke_model
-
-import copy
-
-class Model:
-    def __init__(self, inference_params, modelId, template, fedramp, examples) -> None:
-        self._chain = ConvoChain()
-        self._inference_params = inference_params
-        self._modelId = modelId
-        self._template = template
-        self._examples = examples
-        self._fedramp = fedramp
-
-    def invoke_explain_model(self, image, image_type, data_placeholder):
-
-        system_prompt, messages = self._chain.get_explain_messages(image, image_type)
-
-        # print("###### Explain ######")
-        # print(messages)
-        # print("###### Explain ######")
-
-        explain = backoff_mechanism(
-            func=invoke_model,
-            modelId=self._modelId,
-            inference_params=self._inference_params,
-            messages=messages,
-            system_prompt=system_prompt,
-            data_placeholder=data_placeholder,
-        )
-
-        if "explain" in st.session_state:
-            del st.session_state["explain"]
-        else:
-            st.session_state["explain"] = explain
-
-    def invoke_code_model(self, data_placeholder):
-
-        if "explain" not in st.session_state:
-            raise BaseException("explain not found")
-
-        system_prompt, messages = self._chain.get_code_messages(
-            st.session_state["explain"], self._template, self._fedramp, self._examples
-        )
-
-        initial_cfn_code = backoff_mechanism(
-            func=invoke_model,
-            modelId=self._modelId,
-            inference_params=self._inference_params,
-            messages=messages,
-            system_prompt=system_prompt,
-            data_placeholder=data_placeholder,
-        )
-
-        if not self.check_memory():
-            st.session_state["system_prompt"], st.session_state["messages"] = (
-                self._chain.get_update_messages(
-                    initial_cfn_code, st.session_state["explain"], self._template, self._fedramp, self._examples
-                )
-            )
-
-    def invoke_update_model(self, update_instructions, data_placeholder):
-
-        # model = self._chain.get_llm()
-
-        messages = copy.deepcopy(st.session_state["messages"])
-        
-        messages.append(
-            {"role": "user", "content": [{"text": update_instructions + "\n\n" + "Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (``` ```). Skip the preamble. Think step-by-step."}]}
-        )
-        st.session_state["messages"].append(
-            {"role": "user", "content": [{"text": update_instructions}]}
-        )
-
-        # print("###### update ######")
-        # print( st.session_state["memory"])
-        # print("###### update ######")
-
-        cfn_code = backoff_mechanism(
-            func=invoke_model,
-            modelId=self._modelId,
-            inference_params=self._inference_params,
-            messages=messages,
-            system_prompt=st.session_state["system_prompt"],
-            data_placeholder=data_placeholder,
-        )
-
-        st.session_state["messages"].append(
-            {"role": "assistant", "content": [{"text": cfn_code}]}
-        )
-
-    def clear_memory(self):
-        if self.check_memory():
-            del st.session_state["messages"]
-            del st.session_state["system_prompt"]
-
-    def check_memory(self):
-        if "messages" in st.session_state or "system_prompt" in st.session_state:
-            return True
-        else:
-            return False
-
-    def return_memory(self):
-        return st.session_state["messages"][1:]
-
-    def get_explain(self):
-        if "explain" in st.session_state:
-            return st.session_state["explain"]
-
-        return False
-
-    def clear_explain(self):
-        if self.get_explain():
-            del st.session_state["explain"]
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from concurrent.futures import ThreadPoolExecutor
+
+import functools
+import os
+import threading
+import time
+
+from util.conversation_chain import ConvoChain, invoke_model
+from util.explain_cache import get_explain_cache
+from util.generation_cache import get_generation_cache
+from util.hedging import HEDGE_DELAY, hedge_stats, invoke_hedged_model
+from util.history import get_history_policy
+from util.patching import PatchError, apply_patch, extract_code
+from util.retries import RetryError, backoff_mechanism, deadline_in
+from util.scheduler import UPDATE, get_scheduler
+from util.prompt_templates.patch_prompt import PATCH_PROMPT, PATCH_PROMPT_TERRAFORM
+
+# Templates supporting patch-mode updates and the language of their code blocks.
+PATCH_PROMPTS = {"CloudFormation": PATCH_PROMPT, "Terraform": PATCH_PROMPT_TERRAFORM}
+CODE_LANGUAGES = {"CloudFormation": "yaml", "Terraform": "hcl"}
+
+# Templates generated by "generate all", and the size of its thread pool.
+TEMPLATES = ("CloudFormation", "Terraform", "Mermaid")
+GENERATE_ALL_WORKERS = int(os.environ.get("GENERATE_ALL_WORKERS", "3"))
+
+# Seconds a model call, including its retries, may take before giving up.
+MODEL_DEADLINE = float(os.environ.get("MODEL_DEADLINE", "600"))
+
+
+class Model:
+    def __init__(
+        self,
+        inference_params,
+        modelId,
+        template,
+        fedramp,
+        examples,
+        generation_cache=True,
+        history_policy="full",
+        history_turns=2,
+        patch_mode=False,
+        hedge_modelId=None,
+        hedge_delay=HEDGE_DELAY,
+    ) -> None:
+        self._chain = ConvoChain()
+        self._inference_params = inference_params
+        self._modelId = modelId
+        self._template = template
+        self._examples = examples
+        self._fedramp = fedramp
+        self._generation_cache = generation_cache
+        self._history_policy_name = history_policy
+        self._history_policy = get_history_policy(history_policy, history_turns)
+        self._patch_mode = patch_mode and template in PATCH_PROMPTS
+        self._hedge_modelId = hedge_modelId if hedge_modelId != modelId else None
+        self._hedge_delay = hedge_delay
+
+    def invoke_explain_model(self, image, image_type, data_placeholder):
+
+        system_prompt, messages = self._chain.get_explain_messages(image, image_type)
+
+        # print("###### Explain ######")
+        # print(messages)
+        # print("###### Explain ######")
+
+        # Identical diagrams (same pixels, model, prompts and parameters) replay
+        # the stored explanation instead of invoking the model again.
+        explain_cache = get_explain_cache()
+        image_bytes = image.getvalue()
+        prompts = (system_prompt, messages[0]["content"][0]["text"])
+
+        explain = explain_cache.get(
+            image_bytes, self._modelId, prompts, self._inference_params
+        )
+        if explain is not None:
+            data_placeholder.markdown(explain)
+        else:
+            explain = backoff_mechanism(
+                func=invoke_model,
+                deadline=deadline_in(MODEL_DEADLINE),
+                modelId=self._modelId,
+                inference_params=self._inference_params,
+                messages=messages,
+                system_prompt=system_prompt,
+                data_placeholder=data_placeholder,
+            )
+            if explain:
+                explain_cache.put(
+                    image_bytes, self._modelId, prompts, self._inference_params, explain
+                )
+
+        print(f"Explain cache: {explain_cache.stats()}")
+
+        if "explain" in st.session_state:
+            del st.session_state["explain"]
+        else:
+            st.session_state["explain"] = explain
+
+    def invoke_code_model(self, data_placeholder):
+
+        if "explain" not in st.session_state:
+            raise BaseException("explain not found")
+
+        initial_cfn_code = self.generate_code(
+            self._template, st.session_state["explain"], data_placeholder
+        )
+
+        if not self.check_memory():
+            self.store_memory(
+                self._template, initial_cfn_code, st.session_state["explain"]
+            )
+
+    def invoke_code_models(self, data_placeholders):
+        """
+        Generates several templates concurrently from the same explanation.
+
+        Every template streams into its own placeholder and gets its own
+        conversation memory. The latency of each template and the total are
+        kept in the session. A template whose model call fails does not stop
+        the others from being stored.
+
+        Args:
+            data_placeholders (dict): Placeholder of every template to generate.
+
+        Returns:
+            dict: The RetryError of every template that failed.
+        """
+
+        if "explain" not in st.session_state:
+            raise BaseException("explain not found")
+
+        explain = st.session_state["explain"]
+        script_run_ctx = get_script_run_ctx()
+
+        def generate(template):
+            # Placeholders can only be written from threads attached to the script run
+            add_script_run_ctx(threading.current_thread(), script_run_ctx)
+            start = time.perf_counter()
+            code = self.generate_code(template, explain, data_placeholders[template])
+            return code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=GENERATE_ALL_WORKERS) as executor:
+            futures = {
+                template: executor.submit(generate, template)
+                for template in data_placeholders
+            }
+
+        # Session state is only written from the script thread
+        latency, errors = dict(), dict()
+        for template, future in futures.items():
+            try:
+                code, latency[template] = future.result()
+            except RetryError as ex:
+                print(f"Generating {template} failed: {ex}")
+                errors[template] = ex
+                continue
+            self.store_memory(template, code, explain)
+        latency["Total"] = time.perf_counter() - start
+
+        st.session_state["format_latency"] = latency
+        print(f"Generate all latency {latency}")
+        return errors
+
+    def generate_code(self, template, explain, data_placeholder):
+        """
+        Generates the code of a template, reusing cached temperature 0 generations.
+        Does not access the session state, so it can run on worker threads.
+
+        Returns:
+            str: The generated code.
+        """
+        system_prompt, messages = self._chain.get_code_messages(
+            explain, template, self._fedramp, self._examples
+        )
+
+        # Temperature 0 generations are reused for identical requests unless
+        # the cache is bypassed from the sidebar.
+        generation_cache = get_generation_cache()
+        use_cache = self._generation_cache and generation_cache.is_cacheable(
+            self._inference_params
+        )
+
+        initial_cfn_code = None
+        if use_cache:
+            initial_cfn_code = generation_cache.get(
+                self._modelId, self._inference_params, system_prompt, messages
+            )
+
+        # Hedged requests race the same request on a second model
+        func = invoke_model
+        if self._hedge_modelId:
+            func = functools.partial(
+                invoke_hedged_model,
+                secondary_modelId=self._hedge_modelId,
+                hedge_delay=self._hedge_delay,
+            )
+
+        if initial_cfn_code is not None:
+            generation_cache.replay(initial_cfn_code, data_placeholder)
+        else:
+            response = backoff_mechanism(
+                func=func,
+                deadline=deadline_in(MODEL_DEADLINE),
+                modelId=self._modelId,
+                inference_params=self._inference_params,
+                messages=messages,
+                system_prompt=system_prompt,
+                data_placeholder=data_placeholder,
+            )
+            # The generation is cached under the model that produced it, which
+            # is the secondary model when it won the hedged race.
+            winner = self._modelId
+            if self._hedge_modelId:
+                initial_cfn_code, winner = response
+            else:
+                initial_cfn_code = response
+            if use_cache and initial_cfn_code:
+                generation_cache.put(
+                    winner,
+                    self._inference_params,
+                    system_prompt,
+                    messages,
+                    initial_cfn_code,
+                )
+
+        if use_cache:
+            print(f"Generation cache: {generation_cache.stats()}")
+
+        return initial_cfn_code
+
+    def store_memory(self, template, initial_cfn_code, explain):
+        """
+        Starts the conversation memory of a template with its generated code.
+        """
+        memory = self._memory(template)
+        memory["system_prompt"], memory["messages"] = self._chain.get_update_messages(
+            initial_cfn_code, explain, template, self._fedramp, self._examples
+        )
+
+    def invoke_update_model(self, update_instructions, data_placeholder):
+
+        memory = self._memory()
+        usage = dict()
+        mode = "full"
+        cfn_code = None
+
+        # Patch mode asks only for the edits, falling back to a full regeneration
+        if self._patch_mode:
+            mode = "patch"
+            cfn_code = self.invoke_patch_model(
+                update_instructions, data_placeholder, usage
+            )
+
+        if cfn_code is None:
+            if self._patch_mode:
+                mode = "patch+full"
+
+            # The request is assembled from the memory's message dicts, which are
+            # shared and never mutated, so the memory does not need to be copied.
+            messages = self._history_policy.build(
+                memory["messages"],
+                update_instructions
+                + "\n\n"
+                + "Do not return examples or explaination, only return the generated CloudFormation YAML template encapsulated between triple backticks (``` ```). Skip the preamble. Think step-by-step.",
+            )
+
+            full_usage = dict()
+            cfn_code = backoff_mechanism(
+                func=invoke_model,
+                deadline=deadline_in(MODEL_DEADLINE),
+                modelId=self._modelId,
+                inference_params=self._inference_params,
+                messages=messages,
+                system_prompt=memory["system_prompt"],
+                data_placeholder=data_placeholder,
+                usage=full_usage,
+                priority=UPDATE,
+            )
+            for key, value in full_usage.items():
+                if isinstance(value, int):
+                    usage[key] = usage.get(key, 0) + value
+
+        memory["messages"].append(
+            {"role": "user", "content": [{"text": update_instructions}]}
+        )
+        memory["messages"].append(
+            {"role": "assistant", "content": [{"text": cfn_code}]}
+        )
+
+        self.record_turn_usage(mode, usage)
+
+    def invoke_patch_model(self, update_instructions, data_placeholder, usage):
+        """
+        Asks the model for edit operations on the latest template and applies them.
+
+        Returns:
+            str: The updated template in a code block, None if the patch could not be applied.
+        """
+        memory = self._memory()
+        latest = memory["messages"][-1]["content"][0]["text"]
+        if not latest:
+            return None
+
+        messages = self._history_policy.build(
+            memory["messages"],
+            update_instructions + "\n\n" + PATCH_PROMPTS[self._template],
+        )
+
+        patch = backoff_mechanism(
+            func=invoke_model,
+            deadline=deadline_in(MODEL_DEADLINE),
+            modelId=self._modelId,
+            inference_params=self._inference_params,
+            messages=messages,
+            system_prompt=memory["system_prompt"],
+            data_placeholder=data_placeholder,
+            usage=usage,
+            priority=UPDATE,
+        )
+        if not patch:
+            return None
+
+        try:
+            patched = apply_patch(extract_code(latest), patch, self._template)
+        except PatchError as ex:
+            print(f"Patch not applied, regenerating the full template: {ex}")
+            return None
+
+        cfn_code = f"```{CODE_LANGUAGES[self._template]}\n{patched}```"
+        data_placeholder.markdown(cfn_code)
+        return cfn_code
+
+    def record_turn_usage(self, mode, usage):
+        """
+        Keeps the input token counts of each update turn in the session.
+        """
+        if "turn_usage" not in st.session_state:
+            st.session_state["turn_usage"] = list()
+
+        turn = {
+            "turn": len(st.session_state["turn_usage"]) + 1,
+            "template": self._template,
+            "policy": self._history_policy_name,
+            "mode": mode,
+            "inputTokens": usage.get("inputTokens", 0),
+            "cacheReadInputTokens": usage.get("cacheReadInputTokens", 0),
+            "cacheWriteInputTokens": usage.get("cacheWriteInputTokens", 0),
+            "outputTokens": usage.get("outputTokens", 0),
+        }
+        st.session_state["turn_usage"].append(turn)
+        print(f"Update turn usage {turn}")
+
+    def get_turn_usage(self):
+        return st.session_state.get("turn_usage", [])
+
+    def get_scheduler_stats(self):
+        return get_scheduler().stats()
+
+    def get_hedge_stats(self):
+        return hedge_stats.stats()
+
+    def get_format_latency(self):
+        return st.session_state.get("format_latency", {})
+
+    def _memory(self, template=None):
+        """
+        Returns the conversation memory of a template (the selected one by default).
+        It holds "system_prompt" and "messages" once the template was generated.
+        """
+        if "memory" not in st.session_state:
+            st.session_state["memory"] = dict()
+        return st.session_state["memory"].setdefault(template or self._template, dict())
+
+    def clear_memory(self):
+        for key in ("memory", "turn_usage", "format_latency"):
+            if key in st.session_state:
+                del st.session_state[key]
+
+    def check_memory(self, template=None):
+        if "messages" in self._memory(template):
+            return True
+        else:
+            return False
+
+    def return_memory(self, template=None):
+        return self._memory(template)["messages"][1:]
+
+    def get_explain(self):
+        if "explain" in st.session_state:
+            return st.session_state["explain"]
+
+        return False
+
+    def clear_explain(self):
+        if self.get_explain():
+            del st.session_state["explain"]
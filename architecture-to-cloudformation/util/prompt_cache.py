@@ -0,0 +1,99 @@
+import threading
+
+# Model ids (without cross-region prefix) that accept converse cachePoint blocks.
+PROMPT_CACHE_MODELS = (
+    "anthropic.claude-3-5-haiku-20241022-v1:0",
+    "anthropic.claude-3-7-sonnet-20250219-v1:0",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "amazon.nova-micro-v1:0",
+    "amazon.nova-lite-v1:0",
+    "amazon.nova-pro-v1:0",
+)
+
+# Marks the end of a cacheable prefix. Message builders place it after the
+# content that is identical between calls (system prompt, examples, explain).
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def supports_prompt_cache(modelId):
+    """
+    Returns True if the model accepts cachePoint blocks.
+
+    Args:
+        modelId (str): The model id or cross-region inference profile id.
+    """
+    base_model_id = modelId.split(".", 1)[1] if modelId.count(".") > 1 else modelId
+    return base_model_id.startswith(PROMPT_CACHE_MODELS)
+
+
+def get_system_blocks(modelId, system_prompt):
+    """
+    Returns the converse system blocks, with a cachePoint after the system prompt if supported.
+    """
+    system = [{"text": system_prompt}]
+    if supports_prompt_cache(modelId):
+        system.append(CACHE_POINT)
+    return system
+
+
+def prepare_messages(modelId, messages):
+    """
+    Removes cachePoint blocks from the messages if the model does not support them.
+    The given messages are not modified.
+    """
+    if supports_prompt_cache(modelId):
+        return messages
+
+    return [
+        {
+            **message,
+            "content": [
+                block for block in message["content"] if "cachePoint" not in block
+            ],
+        }
+        for message in messages
+    ]
+
+
+class CacheUsage:
+    """
+    Process-wide totals of the prompt cache token counts reported by Amazon Bedrock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {
+            "requests": 0,
+            "inputTokens": 0,
+            "cacheReadInputTokens": 0,
+            "cacheWriteInputTokens": 0,
+        }
+
+    def record(self, modelId, usage):
+        """
+        Adds the usage metadata of one response to the totals and logs it.
+
+        Args:
+            modelId (str): The invoked model id.
+            usage (dict): The usage of the converse stream metadata event.
+        """
+        with self._lock:
+            self._totals["requests"] += 1
+            for key in ("inputTokens", "cacheReadInputTokens", "cacheWriteInputTokens"):
+                self._totals[key] += usage.get(key, 0)
+
+        print(
+            f"Prompt cache {modelId}: read={usage.get('cacheReadInputTokens', 0)} "
+            f"write={usage.get('cacheWriteInputTokens', 0)} "
+            f"input={usage.get('inputTokens', 0)} totals={self.stats()}"
+        )
+
+    def stats(self):
+        """
+        Returns the token totals since the server started.
+        """
+        return dict(self._totals)
+
+
+cache_usage = CacheUsage()
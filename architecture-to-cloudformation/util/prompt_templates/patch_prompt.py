@@ -0,0 +1,21 @@
+PATCH_PROMPT = """
+Do not return the full CloudFormation YAML template. Return only the edits needed to apply the update instruction to the latest CloudFormation YAML template, as a JSON array encapsulated between triple backticks (```json ```). Skip the preamble.
+
+Each edit is an object with:
+- "op": "replace" to replace an existing key, "add" to add a new key or "remove" to delete a key.
+- "path": the "/"-separated path of mapping keys, for example "Resources/WebBucket" or "Resources/WebBucket/Properties/VersioningConfiguration".
+- "content": for "replace" and "add", the complete YAML of the key including the key line, for example "VersioningConfiguration:\\n  Status: Enabled".
+
+Prefer the most specific path. Edits are applied in order.
+"""
+
+PATCH_PROMPT_TERRAFORM = """
+Do not return the full Terraform code. Return only the edits needed to apply the update instruction to the latest Terraform code, as a JSON array encapsulated between triple backticks (```json ```). Skip the preamble.
+
+Each edit is an object with:
+- "op": "replace" to replace an existing block, "add" to add a new block or "remove" to delete a block.
+- "path": the block type followed by its labels separated by "/", for example "resource/aws_s3_bucket/web", "variable/region" or "locals".
+- "content": for "replace" and "add", the complete Terraform code of the block.
+
+Only top-level blocks can be edited. Edits are applied in order.
+"""
@@ -0,0 +1,120 @@
+import os
+import time
+
+# Minimum number of seconds between two renders of a streamed response.
+FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL", "0.15"))
+
+# Number of buffered bytes that forces a render before the interval elapsed.
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "4096"))
+
+
+class StreamRenderer:
+    """
+    Rate-limited renderer for streamed model output.
+
+    Deltas are buffered in a list and the placeholder is only re-rendered once
+    FLUSH_INTERVAL seconds have passed or FLUSH_BYTES bytes are pending, instead
+    of once per delta. close() performs the final render.
+
+    Usage:
+
+    renderer = StreamRenderer(data_placeholder)
+
+    for delta in stream:
+        renderer.write(delta)
+
+    result = renderer.close()
+
+    # Number of deltas, renders and bytes pushed to the browser.
+    renderer.stats()
+    """
+
+    def __init__(
+        self,
+        placeholder,
+        render=None,
+        flush_interval=FLUSH_INTERVAL,
+        flush_bytes=FLUSH_BYTES,
+    ):
+        """
+        Args:
+            placeholder (instanceof st.empty): Placeholder to stream the output.
+            render (function): Called with the full text on every flush. Defaults to placeholder.markdown.
+            flush_interval (float): Minimum number of seconds between two flushes.
+            flush_bytes (int): Number of pending bytes that forces a flush.
+        """
+        self._placeholder = placeholder
+        self._render = render
+        self._flush_interval = flush_interval
+        self._flush_bytes = flush_bytes
+
+        self._text = str()
+        self._pending = list()
+        self._pending_bytes = 0
+        # The first delta is rendered right away.
+        self._last_flush = float("-inf")
+
+        self._deltas = 0
+        self._flushes = 0
+        self._bytes_sent = 0
+
+    @property
+    def text(self):
+        """
+        Returns everything written so far, including deltas not yet rendered.
+        """
+        if self._pending:
+            self._text += "".join(self._pending)
+            self._pending = list()
+        return self._text
+
+    def write(self, delta):
+        """
+        Buffers a delta and renders if the flush interval or size was reached.
+        """
+        self._pending.append(delta)
+        self._pending_bytes += len(delta)
+        self._deltas += 1
+
+        if (
+            self._pending_bytes >= self._flush_bytes
+            or time.monotonic() - self._last_flush >= self._flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Renders the full text if any delta is pending.
+        """
+        if not self._pending_bytes:
+            return
+
+        text = self.text
+        self._pending_bytes = 0
+        self._last_flush = time.monotonic()
+
+        if self._placeholder is not None:
+            if self._render:
+                self._render(text)
+            else:
+                self._placeholder.markdown(text)
+
+        self._flushes += 1
+        self._bytes_sent += len(text)
+
+    def close(self):
+        """
+        Renders the remaining deltas and returns the full text.
+        """
+        self.flush()
+        return self.text
+
+    def stats(self):
+        """
+        Returns the number of deltas received, flushes rendered and bytes sent.
+        """
+        return {
+            "deltas": self._deltas,
+            "flushes": self._flushes,
+            "bytes_sent": self._bytes_sent,
+        }